@@ -0,0 +1,221 @@
+import os
+import re
+import glob
+import time
+import pickle
+import hashlib
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional
+from data_cache import CACHE_DIR, file_content_hash
+from partition_store import store_versions
+
+# ==================================== 1. 設定 ====================================
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "256"))
+# memory：只存在目前程序；disk：存於 .cache/answers，重啟後仍可命中
+ANSWER_CACHE_BACKEND = os.environ.get("ANSWER_CACHE_BACKEND", "disk")
+# 快取格式或回答語意改變（如工具輸出格式調整）時調整此版本，舊答案便不會再命中
+ANSWER_CACHE_VERSION = 1
+
+# 資料指紋涵蓋的檔案
+DATA_FILE_PATTERNS = ("*.xlsx", "*.xls")
+
+
+def normalize_question(question: str) -> str:
+    """問題正規化：全半形統一、英文小寫、壓縮空白、去掉結尾標點"""
+    text = unicodedata.normalize("NFKC", str(question)).lower()
+    text = " ".join(text.split())
+    return re.sub(r"[\s?？!！。.,，]+$", "", text)
+
+
+def data_fingerprint(patterns: Iterable[str] = DATA_FILE_PATTERNS) -> Dict[str, str]:
+    """目前目錄下所有資料檔的 {檔名: 內容雜湊}（mtime/大小未變時不重算雜湊），加上分區資料集的版本"""
+    files = sorted({f for pattern in patterns for f in glob.glob(pattern)})
+    fingerprint = {f: file_content_hash(f) for f in files}
+    # 每日增量匯入的分區資料集不是目錄下的檔案，以版本號代表其內容
+    fingerprint.update({name: str(version) for name, version in store_versions().items()})
+    return fingerprint
+
+
+def agent_version(models: Iterable[str], prompt: str, tools: Iterable[Any]) -> str:
+    """
+    Agent 設定的版本：ANSWER_CACHE_VERSION + 模型名稱 + system prompt + 工具（名稱、說明、參數）的雜湊。
+    換模型、改 prompt 或增減工具後 key 不同，不會回傳以舊設定產生的答案。
+    """
+    parts = [str(ANSWER_CACHE_VERSION), *models, prompt]
+    for tool in tools:
+        parts.append(f"{tool.name}:{tool.description}:{sorted(tool.args)}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+# ==================================== 2. 儲存後端 ====================================
+class MemoryBackend:
+    """存於目前程序記憶體的後端"""
+
+    def __init__(self):
+        self._entries: Dict[str, Dict] = {}
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self._entries.get(key)
+
+    def set(self, key: str, entry: Dict) -> None:
+        self._entries[key] = entry
+
+    def touch(self, key: str, when: float) -> None:
+        # 回傳的就是存放中的 dict，AnswerCache 更新 last_access 時已一併更新
+        pass
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def keys(self) -> List[str]:
+        return list(self._entries)
+
+
+class DiskBackend:
+    """每筆答案一個 pickle 檔的後端，可跨程序、跨重啟共用；最後存取時間記錄在檔案的 mtime"""
+
+    def __init__(self, directory: str = os.path.join(CACHE_DIR, "answers")):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key: str) -> Optional[Dict]:
+        try:
+            path = self._path(key)
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            # 命中時只更新 mtime 不重寫 pickle，重啟後以 mtime 還原 LRU 順序
+            entry["last_access"] = max(entry["last_access"], os.path.getmtime(path))
+            return entry
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, KeyError, TypeError):
+            return None
+
+    def set(self, key: str, entry: Dict) -> None:
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            # 回應中含無法序列化的物件時，不快取這一筆
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def touch(self, key: str, when: float) -> None:
+        try:
+            os.utime(self._path(key), (when, when))
+        except OSError:
+            pass
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def keys(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [name[:-4] for name in os.listdir(self.directory) if name.endswith(".pkl")]
+
+
+# ==================================== 3. 答案快取 ====================================
+class AnswerCache:
+    """
+    query_agent 的答案快取：key 為「Agent 版本 + 正規化問題 + 資料檔指紋」，具 TTL 與 LRU 淘汰。
+    資料檔內容改變後指紋不同，舊答案不會再命中；上傳檔案時可用 invalidate_file 立即清除相關項目。
+    """
+
+    def __init__(self, backend=None, ttl_seconds: int = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key → {"last_access": ..., "files": [...]}，用於 LRU 與依檔案失效
+        self._meta: Optional[Dict[str, Dict]] = None
+
+    def _load_meta(self) -> Dict[str, Dict]:
+        if self._meta is None:
+            self._meta = {}
+            for key in self.backend.keys():
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self._meta[key] = {"last_access": entry["last_access"], "files": list(entry["fingerprint"])}
+        return self._meta
+
+    @staticmethod
+    def make_key(question: str, fingerprint: Dict[str, str], version: str = str(ANSWER_CACHE_VERSION)) -> str:
+        """version 為 agent_version() 的結果；未指定時只區分 ANSWER_CACHE_VERSION"""
+        payload = version + "\n" + normalize_question(question) + "\n"
+        payload += "\n".join(f"{name}={digest}" for name, digest in sorted(fingerprint.items()))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, question: str, fingerprint: Optional[Dict[str, str]] = None,
+            version: str = str(ANSWER_CACHE_VERSION)) -> Optional[Dict[str, Any]]:
+        fingerprint = data_fingerprint() if fingerprint is None else fingerprint
+        key = self.make_key(question, fingerprint, version)
+        with self._lock:
+            meta = self._load_meta()
+            if key not in meta:
+                return None
+            entry = self.backend.get(key)
+            now = time.time()
+            if entry is None or now - entry["created"] > self.ttl_seconds:
+                self.backend.delete(key)
+                meta.pop(key, None)
+                return None
+            entry["last_access"] = now
+            meta[key]["last_access"] = now
+            self.backend.touch(key, now)
+            return entry["response"]
+
+    def set(self, question: str, response: Dict[str, Any], fingerprint: Optional[Dict[str, str]] = None,
+            version: str = str(ANSWER_CACHE_VERSION)) -> None:
+        fingerprint = data_fingerprint() if fingerprint is None else fingerprint
+        key = self.make_key(question, fingerprint, version)
+        now = time.time()
+        entry = {
+            "question": normalize_question(question),
+            "fingerprint": fingerprint,
+            "created": now,
+            "last_access": now,
+            "response": response,
+        }
+        with self._lock:
+            meta = self._load_meta()
+            self.backend.set(key, entry)
+            meta[key] = {"last_access": now, "files": list(fingerprint)}
+            # LRU：超過上限時淘汰最久未使用者
+            while len(meta) > self.max_entries:
+                oldest = min(meta, key=lambda k: meta[k]["last_access"])
+                self.backend.delete(oldest)
+                meta.pop(oldest)
+
+    def invalidate_file(self, filename: str) -> int:
+        """清除所有依賴此資料檔的答案，回傳清除筆數"""
+        name = os.path.basename(filename)
+        with self._lock:
+            meta = self._load_meta()
+            stale = [key for key, item in meta.items() if name in {os.path.basename(f) for f in item["files"]}]
+            for key in stale:
+                self.backend.delete(key)
+                meta.pop(key)
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._load_meta()):
+                self.backend.delete(key)
+            self._meta = {}
+
+
+def _default_backend():
+    return DiskBackend() if ANSWER_CACHE_BACKEND == "disk" else MemoryBackend()
+
+
+# 全程序共用一份答案快取
+answer_cache = AnswerCache(_default_backend())
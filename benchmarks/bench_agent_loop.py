@@ -0,0 +1,159 @@
+"""
+Agent 迴圈的非 LLM 開銷：以 LLM_BACKEND=fake 的腳本化模型（fake_llm.py）執行完整的 solution_combine.query_agent，
+模型回應預先決定並以固定的模擬延遲取代 API 往返，工具實際執行，量測每個問題扣除模型時間後的開銷
+（工具執行、prompt 組裝、序列化、callback 等）。不需網路與 API 金鑰，可放在 CI 追蹤。
+
+每個模擬延遲以全新的子程序執行：
+- cold：第一次查詢（含建立 Agent、讀取 Excel 快取、啟動 Pandas 工作程序）
+- hot ：同一程序內重複查詢的中位數（答案快取關閉）
+overhead = 總時間 − 模擬的模型延遲總和。
+
+執行方式（於專案根目錄）：
+    python benchmarks/bench_agent_loop.py [--latency-ms 0 300] [--scale 1] [--script 腳本.json] [--json 結果.json] [--baseline 前次結果.json]
+未指定 --scale 時使用專案目錄中的實際檔案；指定 --baseline 時 overhead 變慢超過 --threshold（預設 20%）即標示 ⚠️；有退步或執行失敗時以結束碼 1 結束。
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+QUESTION = "請列出販賣台數前五名的車名"
+
+
+# ==================================== 1. 子程序：同一程序內重複查詢 ====================================
+def _timed_query(question: str) -> Dict[str, Any]:
+    from fake_llm import fake_llm_usage
+    from solution_combine import query_agent
+
+    fake_llm_usage.reset()
+    start = time.perf_counter()
+    # Agent 的 verbose 輸出不列入結果
+    with redirect_stdout(io.StringIO()):
+        response = query_agent(question, use_cache=False)
+    total = time.perf_counter() - start
+    return {
+        "total_ms": total * 1000,
+        "llm_ms": fake_llm_usage.latency_seconds * 1000,
+        "overhead_ms": (total - fake_llm_usage.latency_seconds) * 1000,
+        "llm_calls": fake_llm_usage.calls,
+        "steps": [action.tool for action, _ in response.get("intermediate_steps", [])],
+    }
+
+
+def run_worker(question: str, repeat: int) -> Dict[str, Any]:
+    cold = _timed_query(question)
+    hot = [_timed_query(question) for _ in range(repeat)]
+    median = lambda name: statistics.median(run[name] for run in hot) if hot else None  # noqa: E731
+    return {
+        "cold_ms": cold["total_ms"],
+        "cold_overhead_ms": cold["overhead_ms"],
+        "hot_ms": median("total_ms"),
+        "hot_overhead_ms": median("overhead_ms"),
+        "llm_calls": cold["llm_calls"],
+        "steps": cold["steps"],
+    }
+
+
+# ==================================== 2. 主程序：模擬延遲 × 查詢 ====================================
+def measure(latency_ms: float, repeat: int, directory: str, script: Optional[str]) -> Dict[str, Any]:
+    env = {
+        **os.environ,
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY_MS": str(latency_ms),
+        "LLM_CACHE_MODE": "off",
+        "ANSWER_CACHE_BACKEND": "memory",
+        "PYTHONPATH": ROOT,
+    }
+    if directory != ROOT:
+        env["PARTITION_DIR"] = os.path.join(directory, ".cache", "partitions")
+    if script:
+        env["FAKE_LLM_SCRIPT"] = os.path.abspath(script)
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", str(repeat)],
+        cwd=directory, env=env, capture_output=True, text=True,
+    )
+    result = {"latency_ms": latency_ms}
+    if completed.returncode != 0:
+        stderr = completed.stderr.strip()
+        result["error"] = stderr.splitlines()[-1] if stderr else f"exit {completed.returncode}"
+        return result
+    result.update(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return result
+
+
+def _format(value: Optional[float], width: int = 12) -> str:
+    return f"{value:>{width},.1f}" if isinstance(value, (int, float)) else f"{'-':>{width}}"
+
+
+def report(results: List[Dict[str, Any]], baseline: Optional[Dict] = None, threshold: float = 0.2) -> bool:
+    """列出結果；與 baseline 相比 overhead 變慢超過 threshold 時標示 ⚠️，回傳是否有退步"""
+    previous = {r["latency_ms"]: r for r in (baseline or {}).get("results", [])}
+    regressed = False
+    print(f"{'模擬延遲':<8}{'cold ms':>12}{'cold 開銷':>12}{'hot ms':>12}{'hot 開銷':>12}{'模型呼叫':>8}  工具")
+    for result in results:
+        line = (
+            f"{_format(result['latency_ms'], 6)} ms{_format(result.get('cold_ms'))}{_format(result.get('cold_overhead_ms'))}"
+            f"{_format(result.get('hot_ms'))}{_format(result.get('hot_overhead_ms'))}{result.get('llm_calls', '-'):>10}  "
+            + " → ".join(result.get("steps", []))
+        )
+        old = previous.get(result["latency_ms"])
+        if old:
+            slower = [
+                f"{name} {old[name]:,.1f}→{result[name]:,.1f}"
+                for name in ("cold_overhead_ms", "hot_overhead_ms")
+                if result.get(name) and old.get(name) and result[name] > old[name] * (1 + threshold)
+            ]
+            if slower:
+                regressed = True
+                line += "  ⚠️ " + "、".join(slower)
+        if "error" in result:
+            regressed = True
+            line += f"  ❌ {result['error']}"
+        print(line)
+    return regressed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        print(json.dumps(run_worker(QUESTION, int(sys.argv[2])), ensure_ascii=False))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="以腳本化模型量測 query_agent 每個問題的非 LLM 開銷")
+    parser.add_argument("--latency-ms", nargs="+", type=float, default=[0, 300], help="每次模型呼叫的模擬延遲")
+    parser.add_argument("--repeat", type=int, default=5, help="hot 重複次數")
+    parser.add_argument("--scale", type=int, help="改用 synthetic_data.py 產生的 scale 倍合成資料")
+    parser.add_argument("--script", help="自訂的模型腳本（JSON，格式見 fake_llm.DEFAULT_SCRIPTS）")
+    parser.add_argument("--json", help="將結果寫入 JSON，供之後以 --baseline 比較")
+    parser.add_argument("--baseline", help="前次 --json 的結果檔")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    directory = ROOT
+    if args.scale:
+        from synthetic_data import ensure_dataset
+        directory = ensure_dataset(args.scale)["directory"]
+
+    results = []
+    for latency_ms in args.latency_ms:
+        results.append(measure(latency_ms, args.repeat, directory, args.script))
+        print(f"  完成 模擬延遲 {latency_ms:g} ms", file=sys.stderr)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressed = report(results, baseline, args.threshold)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"created_at": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}, f, ensure_ascii=False, indent=1)
+    sys.exit(1 if regressed else 0)
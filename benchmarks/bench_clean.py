@@ -0,0 +1,50 @@
+"""
+字串清理效能比較：舊版逐列 apply/strip vs. data_cache.clean_dataframe（不重複值清理後映射回原欄位）。
+
+執行方式（於專案根目錄）：
+    python benchmarks/bench_clean.py [檔名] [重複次數]
+"""
+import os
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_cache import clean_dataframe
+
+
+def legacy_clean(df: pd.DataFrame) -> pd.DataFrame:
+    """原本 read_excel_file / load_excel_file 內的清理步驟"""
+    df = df.apply(lambda col: col.str.strip() if col.dtype == "object" else col)
+    if "日期" in df.columns:
+        df["日期"] = pd.to_datetime(df["日期"], errors="coerce")
+    if "實績種類" in df.columns:
+        df["實績種類"] = df["實績種類"].astype(str).str.strip()
+    return df
+
+
+def best_of(func, df: pd.DataFrame, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    filename = sys.argv[1] if len(sys.argv) > 1 else "MBIS實績_2025上半年.xlsx"
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    raw = pd.read_excel(filename)
+    legacy = best_of(legacy_clean, raw, repeat)
+    vectorized = best_of(clean_dataframe, raw, repeat)
+
+    print(f"檔案：{filename}（{len(raw):,} 列 × {raw.shape[1]} 欄，取 {repeat} 次最佳值）")
+    print(f"舊版 apply/strip：{legacy * 1000:8.1f} ms")
+    print(f"不重複值清理    ：{vectorized * 1000:8.1f} ms")
+    print(f"加速倍數        ：{legacy / vectorized:8.1f}x")
+
+    if "實績種類" in raw.columns:
+        print("實績種類（舊版）：", legacy_clean(raw)["實績種類"].value_counts().to_dict())
+        print("實績種類（新版）：", clean_dataframe(raw)["實績種類"].value_counts().to_dict())
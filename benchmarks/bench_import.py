@@ -0,0 +1,42 @@
+"""
+冷啟動 import 時間：每次以全新的 Python 子程序 import 模組，量測到可以使用為止的時間（取中位數）。
+solution_combine / streamlit_app 在 import 時不再建立 LLM client 與 Agent，Agent 於第一次查詢（或 Streamlit 背景預熱）時才建立。
+
+執行方式（於專案根目錄）：
+    python benchmarks/bench_import.py [重複次數] [模組 ...]
+"""
+import os
+import sys
+import time
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed_subprocess(setup: str, statement: str) -> float:
+    """在新的子程序中執行 setup 後量測 statement 的秒數（不含直譯器本身的啟動時間）"""
+    code = f"import time; {setup}; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+    env = {**os.environ, "LLM_CACHE_MODE": "off"}
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def median_ms(setup: str, statement: str, repeat: int) -> float:
+    return statistics.median(timed_subprocess(setup, statement) for _ in range(repeat)) * 1000
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    modules = sys.argv[2:] or ["solution_combine", "streamlit_app"]
+
+    print(f"冷啟動 import 時間（每次新的子程序，取 {repeat} 次中位數）")
+    for module in modules:
+        print(f"{module:<18}：{median_ms('pass', f'import {module}', repeat):8.1f} ms")
+    # import 之後第一次建立主 Agent 的時間（延後到第一次查詢的部分）
+    build = median_ms("import solution_combine", "solution_combine.get_agent_executor()", repeat)
+    print(f"建立主 Agent      ：{build:8.1f} ms（第一次查詢時）")
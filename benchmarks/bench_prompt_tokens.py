@@ -0,0 +1,53 @@
+"""
+系統訊息 token 量比較：內嵌完整映射表 vs. 改用 resolve_dealer_name 工具。
+
+每個問題的 Agent 迴圈每一步都會重送系統訊息，因此節省量 = 每次呼叫節省的 token × LLM 呼叫次數。
+
+執行方式（於專案根目錄）：
+    python benchmarks/bench_prompt_tokens.py [每題 LLM 呼叫次數]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+
+def count_tokens(text: str) -> int:
+    """優先使用 tiktoken；無法取得編碼檔（離線）時以中日韓字元 1 token、其他字元 4 字 1 token 估算"""
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("o200k_base").encode(text))
+    except Exception:
+        cjk = len(re.findall(r"[一-鿿　-〿＀-￯]", text))
+        return int(cjk + (len(text) - cjk) / 4)
+
+
+if __name__ == "__main__":
+    calls_per_question = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    import solution3
+    import solution_combine
+    from dealer_mapping import dealer_mapping
+
+    start = time.perf_counter()
+    mapping_text = solution3.generate_mapping_text("Mapping Dataframe.xlsx")
+    render_ms = (time.perf_counter() - start) * 1000
+
+    dealer_mapping.resolve_name("國都新莊")  # 建立索引
+    start = time.perf_counter()
+    for _ in range(1000):
+        dealer_mapping.resolve_name("國都新莊")
+    resolve_us = (time.perf_counter() - start) * 1000
+
+    mapping_tokens = count_tokens(mapping_text)
+    print(f"映射表：{len(mapping_text):,} 字元，約 {mapping_tokens:,} tokens；產生一次 {render_ms:.1f} ms")
+    print(f"resolve_dealer_name 單次查詢：{resolve_us:.1f} µs")
+    for name, module in (("solution_combine", solution_combine), ("solution3", solution3)):
+        current = count_tokens(module.system_message)
+        print(
+            f"{name:17s} 系統訊息：{current + mapping_tokens:,} → {current:,} tokens / 次，"
+            f"每題（{calls_per_question} 次呼叫）節省約 {mapping_tokens * calls_per_question:,} tokens"
+        )
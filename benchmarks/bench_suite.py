@@ -0,0 +1,220 @@
+"""
+工具效能基準：以 synthetic_data.py 產生的 1×／10×／100× 合成資料，量測各工具的執行時間與峰值記憶體。
+
+每個 資料量 × 工具 以全新的子程序執行（工作目錄為合成資料目錄，Excel 快取也在其中）：
+- cold：清除 .cache/excel 後第一次呼叫（解析 Excel）
+- warm：保留磁碟快取、新的子程序第一次呼叫
+- hot ：同一程序內重複呼叫的中位數
+- peak：cold 呼叫期間 tracemalloc 追蹤到的 Python 配置峰值，以及程序 RSS 峰值的增加量
+
+執行方式（於專案根目錄）：
+    python benchmarks/bench_suite.py [--scales 1 10 100] [--cases ...] [--json 結果.json] [--baseline 前次結果.json]
+100× 的實績約 1,150 萬列，產生與 cold 解析都需要數十分鐘，預設只跑 1× 與 10×。
+指定 --baseline 時，與前次結果相比變慢超過 --threshold（預設 20%）的項目標示 ⚠️。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import statistics
+import subprocess
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_data import ACTUAL_FILE, MAPPING_FILE, TARGET_FILE, ensure_dataset
+
+CASES = [
+    "read_excel_file",
+    "load_excel_file",
+    "classify_file_type",
+    "compare_target_vs_actual",
+    "generate_mapping_text",
+    "get_dealer_mapping",
+]
+# 多工作表的實績（超過 Excel 列數上限）合併後登記的資料集名稱
+ACTUALS_KEY = "synthetic::actuals"
+
+
+# ==================================== 1. 子程序：單一工具 ====================================
+def _first_sheet(filename: str) -> str:
+    from data_cache import list_sheet_names
+
+    return f"{filename}::{list_sheet_names(filename)[0]}"
+
+
+def _prepare_actuals() -> str:
+    """載入實績與目標；實績分成多個工作表時合併為一個資料集，回傳 actual_key"""
+    import pandas as pd
+    from data_context import get_data_context
+    from solution3 import load_excel_file
+
+    load_excel_file.invoke({"filename": TARGET_FILE})
+    result = load_excel_file.invoke({"filename": ACTUAL_FILE})
+    keys = list(result["preview"])
+    if len(keys) == 1:
+        return keys[0]
+    frames = get_data_context().frames
+    frames[ACTUALS_KEY] = pd.concat([frames[key] for key in keys], ignore_index=True)
+    return ACTUALS_KEY
+
+
+def build_case(case: str) -> Callable[[], Any]:
+    """建立工具呼叫（匯入模組與準備資料不計入時間）"""
+    if case == "read_excel_file":
+        from solution1 import read_excel_file
+        return lambda: read_excel_file.invoke({"filename": ACTUAL_FILE})
+    if case == "load_excel_file":
+        from solution3 import load_excel_file
+        return lambda: load_excel_file.invoke({"filename": ACTUAL_FILE})
+    if case == "classify_file_type":
+        from solution3 import classify_file_type
+        return lambda: [classify_file_type.invoke({"filename": name}) for name in (ACTUAL_FILE, TARGET_FILE, MAPPING_FILE)]
+    if case == "compare_target_vs_actual":
+        from solution3 import compare_target_vs_actual
+        arguments = {"target_key": _first_sheet(TARGET_FILE), "actual_key": _prepare_actuals()}
+        return lambda: compare_target_vs_actual.invoke(arguments)
+    if case == "generate_mapping_text":
+        from solution3 import generate_mapping_text
+        return lambda: generate_mapping_text(MAPPING_FILE)
+    if case == "get_dealer_mapping":
+        from solution_combine import get_dealer_mapping
+        # 第一次呼叫建立索引（映射表為工作目錄中的合成檔）；查詢映射表中每一個 經銷商+營業所 組合代碼
+        codes = [f"{dealer}{site:02d}" for dealer, site in _mapping_pairs()]
+        return lambda: [get_dealer_mapping.invoke({"query_code": code}) for code in codes]
+    raise ValueError(f"未知的工具 {case}，可用：{CASES}")
+
+
+def _mapping_pairs() -> List:
+    from data_cache import load_sheet
+
+    mapping = load_sheet(MAPPING_FILE)
+    return list(zip(mapping["經銷商代碼"].astype(str), mapping["營業所代碼"].astype(int)))
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _peak_rss_bytes() -> int:
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_case(case: str, phase: str, repeat: int) -> Dict[str, Any]:
+    """在目前目錄（合成資料目錄）執行一個工具；phase 為 cold / warm / trace"""
+    if phase in ("cold", "trace"):
+        shutil.rmtree(os.path.join(".cache", "excel"), ignore_errors=True)
+    call = build_case(case)
+
+    if phase == "trace":
+        import tracemalloc
+
+        baseline = _rss_bytes()
+        tracemalloc.start()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"traced_peak_mb": peak / 1024 ** 2, "rss_peak_delta_mb": max(0, _peak_rss_bytes() - baseline) / 1024 ** 2}
+
+    start = time.perf_counter()
+    call()
+    result = {"first_ms": (time.perf_counter() - start) * 1000}
+    if phase == "cold":
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - start)
+        # 同一程序內的重複呼叫：工作表由共用解析結果（記憶體）取得
+        result["hot_ms"] = statistics.median(timings) * 1000 if timings else None
+    return result
+
+
+# ==================================== 2. 主程序：資料量 × 工具 ====================================
+def _subprocess(directory: str, case: str, phase: str, repeat: int) -> Dict[str, Any]:
+    env = {**os.environ, "LLM_CACHE_MODE": "off", "PYTHONPATH": ROOT, "PARTITION_DIR": os.path.join(directory, ".cache", "partitions")}
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", case, phase, str(repeat)],
+        cwd=directory, env=env, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def measure(scale: int, case: str, repeat: int, trace: bool) -> Dict[str, Any]:
+    directory = ensure_dataset(scale)["directory"]
+    cold = _subprocess(directory, case, "cold", repeat)
+    warm = _subprocess(directory, case, "warm", 0)
+    result = {"scale": scale, "case": case, "cold_ms": cold.get("first_ms"), "warm_ms": warm.get("first_ms"), "hot_ms": cold.get("hot_ms")}
+    if trace:
+        result.update({key: value for key, value in _subprocess(directory, case, "trace", 0).items() if key != "first_ms"})
+    errors = [part["error"] for part in (cold, warm) if "error" in part]
+    if errors:
+        result["error"] = errors[0]
+    return result
+
+
+def _format(value: Optional[float], width: int = 10) -> str:
+    return f"{value:>{width},.1f}" if isinstance(value, (int, float)) else f"{'-':>{width}}"
+
+
+def report(results: List[Dict[str, Any]], baseline: Optional[Dict] = None, threshold: float = 0.2) -> None:
+    previous = {(r["scale"], r["case"]): r for r in (baseline or {}).get("results", [])}
+    print(f"{'資料量':<6}{'工具':<26}{'cold ms':>10}{'warm ms':>10}{'hot ms':>10}{'peak MB':>10}{'RSS+ MB':>10}")
+    for result in results:
+        line = (
+            f"{str(result['scale']) + '×':<8}{result['case']:<28}{_format(result['cold_ms'])}{_format(result['warm_ms'])}"
+            f"{_format(result['hot_ms'])}{_format(result.get('traced_peak_mb'))}{_format(result.get('rss_peak_delta_mb'))}"
+        )
+        old = previous.get((result["scale"], result["case"]))
+        if old:
+            slower = [
+                f"{name} {old[name]:,.1f}→{result[name]:,.1f}"
+                for name in ("cold_ms", "warm_ms", "hot_ms", "traced_peak_mb")
+                if result.get(name) and old.get(name) and result[name] > old[name] * (1 + threshold)
+            ]
+            if slower:
+                line += "  ⚠️ " + "、".join(slower)
+        if "error" in result:
+            line += f"  ❌ {result['error']}"
+        print(line)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        case, phase, repeat = sys.argv[2], sys.argv[3], int(sys.argv[4])
+        print(json.dumps(run_case(case, phase, repeat)))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="各工具在 1×／10×／100× 合成資料上的時間與峰值記憶體")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10])
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--repeat", type=int, default=5, help="hot 重複次數")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="不量測峰值記憶體（省下一次 cold 執行）")
+    parser.add_argument("--json", help="將結果寫入 JSON，供之後以 --baseline 比較")
+    parser.add_argument("--baseline", help="前次 --json 的結果檔")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        for case in args.cases:
+            results.append(measure(scale, case, args.repeat, not args.no_tracemalloc))
+            print(f"  完成 {scale}× {case}", file=sys.stderr)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(results, baseline, args.threshold)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"created_at": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}, f, ensure_ascii=False, indent=1)
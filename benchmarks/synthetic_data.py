@@ -0,0 +1,176 @@
+"""
+合成資料產生器：產生與 MBIS實績_2025上半年.xlsx、經銷商目標_2025上半年.xlsx、Mapping Dataframe.xlsx 欄位相同的活頁簿，
+資料量為實際檔案的 scale 倍（1×、10×、100×…），供 bench_suite.py 量測各工具的時間與記憶體隨資料量的變化。
+
+- 實績：日期、廠牌、車名、經銷商代碼、營業所代碼、課別代碼、實績種類（27／3D）、台數，約 115,000 × scale 列；
+  字串欄位保留原始檔案的尾端空白，台數含 -1、0 等原始值。超過 Excel 單一工作表列數上限時依序分成多個工作表
+- 目標：寬表格式（廠牌、經銷商代碼、據點代碼、課別代碼、目標種類、1月目標～6月目標），或長格式（年月、目標台數）
+- 映射表：經銷商代碼、經銷商名稱、營業所代碼、營業所名稱
+資料量以經銷商數放大（每個經銷商的據點數、日均筆數與實際檔案相近），同一個 scale 與 seed 產生的內容固定。
+
+執行方式（於專案根目錄）：
+    python benchmarks/synthetic_data.py [scale ...] [--target-format wide|long]
+"""
+import os
+import sys
+import string
+import argparse
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 產生的活頁簿存於 .cache/bench/x<scale>/，檔名與實際檔案相同
+BENCH_DIR = os.path.join(ROOT, ".cache", "bench")
+
+ACTUAL_FILE = "MBIS實績_2025上半年.xlsx"
+TARGET_FILE = "經銷商目標_2025上半年.xlsx"
+MAPPING_FILE = "Mapping Dataframe.xlsx"
+
+# 實際檔案的規模：9 個經銷商、約 107 個據點、115,385 列（2025-01-01 ～ 2025-05-25）
+BASE_DEALERS = 9
+BASE_ROWS = 115_385
+SITES_PER_DEALER = (4, 20)
+YEAR = 2025
+DATE_RANGE = (f"{YEAR}-01-01", f"{YEAR}-05-25")
+TARGET_MONTHS = range(1, 7)
+
+# Excel 單一工作表最多 1,048,576 列（含表頭）
+EXCEL_MAX_ROWS = 1_000_000
+
+BRANDS = {"TOYOTA": 0.8, "LEXUS": 0.2}
+MODELS = {
+    "TOYOTA": ["ALTIS", "VIOS", "YARIS", "CAMRY", "RAV4", "COROLLA CROSS", "TOWN ACE", "HILUX", "SIENTA", "PRIUS"],
+    "LEXUS": ["ES200", "ES300h", "NX200", "NX350h", "RX350", "UX250h", "LBX", "LM350h"],
+}
+SECTIONS = [1, 2, 3, 4, 0, 5]
+SECTION_WEIGHTS = [0.478, 0.35, 0.14, 0.027, 0.004, 0.001]
+KINDS = {"27": 0.55, "3D": 0.45}
+UNITS = [1, 2, -1, 3, -2, 4, 0]
+UNIT_WEIGHTS = [0.735, 0.111, 0.099, 0.026, 0.009, 0.008, 0.012]
+
+
+def dealer_codes(count: int) -> List[str]:
+    """A、B、…、Z、AA、AB、…"""
+    letters = string.ascii_uppercase
+    codes = []
+    length = 1
+    while len(codes) < count:
+        for index in range(len(letters) ** length):
+            code, value = "", index
+            for _ in range(length):
+                code = letters[value % 26] + code
+                value //= 26
+            codes.append(code)
+            if len(codes) == count:
+                break
+        length += 1
+    return codes
+
+
+def generate_mapping(scale: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for dealer_index, dealer in enumerate(dealer_codes(BASE_DEALERS * scale)):
+        for site in range(1, int(rng.integers(*SITES_PER_DEALER)) + 1):
+            rows.append((dealer, f"經銷商{dealer_index + 1}", f"{site:02d}", f"{dealer}營業所{site}"))
+    return pd.DataFrame(rows, columns=["經銷商代碼", "經銷商名稱", "營業所代碼", "營業所名稱"])
+
+
+def generate_actuals(mapping: pd.DataFrame, scale: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed + 1)
+    n = BASE_ROWS * scale
+    site = rng.integers(0, len(mapping), n)
+    brand = rng.choice(list(BRANDS), n, p=list(BRANDS.values()))
+    model = np.empty(n, dtype=object)
+    for name, models in MODELS.items():
+        mask = brand == name
+        model[mask] = rng.choice(models, int(mask.sum()))
+    dates = pd.date_range(*DATE_RANGE, freq="D")
+    df = pd.DataFrame({
+        "日期": np.sort(rng.choice(dates.values, n)),
+        # 原始檔案的代碼與名稱欄位帶有尾端空白
+        "廠牌": pd.Series(brand).str.pad(7, side="right").to_numpy(),
+        "車名": pd.Series(model).str.pad(13, side="right").to_numpy(),
+        "經銷商代碼": mapping["經銷商代碼"].to_numpy()[site],
+        "營業所代碼": mapping["營業所代碼"].astype(int).to_numpy()[site],
+        "課別代碼": rng.choice(SECTIONS, n, p=SECTION_WEIGHTS),
+        "實績種類": rng.choice(list(KINDS), n, p=list(KINDS.values())),
+        "台數": rng.choice(UNITS, n, p=UNIT_WEIGHTS),
+    })
+    return df
+
+
+def generate_targets(mapping: pd.DataFrame, seed: int = 0, target_format: str = "wide") -> pd.DataFrame:
+    """每個 廠牌 × 據點 × 課別 × 目標種類 一列；wide 為 X月目標 欄位，long 為 年月 + 目標台數"""
+    rng = np.random.default_rng(seed + 2)
+    keys = mapping[["經銷商代碼", "營業所代碼"]].rename(columns={"營業所代碼": "據點代碼"})
+    keys["據點代碼"] = keys["據點代碼"].astype(int)
+    grid = (
+        pd.DataFrame({"廠牌": list(BRANDS)})
+        .merge(keys, how="cross")
+        .merge(pd.DataFrame({"課別代碼": SECTIONS[:5]}), how="cross")
+        .merge(pd.DataFrame({"目標種類": [1, 2]}), how="cross")
+    )
+    values = rng.gamma(1.2, 3.3, (len(grid), len(TARGET_MONTHS))).round().astype(int) + 1
+    if target_format == "wide":
+        return grid.assign(**{f"{month}月目標": values[:, i] for i, month in enumerate(TARGET_MONTHS)})
+    frames = [grid.assign(年月=YEAR * 100 + month, 目標台數=values[:, i]) for i, month in enumerate(TARGET_MONTHS)]
+    long = pd.concat(frames, ignore_index=True)
+    return long[["年月", "廠牌", "經銷商代碼", "據點代碼", "課別代碼", "目標種類", "目標台數"]]
+
+
+def write_workbook(path: str, df: pd.DataFrame, max_rows: int = EXCEL_MAX_ROWS) -> List[str]:
+    """以 openpyxl 的 write_only 模式串流寫出活頁簿，超過 max_rows 時依序寫入 工作表1、工作表2、…，回傳工作表名稱"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheets = []
+    for number, start in enumerate(range(0, max(len(df), 1), max_rows), start=1):
+        sheet = workbook.create_sheet(f"工作表{number}")
+        sheet.append(list(df.columns))
+        chunk = df.iloc[start:start + max_rows]
+        for row in zip(*(chunk[col].tolist() for col in chunk.columns)):
+            sheet.append(row)
+        sheets.append(sheet.title)
+    tmp_path = f"{path}.{os.getpid()}.tmp.xlsx"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, path)
+    return sheets
+
+
+def dataset_dir(scale: int, target_format: str = "wide", seed: int = 0) -> str:
+    return os.path.join(BENCH_DIR, f"x{scale}" + ("" if target_format == "wide" and seed == 0 else f"_{target_format}_{seed}"))
+
+
+def ensure_dataset(scale: int, target_format: str = "wide", seed: int = 0) -> Dict[str, str]:
+    """產生（或沿用已產生的）scale 倍資料集，回傳 {actual, target, mapping, directory}"""
+    directory = dataset_dir(scale, target_format, seed)
+    paths = {
+        "actual": os.path.join(directory, ACTUAL_FILE),
+        "target": os.path.join(directory, TARGET_FILE),
+        "mapping": os.path.join(directory, MAPPING_FILE),
+        "directory": directory,
+    }
+    if all(os.path.exists(paths[name]) for name in ("actual", "target", "mapping")):
+        return paths
+
+    os.makedirs(directory, exist_ok=True)
+    mapping = generate_mapping(scale, seed)
+    write_workbook(paths["mapping"], mapping)
+    write_workbook(paths["target"], generate_targets(mapping, seed, target_format))
+    write_workbook(paths["actual"], generate_actuals(mapping, scale, seed))
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="產生 scale 倍的合成實績、目標與映射表活頁簿")
+    parser.add_argument("scales", nargs="*", type=int, default=[1, 10])
+    parser.add_argument("--target-format", choices=["wide", "long"], default="wide")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for scale in args.scales:
+        paths = ensure_dataset(scale, args.target_format, args.seed)
+        sizes = "、".join(f"{os.path.basename(paths[name])} {os.path.getsize(paths[name]) / 1024 ** 2:.1f} MB" for name in ("actual", "target", "mapping"))
+        print(f"{scale:>4}×：{paths['directory']}（{sizes}）", file=sys.stdout)
@@ -0,0 +1,300 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from data_schema import compact_dtypes
+
+# ==================================== 1. 設定 ====================================
+# 解析後的工作表以 Parquet 存放於此目錄，檔名由「檔案內容雜湊 + 工作表名稱」組成，
+# 上傳新檔覆蓋原檔時雜湊改變，自然不會命中舊快取。
+CACHE_DIR = os.environ.get("EXCEL_CACHE_DIR", os.path.join(".cache", "excel"))
+# 清理或型態規則改變時調整此版本，舊格式的快取檔便不會再被讀取
+CACHE_FORMAT = 3
+
+# 絕對路徑 → ((mtime_ns, size), sha256)，避免同一檔案每次都重新計算雜湊
+_hash_memo: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+
+# ==================================== 2. 檔案識別 ====================================
+def file_signature(filename: str) -> Tuple[int, int]:
+    """回傳檔案的 (mtime_ns, size)，作為是否變動的快速判斷依據"""
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_content_hash(filename: str) -> str:
+    """計算檔案內容的 sha256；mtime 與大小未變時直接沿用上次結果"""
+    path = os.path.abspath(filename)
+    signature = file_signature(path)
+    memo = _hash_memo.get(path)
+    if memo and memo[0] == signature:
+        return memo[1]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+
+    # 同一路徑的內容已被取代：清掉舊內容留下的快取檔
+    if memo and memo[1] != content_hash:
+        _remove_cached(memo[1])
+
+    _hash_memo[path] = (signature, content_hash)
+    return content_hash
+
+
+# ==================================== 3. 資料清理 ====================================
+# 需要轉成純字串的代碼欄位（Excel 中 27 會被讀成數字、3D 則是字串）
+STRING_CODE_COLUMNS = {"實績種類"}
+
+
+def _clean_column(col: pd.Series, as_string: bool) -> pd.Series:
+    """
+    只對不重複值做清理再映射回原欄位：代碼欄位通常只有數十個不同值，
+    不必逐列 strip。as_string=True 時同時完成 astype(str).str.strip()。
+    """
+    # 轉字串時缺值也要變成 "nan"（與 astype(str) 相同），因此不使用 NA 哨兵值
+    codes, uniques = pd.factorize(col, use_na_sentinel=not as_string)
+    if as_string:
+        cleaned = [str(value).strip() for value in uniques]
+    else:
+        cleaned = [value.strip() if isinstance(value, str) else value for value in uniques]
+
+    # 多放一個 NaN 在最後，讓哨兵值 -1 直接對應到缺值
+    lookup = np.array(cleaned + [np.nan], dtype=object)
+    return pd.Series(lookup[codes], index=col.index, name=col.name, dtype=object)
+
+
+def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """套用所有載入工具共用的清理步驟：字串去空白、日期轉型、實績種類轉字串"""
+    df = df.copy(deep=False)
+    for column in df.columns:
+        as_string = column in STRING_CODE_COLUMNS
+        # 1. 去除 object 欄位的前後空白；3. 「實績種類」在同一步驟轉為純字串
+        if as_string or df[column].dtype == "object":
+            df[column] = _clean_column(df[column], as_string)
+
+    # 2. 強制轉換「日期」欄位
+    if "日期" in df.columns:
+        df["日期"] = pd.to_datetime(df["日期"], errors="coerce")
+
+    return df
+
+
+# ==================================== 4. 快取讀寫 ====================================
+def _cache_path(content_hash: str, sheet_name: str) -> str:
+    sheet_digest = hashlib.sha1(sheet_name.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, f"{content_hash}_{sheet_digest}_v{CACHE_FORMAT}.parquet")
+
+
+def _report_path(content_hash: str, sheet_name: str) -> str:
+    return _cache_path(content_hash, sheet_name)[: -len(".parquet")] + ".schema.json"
+
+
+def _sheets_path(content_hash: str) -> str:
+    return os.path.join(CACHE_DIR, f"{content_hash}.sheets.json")
+
+
+def _remove_cached(content_hash: str) -> None:
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        if name.startswith(content_hash):
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+            except OSError:
+                pass
+
+
+def _read_cached(path: str) -> Optional[pd.DataFrame]:
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception:
+        # 快取檔損毀或缺少 pyarrow 時，退回重新解析 Excel
+        return None
+
+
+def _write_cached(path: str, df: pd.DataFrame) -> None:
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        # 快取只是加速用途，寫入失敗（如欄位型態混雜、缺少 pyarrow）不影響載入結果
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _parse_sheet(source, sheet_name: str, content_hash: str) -> pd.DataFrame:
+    """解析 Excel 工作表、清理並壓縮欄位型態，再寫入快取"""
+    df = clean_dataframe(pd.read_excel(source, sheet_name=sheet_name))
+    df, report = compact_dtypes(df)
+    _write_cached(_cache_path(content_hash, sheet_name), df)
+    try:
+        with open(_report_path(content_hash, sheet_name), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False)
+    except OSError:
+        pass
+    return df
+
+
+def schema_report(filename: str, sheet_name: Optional[str] = None) -> Dict[str, Dict]:
+    """回傳工作表載入時的型態壓縮報告（每欄位節省的 bytes）；尚未載入過則回傳空 dict"""
+    content_hash = file_content_hash(filename)
+    if sheet_name is None:
+        sheet_name = list_sheet_names(filename)[0]
+    path = _report_path(content_hash, sheet_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_sheet_names(filename: str) -> List[str]:
+    """回傳活頁簿的工作表名稱，結果同樣依內容雜湊快取"""
+    content_hash = file_content_hash(filename)
+    sheets_path = _sheets_path(content_hash)
+    if os.path.exists(sheets_path):
+        with open(sheets_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    sheet_names = pd.ExcelFile(filename).sheet_names
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(sheets_path, "w", encoding="utf-8") as f:
+            json.dump(sheet_names, f, ensure_ascii=False)
+    except OSError:
+        pass
+    return sheet_names
+
+
+def load_sheet(filename: str, sheet_name: Optional[str] = None) -> pd.DataFrame:
+    """
+    讀取單一工作表並回傳清理、型態壓縮後的 DataFrame。
+    sheet_name 為 None 時讀取第一個工作表；命中快取時不經過 openpyxl 解析。
+    """
+    content_hash = file_content_hash(filename)
+    if sheet_name is None:
+        sheet_name = list_sheet_names(filename)[0]
+
+    path = _cache_path(content_hash, sheet_name)
+    df = _read_cached(path)
+    if df is not None:
+        return df
+
+    return _parse_sheet(filename, sheet_name, content_hash)
+
+
+def load_sheet_head(filename: str, sheet_name: Optional[str] = None, n_rows: int = 5) -> pd.DataFrame:
+    """
+    工作表前 n_rows 列（已清理）。命中快取時由 Parquet 取得；未命中時只解析前 n_rows 列，
+    不解析整張工作表也不寫入快取（預覽不應付出完整載入的成本）。
+    """
+    content_hash = file_content_hash(filename)
+    if sheet_name is None:
+        sheet_name = list_sheet_names(filename)[0]
+
+    df = _read_cached(_cache_path(content_hash, sheet_name))
+    if df is not None:
+        return df.head(n_rows)
+    return clean_dataframe(pd.read_excel(filename, sheet_name=sheet_name, nrows=n_rows))
+
+
+def cached_sheet_path(filename: str, sheet_name: Optional[str] = None) -> Optional[str]:
+    """清理後工作表的 Parquet 快取檔路徑（供 SQL 引擎直接掃描）；尚未建立快取時回傳 None，不會解析 Excel"""
+    if sheet_name is None:
+        sheet_name = list_sheet_names(filename)[0]
+    path = _cache_path(file_content_hash(filename), sheet_name)
+    return path if os.path.exists(path) else None
+
+
+def load_workbook(filename: str) -> Dict[str, pd.DataFrame]:
+    """讀取活頁簿所有工作表，回傳 {sheet_name: DataFrame}；未命中快取的工作表共用同一次開檔"""
+    content_hash = file_content_hash(filename)
+    sheet_names = list_sheet_names(filename)
+
+    frames: Dict[str, pd.DataFrame] = {}
+    missing: List[str] = []
+    for sheet in sheet_names:
+        df = _read_cached(_cache_path(content_hash, sheet))
+        if df is None:
+            missing.append(sheet)
+        else:
+            frames[sheet] = df
+
+    if missing:
+        xls = pd.ExcelFile(filename)
+        for sheet in missing:
+            frames[sheet] = _parse_sheet(xls, sheet, content_hash)
+
+    return {sheet: frames[sheet] for sheet in sheet_names}
+
+
+# ==================================== 5. 持久化索引 ====================================
+class SignatureIndex:
+    """
+    以檔案絕對路徑為 key、(mtime_ns, size) 為版本的持久化 JSON 索引。
+    檔案未變動時直接回傳上次記錄的值，變動後自動視為未命中。
+    多個 session 的工具可能同時寫入，修改與寫檔都在鎖內進行。
+    """
+
+    def __init__(self, name: str):
+        self.path = os.path.join(CACHE_DIR, f"{name}.json")
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, filename: str):
+        with self._lock:
+            entry = self._load().get(os.path.abspath(filename))
+        if entry and tuple(entry["signature"]) == file_signature(filename):
+            return entry["value"]
+        return None
+
+    def put(self, filename: str, value) -> None:
+        signature = list(file_signature(filename))
+        with self._lock:
+            entries = self._load()
+            entries[os.path.abspath(filename)] = {"signature": signature, "value": value}
+            snapshot = dict(entries)
+            # 暫存檔名含執行緒 id，同一程序內的其他寫入者不會寫到同一個暫存檔
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+
+def read_header_rows(filename: str) -> Dict[str, List[str]]:
+    """以 openpyxl 唯讀串流模式只讀取每個工作表的表頭列，不解析資料列"""
+    from openpyxl import load_workbook as open_workbook
+
+    workbook = open_workbook(filename, read_only=True, data_only=True)
+    try:
+        headers = {}
+        for worksheet in workbook.worksheets:
+            first_row = next(worksheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+            headers[worksheet.title] = [str(value).strip() for value in first_row if value is not None]
+        return headers
+    finally:
+        workbook.close()
+
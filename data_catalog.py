@@ -0,0 +1,240 @@
+import os
+import itertools
+import threading
+import pandas as pd
+from collections.abc import MutableMapping
+from typing import Callable, Dict, Iterator, List, Optional
+from data_cache import file_content_hash, list_sheet_names
+
+# ==================================== 1. 設定 ====================================
+# 每個 session 自有資料（衍生資料如 target_vs_actual 合併結果，以及讀入的分區資料集）的記憶體上限，超過時以 LRU 淘汰
+DATA_CATALOG_DERIVED_BUDGET_MB = float(os.environ.get("DATA_CATALOG_DERIVED_BUDGET_MB", "256"))
+
+SHEET, DERIVED, STORE = "sheet", "derived", "store"
+# 分區資料集（partition_store）的 key 前綴，如 store::actuals
+STORE_PREFIX = "store::"
+# 計入記憶體預算的種類：工作表為所有 session 共用的解析結果，不計入
+BUDGETED = (DERIVED, STORE)
+
+# 全程序遞增的存取序號，作為 LRU 順序
+_clock = itertools.count(1)
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """DataFrame 實際占用的記憶體（含字串內容）"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _derived_from(key: str, filename: str) -> bool:
+    """
+    衍生資料 key（如 目標.xlsx::工作表1_vs_實績.xlsx::工作表1[販賣]）的任一來源是否為 filename 的工作表。
+    以 "filename::" 前綴比對，a.xlsx 不會誤中 ba.xlsx。
+    """
+    return any(source == filename or source.startswith(f"{filename}::") for source in key.split("_vs_"))
+
+
+# ==================================== 2. 資料目錄 ====================================
+class CatalogEntry:
+    """目錄中的一筆資料：工作表（可由共用解析結果重新取得）、分區資料集或衍生資料（只存在記憶體）"""
+
+    def __init__(self, key: str, kind: str, filename: Optional[str] = None, sheet: Optional[str] = None):
+        self.key = key
+        self.kind = kind
+        self.filename = filename
+        self.sheet = sheet
+        self.frame: Optional[pd.DataFrame] = None
+        self.nbytes = 0
+        self.last_access = 0
+        # 分區資料集的版本；資料集新增資料後重新取得
+        self.version = 0
+        # 工作表取得資料時的檔案內容雜湊；檔案被覆蓋後與目前雜湊不同，重新取得
+        self.digest: Optional[str] = None
+
+    def attach(self, frame: pd.DataFrame) -> None:
+        self.frame = frame
+        self.nbytes = frame_nbytes(frame)
+        self.last_access = next(_clock)
+
+
+class DataCatalog(MutableMapping):
+    """
+    一個 session 的資料目錄，key 為 filename::sheet、store::資料集 或衍生資料名稱。
+    工作表只登記名稱，第一次存取時才由 shared_frames 取得；分區資料集由 partition_store 取得，資料集新增資料後自動更新；
+    寫入的其他 key 視為衍生資料。分區資料集每個 session 各自讀入一份，與衍生資料一起計入預算，超過時淘汰最久未使用者：
+    衍生資料直接移除，分區資料集只丟棄資料、下次存取時重新讀取。工作表由所有 session 共用，不列入淘汰。
+    來源檔案內容改變時，該檔案的工作表重新取得、由它衍生的資料移除，並通知 listeners（如 DataContext 清除立方體與目標表）。
+    """
+
+    def __init__(self, derived_budget_bytes: int = int(DATA_CATALOG_DERIVED_BUDGET_MB * 1024 ** 2)):
+        self.derived_budget_bytes = derived_budget_bytes
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._lock = threading.RLock()
+        # 檔案失效時以受影響的 key 列表呼叫
+        self.listeners: List[Callable[[List[str]], None]] = []
+
+    # ---------- 登記 ----------
+    def register_workbook(self, filename: str) -> List[str]:
+        """登記活頁簿的所有工作表（只讀取工作表名稱，不解析資料），回傳 key 列表"""
+        keys = []
+        with self._lock:
+            self.refresh_file(filename)
+            for sheet in list_sheet_names(filename):
+                key = f"{filename}::{sheet}"
+                if key not in self._entries:
+                    self._entries[key] = CatalogEntry(key, SHEET, filename, sheet)
+                keys.append(key)
+        return keys
+
+    def _resolve(self, key: str) -> Optional[CatalogEntry]:
+        """取得 key 對應的項目；filename::sheet（或只有 filename，表示第一個工作表）且檔案存在時自動登記"""
+        entry = self._entries.get(key)
+        if entry is None and key.startswith(STORE_PREFIX):
+            from partition_store import get_store
+
+            if get_store(key[len(STORE_PREFIX):]).partitions():
+                entry = self._entries[key] = CatalogEntry(key, STORE)
+        elif entry is None:
+            filename, _, sheet = key.partition("::")
+            if os.path.isfile(filename) and (not sheet or sheet in list_sheet_names(filename)):
+                keys = self.register_workbook(filename)
+                entry = self._entries.get(key if sheet else keys[0])
+        return entry
+
+    # ---------- 來源檔案變動 ----------
+    def invalidate_file(self, filename: str) -> List[str]:
+        """丟棄 filename 的工作表資料（下次存取時重新取得）與由其工作表衍生的資料，回傳受影響的 key"""
+        affected = []
+        with self._lock:
+            for entry in list(self._entries.values()):
+                if entry.kind == SHEET and entry.filename == filename:
+                    entry.frame, entry.nbytes, entry.digest = None, 0, None
+                    affected.append(entry.key)
+                elif entry.kind == DERIVED and _derived_from(entry.key, filename):
+                    del self._entries[entry.key]
+                    affected.append(entry.key)
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(affected)
+        return affected
+
+    def refresh_file(self, filename: str) -> List[str]:
+        """已取得資料的工作表中，有任何一個與目前檔案內容不同時使 filename 失效"""
+        with self._lock:
+            digests = {
+                entry.digest for entry in self._entries.values()
+                if entry.kind == SHEET and entry.filename == filename and entry.digest is not None
+            }
+            if not digests or not os.path.isfile(filename) or digests == {file_content_hash(filename)}:
+                return []
+            return self.invalidate_file(filename)
+
+    def refresh(self, key: str) -> None:
+        """key 為工作表且來源檔案已改變時使其失效；立方體、目標表等以 key 快取的資料在使用前呼叫"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.kind == SHEET:
+                self.refresh_file(entry.filename)
+
+    # ---------- MutableMapping ----------
+    def __getitem__(self, key: str) -> pd.DataFrame:
+        from data_context import shared_frames
+
+        with self._lock:
+            entry = self._resolve(key)
+            if entry is None:
+                raise KeyError(key)
+            if entry.kind == STORE:
+                from partition_store import get_store
+
+                store = get_store(key[len(STORE_PREFIX):])
+                if entry.frame is None or entry.version != store.version:
+                    entry.attach(store.read().copy(deep=False))
+                    entry.version = store.version
+                    self._evict(keep=key)
+                else:
+                    entry.last_access = next(_clock)
+            else:
+                if entry.kind == SHEET:
+                    self.refresh_file(entry.filename)
+                if entry.frame is None:
+                    entry.digest = file_content_hash(entry.filename)
+                    entry.attach(shared_frames.sheet(entry.filename, entry.sheet))
+                else:
+                    entry.last_access = next(_clock)
+            return entry.frame
+
+    def __setitem__(self, key: str, frame: pd.DataFrame) -> None:
+        with self._lock:
+            entry = self._resolve(key) or CatalogEntry(key, DERIVED)
+            entry.attach(frame)
+            self._entries[key] = entry
+            if entry.kind in BUDGETED:
+                self._evict(keep=key)
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            del self._entries[key]
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            return isinstance(key, str) and self._resolve(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---------- 記憶體 ----------
+    def _evict(self, keep: Optional[str] = None) -> List[str]:
+        """衍生資料與分區資料集超過預算時，依最久未使用順序淘汰（剛寫入或讀入的 keep 保留）"""
+        candidates = sorted(
+            (
+                entry for entry in self._entries.values()
+                if entry.kind in BUDGETED and entry.frame is not None and entry.key != keep
+            ),
+            key=lambda entry: entry.last_access,
+        )
+        total = self._budgeted_bytes()
+        evicted = []
+        for entry in candidates:
+            if total <= self.derived_budget_bytes:
+                break
+            total -= entry.nbytes
+            if entry.kind == STORE:
+                # 保留登記，下次存取時重新讀取
+                entry.frame, entry.nbytes = None, 0
+            else:
+                del self._entries[entry.key]
+            evicted.append(entry.key)
+        return evicted
+
+    def _budgeted_bytes(self) -> int:
+        return sum(
+            entry.nbytes for entry in self._entries.values()
+            if entry.kind in BUDGETED and entry.frame is not None
+        )
+
+    def memory_usage(self, kind: Optional[str] = None) -> int:
+        """已載入資料的總記憶體（bytes），可指定 sheet / derived / store"""
+        with self._lock:
+            return sum(
+                entry.nbytes for entry in self._entries.values()
+                if entry.frame is not None and (kind is None or entry.kind == kind)
+            )
+
+    def budget_usage(self) -> int:
+        """計入預算的記憶體（衍生資料與分區資料集，bytes）"""
+        with self._lock:
+            return self._budgeted_bytes()
+
+    def resident(self) -> List[Dict]:
+        """目前在記憶體中的資料，最近使用的在前"""
+        with self._lock:
+            entries = [entry for entry in self._entries.values() if entry.frame is not None]
+        entries.sort(key=lambda entry: entry.last_access, reverse=True)
+        return [
+            {"key": entry.key, "kind": entry.kind, "rows": int(len(entry.frame)), "memory_bytes": entry.nbytes}
+            for entry in entries
+        ]
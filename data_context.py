@@ -0,0 +1,125 @@
+import os
+import itertools
+import threading
+import contextvars
+import pandas as pd
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+from data_cache import file_content_hash, list_sheet_names, load_sheet, load_sheet_head, load_workbook
+from data_catalog import DataCatalog
+
+# 全程序遞增的資料版本，讓不同 session 的 Pandas Agent 池 key 不會相撞
+_versions = itertools.count(1)
+
+
+# ==================================== 1. 跨 session 共用的解析結果 ====================================
+class SharedFrames:
+    """
+    以（檔案內容雜湊, 工作表）為 key 保存解析後的 DataFrame，所有 session 共用同一份，
+    同一個檔案在程序內只讀取一次。對外只交出淺層複本：整欄指派（df[col] = ...）只替換複本的欄位，
+    不會影響其他人；會就地寫入的程式（.loc / .iloc 指派、inplace=True）必須先自行 .copy()。
+    """
+
+    def __init__(self):
+        self._frames: Dict[Tuple[str, str], pd.DataFrame] = {}
+        self._digests: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _digest(self, filename: str) -> str:
+        """目前的內容雜湊；檔案內容改變時丟棄舊版本的共用資料"""
+        digest = file_content_hash(filename)
+        path = os.path.abspath(filename)
+        previous = self._digests.get(path)
+        if previous != digest:
+            if previous is not None:
+                for key in [key for key in self._frames if key[0] == previous]:
+                    del self._frames[key]
+            self._digests[path] = digest
+        return digest
+
+    def sheet(self, filename: str, sheet_name: Optional[str] = None) -> pd.DataFrame:
+        """單一工作表（None 表示第一個工作表）的複本"""
+        if sheet_name is None:
+            sheet_name = list_sheet_names(filename)[0]
+        with self._lock:
+            key = (self._digest(filename), sheet_name)
+            if key not in self._frames:
+                self._frames[key] = load_sheet(filename, sheet_name)
+            return self._frames[key].copy(deep=False)
+
+    def head(self, filename: str, sheet_name: Optional[str] = None, n_rows: int = 5) -> pd.DataFrame:
+        """工作表的前 n_rows 列；已解析過的直接取用，否則只讀取前幾列，不會載入整張工作表"""
+        if sheet_name is None:
+            sheet_name = list_sheet_names(filename)[0]
+        with self._lock:
+            key = (self._digest(filename), sheet_name)
+            if key in self._frames:
+                return self._frames[key].head(n_rows).copy()
+        return load_sheet_head(filename, sheet_name, n_rows)
+
+    def workbook(self, filename: str) -> Dict[str, pd.DataFrame]:
+        """所有工作表的複本 {sheet_name: DataFrame}"""
+        with self._lock:
+            digest = self._digest(filename)
+            sheet_names = list_sheet_names(filename)
+            if any((digest, sheet) not in self._frames for sheet in sheet_names):
+                for sheet, df in load_workbook(filename).items():
+                    self._frames.setdefault((digest, sheet), df)
+            return {sheet: self._frames[(digest, sheet)].copy(deep=False) for sheet in sheet_names}
+
+
+shared_frames = SharedFrames()
+
+
+# ==================================== 2. Session 資料上下文 ====================================
+class DataContext:
+    """
+    一個 session 的工作資料：所有工作表與衍生資料都在同一個 DataCatalog（key 為 filename::sheet 或衍生名稱），
+    read_excel_file 設定的目前資料集只記錄其 key；另保存已建立的彙總立方體與長格式目標表。
+    """
+
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self.frames = DataCatalog()
+        self.cubes: Dict[str, Any] = {}
+        self.targets: Dict[str, Any] = {}
+        self.current_key: Optional[str] = None
+        self.current_version = 0
+        self.frames.listeners.append(self._on_invalidate)
+
+    def _on_invalidate(self, keys) -> None:
+        """來源檔案改變：移除由這些工作表建立的立方體與目標表；目前資料集換新版本，Pandas Agent 改用新資料"""
+        for key in keys:
+            self.cubes.pop(key, None)
+            self.targets.pop(key, None)
+        if self.current_key in keys:
+            self.current_version = next(_versions)
+
+    @property
+    def current_df(self) -> Optional[pd.DataFrame]:
+        return self.frames[self.current_key] if self.current_key is not None else None
+
+    def set_current(self, key: str) -> None:
+        """設定目前資料集並換新版本，analyze_dataframe 會改用新的 Pandas Agent"""
+        self.current_key = key
+        self.current_version = next(_versions)
+
+
+# 未指定上下文時（命令列執行、單一使用者）使用的預設上下文
+default_context = DataContext()
+_active_context: contextvars.ContextVar = contextvars.ContextVar("data_context", default=default_context)
+
+
+def get_data_context() -> DataContext:
+    """目前執行中的查詢所屬的資料上下文；工具一律透過此函數取得資料"""
+    return _active_context.get()
+
+
+@contextmanager
+def use_data_context(context: DataContext) -> Iterator[DataContext]:
+    """在 with 區塊內（含其中建立的 asyncio 工作與 run_in_executor 呼叫）使用指定的資料上下文"""
+    token = _active_context.set(context)
+    try:
+        yield context
+    finally:
+        _active_context.reset(token)
@@ -0,0 +1,112 @@
+import re
+import pandas as pd
+from typing import Dict, Tuple
+
+# ==================================== 1. 欄位分類 ====================================
+# 台數類欄位：轉成最小可容納的整數型態，保留 -1、0 等原始值（含缺值時改用可為空的 Int 型態）。
+# 台數會被 cumsum、乘除等運算直接使用，最小只降到 int32，避免運算結果溢位。
+COUNT_COLUMNS = {"台數", "銷售數", "受訂數", "目標台數", "目標數", "目標銷售數"}
+COUNT_MIN_DTYPE = "int32"
+MONTH_TARGET_PATTERN = re.compile(r"^\d{1,2}月目標$")
+
+# 代碼與名稱欄位：不同值只有數十個，轉成 category
+CATEGORY_COLUMNS = {
+    "經銷商代碼", "營業所代碼", "據點代碼", "車名", "SFX", "實績種類", "廠牌",
+    "經銷商名稱", "營業所名稱", "據點名稱", "經銷商", "營業所", "據點",
+}
+# 未列名的字串欄位，不同值比例低於此門檻時同樣轉成 category
+CATEGORY_MAX_RATIO = 0.5
+
+
+def is_count_column(column: str) -> bool:
+    return column in COUNT_COLUMNS or bool(MONTH_TARGET_PATTERN.match(str(column)))
+
+
+# ==================================== 2. 型態壓縮 ====================================
+def _compact_count(col: pd.Series) -> pd.Series:
+    values = pd.to_numeric(col, errors="coerce")
+    non_null = values.dropna()
+    if len(non_null) and not (non_null == non_null.round()).all():
+        # 含小數的欄位不是台數，只做浮點數降級
+        return pd.to_numeric(values, downcast="float")
+    if non_null.empty:
+        return values
+    downcast = pd.to_numeric(non_null.astype("int64"), downcast="integer").dtype
+    if downcast.itemsize < pd.api.types.pandas_dtype(COUNT_MIN_DTYPE).itemsize:
+        downcast = pd.api.types.pandas_dtype(COUNT_MIN_DTYPE)
+    if values.isna().any():
+        # 有缺值時無法用 numpy 整數，改用可為空的整數型態
+        return values.astype(str(downcast).capitalize())
+    return values.astype(downcast)
+
+
+def _is_string_column(col: pd.Series) -> bool:
+    if col.dtype != "object":
+        return False
+    return col.dropna().map(type).eq(str).all()
+
+
+def compact_dtypes(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Dict]]:
+    """
+    將代碼/名稱欄位轉為 category、台數欄位轉為最小整數型態。
+    回傳 (壓縮後的 DataFrame, 每個欄位的壓縮報告)。
+    """
+    df = df.copy()
+    report: Dict[str, Dict] = {}
+
+    for column in df.columns:
+        col = df[column]
+        before_dtype = str(col.dtype)
+        before_bytes = int(col.memory_usage(index=False, deep=True))
+
+        if is_count_column(column):
+            new_col = _compact_count(col)
+        elif pd.api.types.is_integer_dtype(col.dtype) and not isinstance(col.dtype, pd.CategoricalDtype):
+            # 其他整數欄位（如 營業所代碼、課別代碼、年月）同樣降級，值不變
+            new_col = pd.to_numeric(col, downcast="integer")
+        elif column in CATEGORY_COLUMNS and col.dtype == "object":
+            new_col = col.astype("category")
+        elif _is_string_column(col) and len(col) and col.nunique() / len(col) <= CATEGORY_MAX_RATIO:
+            new_col = col.astype("category")
+        else:
+            continue
+
+        after_bytes = int(new_col.memory_usage(index=False, deep=True))
+        if after_bytes >= before_bytes:
+            continue
+
+        df[column] = new_col
+        report[column] = {
+            "before_dtype": before_dtype,
+            "after_dtype": str(new_col.dtype),
+            "before_bytes": before_bytes,
+            "after_bytes": after_bytes,
+            "saved_bytes": before_bytes - after_bytes,
+        }
+
+    return df, report
+
+
+def format_report(report: Dict[str, Dict]) -> pd.DataFrame:
+    """將壓縮報告轉為表格，並附上合計列"""
+    if not report:
+        return pd.DataFrame(columns=["欄位", "原型態", "新型態", "原大小(bytes)", "新大小(bytes)", "節省(bytes)"])
+
+    table = pd.DataFrame([
+        {
+            "欄位": column,
+            "原型態": item["before_dtype"],
+            "新型態": item["after_dtype"],
+            "原大小(bytes)": item["before_bytes"],
+            "新大小(bytes)": item["after_bytes"],
+            "節省(bytes)": item["saved_bytes"],
+        }
+        for column, item in report.items()
+    ])
+    total = {
+        "欄位": "合計", "原型態": "", "新型態": "",
+        "原大小(bytes)": table["原大小(bytes)"].sum(),
+        "新大小(bytes)": table["新大小(bytes)"].sum(),
+        "節省(bytes)": table["節省(bytes)"].sum(),
+    }
+    return pd.concat([table, pd.DataFrame([total])], ignore_index=True)
@@ -0,0 +1,177 @@
+import threading
+import unicodedata
+import pandas as pd
+from typing import Dict, Iterable, List, Optional, Tuple
+from data_cache import file_signature
+
+# ==================================== 1. 設定 ====================================
+MAPPING_FILE = "Mapping Dataframe.xlsx"
+
+# (經銷商代碼, 經銷商名稱, 營業所代碼, 營業所名稱)
+MappingRow = Tuple[str, str, str, str]
+
+# 名稱比對前移除的贅字與異體字對照
+NAME_STOPWORDS = ("營業所", "據點", "經銷商", "分公司", "公司", "的")
+NAME_VARIANTS = str.maketrans({"臺": "台"})
+
+
+def normalize_name(text: str) -> str:
+    """名稱正規化：全半形統一、去空白與贅字、臺→台"""
+    text = unicodedata.normalize("NFKC", str(text)).translate(NAME_VARIANTS).upper()
+    for word in NAME_STOPWORDS:
+        text = text.replace(word, "")
+    return "".join(text.split())
+
+
+def char_ngrams(text: str) -> set:
+    """中文名稱多為 2~3 字，取單字與相鄰雙字作為 n-gram"""
+    text = normalize_name(text)
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+# ==================================== 2. 映射表索引 ====================================
+class DealerMappingIndex:
+    """
+    映射表的記憶體索引：以經銷商代碼、營業所代碼、組合代碼（如 D01）建立雜湊表。
+    映射檔的 mtime 或大小改變時才重新讀取 Excel。
+    """
+
+    def __init__(self, path: str = MAPPING_FILE):
+        self.path = path
+        self._signature: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self.rows: List[MappingRow] = []
+        self.by_dealer: Dict[str, List[MappingRow]] = {}
+        self.by_site: Dict[str, List[MappingRow]] = {}
+        self.by_pair: Dict[Tuple[str, str], MappingRow] = {}
+        # n-gram → 列索引，分別建立於經銷商名稱與營業所名稱
+        self.dealer_grams: Dict[str, set] = {}
+        self.site_grams: Dict[str, set] = {}
+        self._row_grams: List[Tuple[set, set]] = []
+
+    def _ensure_loaded(self) -> None:
+        signature = file_signature(self.path)
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            df = pd.read_excel(self.path, dtype=str)
+            self._build(df)
+            self._signature = signature
+
+    def _build(self, df: pd.DataFrame) -> None:
+        columns = ["經銷商代碼", "經銷商名稱", "營業所代碼", "營業所名稱"]
+        df = df[columns].fillna("")
+        rows = [
+            tuple(str(value).strip() for value in values)
+            for values in df.itertuples(index=False, name=None)
+        ]
+
+        by_dealer: Dict[str, List[MappingRow]] = {}
+        by_site: Dict[str, List[MappingRow]] = {}
+        by_pair: Dict[Tuple[str, str], MappingRow] = {}
+        for row in rows:
+            dealer_code, _, site_code, _ = row
+            by_dealer.setdefault(dealer_code, []).append(row)
+            by_site.setdefault(site_code, []).append(row)
+            by_pair.setdefault((dealer_code, site_code), row)
+
+        dealer_grams: Dict[str, set] = {}
+        site_grams: Dict[str, set] = {}
+        row_grams: List[Tuple[set, set]] = []
+        for i, (_, dealer_name, _, site_name) in enumerate(rows):
+            grams = (char_ngrams(dealer_name), char_ngrams(site_name))
+            row_grams.append(grams)
+            for gram in grams[0]:
+                dealer_grams.setdefault(gram, set()).add(i)
+            for gram in grams[1]:
+                site_grams.setdefault(gram, set()).add(i)
+
+        # 一次替換所有索引，查詢中的其他執行緒不會看到建到一半的狀態
+        self.rows, self.by_dealer, self.by_site, self.by_pair = rows, by_dealer, by_site, by_pair
+        self.dealer_grams, self.site_grams, self._row_grams = dealer_grams, site_grams, row_grams
+
+    def lookup(self, query_code: str) -> str:
+        """查詢單一代碼，回傳格式與原 get_dealer_mapping 工具相同"""
+        self._ensure_loaded()
+
+        # 清理查詢代碼
+        query_code = str(query_code).strip().upper()
+
+        # 檢查是否為組合代碼（字母+數字）
+        if len(query_code) >= 2 and query_code[0].isalpha() and query_code[1:].isdigit():
+            # 組合代碼拆解：D01, D1 等
+            dealer_code = query_code[0]
+            site_code = query_code[1:].zfill(2)  # 自動補零：D1 → 01
+
+            row = self.by_pair.get((dealer_code, site_code))
+            if row:
+                return f"找到匹配 '{query_code}':\n經銷商 {dealer_code} ({row[1]}) - 營業所 {site_code} ({row[3]})"
+
+            # 沒有精確匹配，檢查經銷商是否存在
+            dealer_rows = self.by_dealer.get(dealer_code)
+            if dealer_rows:
+                return f"組合代碼 '{query_code}' 不存在。\n經銷商 {dealer_code} ({dealer_rows[0][1]}) 沒有營業所 {site_code}。"
+            return f"組合代碼 '{query_code}' 不存在。\n經銷商代碼 {dealer_code} 不存在。"
+
+        # 單一代碼查詢：同時搜尋經銷商代碼和營業所代碼
+        results = []
+        for dealer_code, dealer_name, site_code, site_name in self.by_dealer.get(query_code, []):
+            results.append(f"經銷商 {query_code} ({dealer_name}) - 營業所 {site_code} ({site_name})")
+        for dealer_code, dealer_name, site_code, site_name in self.by_site.get(query_code, []):
+            results.append(f"營業所 {query_code} ({site_name}) - 屬於經銷商 {dealer_code} ({dealer_name})")
+
+        if results:
+            return "找到以下映射資訊:\n" + "\n".join(results)
+        return f"找不到代碼 '{query_code}' 的對應資訊。請確認代碼是否正確。"
+
+    def lookup_many(self, query_codes: Iterable[str]) -> Dict[str, str]:
+        """一次查詢多個代碼，回傳 {代碼: 映射資訊}"""
+        self._ensure_loaded()
+        return {str(code): self.lookup(code) for code in query_codes}
+
+    def resolve_name(self, name: str, limit: int = 5) -> List[Dict]:
+        """
+        以 n-gram 比對經銷商名稱與營業所名稱（可同時包含兩者，如「國都新莊」），
+        回傳依相似度排序的候選列，每列含代碼、名稱與分數。
+        """
+        self._ensure_loaded()
+        query = char_ngrams(name)
+        if not query:
+            return []
+
+        candidates = set()
+        for gram in query:
+            candidates |= self.dealer_grams.get(gram, set())
+            candidates |= self.site_grams.get(gram, set())
+
+        scored = []
+        for i in candidates:
+            dealer_grams, site_grams = self._row_grams[i]
+            # 名稱被查詢字串涵蓋的比例（查詢可能同時寫了經銷商與營業所）
+            dealer_score = len(dealer_grams & query) / len(dealer_grams) if dealer_grams else 0.0
+            site_score = len(site_grams & query) / len(site_grams) if site_grams else 0.0
+            # 查詢字串被名稱涵蓋的比例，用來區分「新莊」與「新莊北」這類名稱
+            precision = len((dealer_grams | site_grams) & query) / len(query)
+            scored.append((site_score + 0.5 * dealer_score + 0.5 * precision, dealer_score, site_score, i))
+
+        scored.sort(key=lambda item: (-item[0], item[3]))
+        results = []
+        for score, dealer_score, site_score, i in scored[:limit]:
+            dealer_code, dealer_name, site_code, site_name = self.rows[i]
+            results.append({
+                "經銷商代碼": dealer_code,
+                "經銷商名稱": dealer_name,
+                "營業所代碼": site_code,
+                "營業所名稱": site_name,
+                "score": round(score / 2.0, 3),
+                "match": "營業所" if site_score >= dealer_score else "經銷商",
+            })
+        return results
+
+
+# 全程序共用一份索引
+dealer_mapping = DealerMappingIndex()
@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import time
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, FunctionMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# ==================================== 1. 設定 ====================================
+# 每次模型呼叫的模擬延遲（毫秒），用來重現實際 API 的往返時間
+FAKE_LLM_LATENCY_MS = float(os.environ.get("FAKE_LLM_LATENCY_MS", "0"))
+# 自訂腳本（JSON 檔）：{"腳本名稱": [步驟, ...], ...}，未設定時使用 DEFAULT_SCRIPTS
+FAKE_LLM_SCRIPT = os.environ.get("FAKE_LLM_SCRIPT", "")
+
+# 每個步驟為一次模型回應：{"tool": 工具名稱, "args": {...}} 產生 function call，{"output": 文字} 為最終回答。
+# 模型依目前綁定的 functions 挑選第一個「所有工具都已綁定」的腳本：
+# 主 Agent 走 main（list_files → read_excel_file → analyze_dataframe），analyze_dataframe 內的 Pandas Agent 走 pandas。
+DEFAULT_SCRIPTS: Dict[str, List[Dict[str, Any]]] = {
+    "main": [
+        {"tool": "list_files", "args": {"file_extension": "xlsx"}},
+        {"tool": "read_excel_file", "args": {"filename": "MBIS實績_2025上半年.xlsx"}},
+        {"tool": "analyze_dataframe", "args": {"query": "請列出販賣台數前五名的車名"}},
+        {"output": "販賣台數前五名的車名如上表所示。"},
+    ],
+    "pandas": [
+        {"tool": "python_repl_ast", "args": {"query": "df[df['實績種類'] == '3D'].groupby('車名', observed=True)['台數'].sum().nlargest(5)"}},
+        {"output": "已依車名彙總販賣台數並列出前五名。"},
+    ],
+}
+
+
+def load_scripts(path: str = FAKE_LLM_SCRIPT) -> Dict[str, List[Dict[str, Any]]]:
+    if not path:
+        return DEFAULT_SCRIPTS
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# 主 Agent 的 prompt 以 ("ai", "{agent_scratchpad}") 放入中間步驟，訊息列表會被轉成字串，以其中的 FunctionMessage 計數
+RENDERED_FUNCTION_MESSAGE = re.compile(r"FunctionMessage\(content=")
+
+
+def _completed_steps(messages: List[BaseMessage]) -> int:
+    """已完成的工具呼叫數：FunctionMessage 訊息，或已轉成字串的中間步驟中的 FunctionMessage"""
+    count = 0
+    for message in messages:
+        if isinstance(message, FunctionMessage):
+            count += 1
+        elif isinstance(message, AIMessage) and isinstance(message.content, str):
+            count += len(RENDERED_FUNCTION_MESSAGE.findall(message.content))
+    return count
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗估 token 數（約 4 字元 1 個 token），讓 token 統計的流程也能離線執行"""
+    return max(1, len(text) // 4)
+
+
+# ==================================== 2. 腳本化的模型 ====================================
+class FakeLLMUsage:
+    """全程序的模擬呼叫統計：呼叫次數與模擬延遲總秒數，供基準測試扣除模型時間"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.latency_seconds = 0.0
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.latency_seconds += seconds
+
+
+fake_llm_usage = FakeLLMUsage()
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    依腳本回應的本機模型，取代 ChatOpenAI 執行完整的 Agent 迴圈（工具實際執行，只有模型回應是預先決定的）。
+    第幾個步驟由訊息中已完成的工具呼叫數決定，同一個模型可同時服務多個 Agent 與 session。
+    """
+
+    model_name: str = "fake"
+    latency_ms: float = FAKE_LLM_LATENCY_MS
+    scripts: Dict[str, List[Dict[str, Any]]] = DEFAULT_SCRIPTS
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "latency_ms": self.latency_ms}
+
+    def _select_script(self, functions: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        bound = {function["name"] for function in functions or []}
+        for steps in self.scripts.values():
+            if all(step["tool"] in bound for step in steps if "tool" in step):
+                return steps
+        raise ValueError(f"沒有適用於目前工具 {sorted(bound)} 的腳本")
+
+    def _respond(self, messages: List[BaseMessage], functions: Optional[List[Dict[str, Any]]]) -> ChatResult:
+        steps = self._select_script(functions)
+        index = _completed_steps(messages)
+        step = steps[min(index, len(steps) - 1)]
+        if "tool" in step and index < len(steps):
+            arguments = json.dumps(step.get("args", {}), ensure_ascii=False)
+            message = AIMessage(content="", additional_kwargs={"function_call": {"name": step["tool"], "arguments": arguments}})
+            completion = step["tool"] + arguments
+        else:
+            message = AIMessage(content=step.get("output", "完成。"))
+            completion = message.content
+        prompt_tokens = sum(_estimate_tokens(str(m.content)) for m in messages)
+        prompt_tokens += _estimate_tokens(json.dumps(functions or [], ensure_ascii=False))
+        completion_tokens = _estimate_tokens(completion)
+        message.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        # 模型名稱不在 OpenAI 價目表中，get_openai_callback 計入 token 但花費為 0
+        message.response_metadata = {"model_name": f"fake-{self.model_name}"}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        seconds = self.latency_ms / 1000
+        if seconds:
+            time.sleep(seconds)
+        fake_llm_usage.record(seconds)
+        return self._respond(messages, kwargs.get("functions"))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        seconds = self.latency_ms / 1000
+        if seconds:
+            await asyncio.sleep(seconds)
+        fake_llm_usage.record(seconds)
+        return self._respond(messages, kwargs.get("functions"))
+
+
+def get_fake_chat_model(model: str) -> ScriptedChatModel:
+    # cache=False：不讀寫全域的 LLM 呼叫快取，腳本回應不會混入實際模型的記錄
+    return ScriptedChatModel(model_name=model, scripts=load_scripts(), cache=False)
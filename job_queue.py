@@ -0,0 +1,192 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from data_context import DataContext, use_data_context
+
+# ==================================== 1. 設定 ====================================
+QUERY_JOB_WORKERS = int(os.environ.get("QUERY_JOB_WORKERS", "4"))
+# 每位使用者（Streamlit session）同時排隊或執行中的查詢上限
+QUERY_JOB_MAX_PER_USER = int(os.environ.get("QUERY_JOB_MAX_PER_USER", "2"))
+# 全程序同時排隊或執行中的查詢上限，超過時直接拒絕而不是無限排隊
+QUERY_JOB_MAX_PENDING = int(os.environ.get("QUERY_JOB_MAX_PENDING", "32"))
+# 已結束的工作保留多久（秒）供下一次 rerun 取回結果
+QUERY_JOB_RETENTION = int(os.environ.get("QUERY_JOB_RETENTION", "3600"))
+
+QUEUED, RUNNING, DONE, ERROR, CANCELLED = "queued", "running", "done", "error", "cancelled"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class JobLimitError(RuntimeError):
+    """超過每位使用者或全域的同時查詢上限"""
+
+
+def _default_runner(question: str) -> AsyncIterator[Dict[str, Any]]:
+    from solution_combine import astream_query_agent
+    return astream_query_agent(question)
+
+
+# ==================================== 2. 查詢工作 ====================================
+class Job:
+    """一次背景查詢：保存狀態、串流事件與最終回應，供 Streamlit 每次 rerun 時取回"""
+
+    def __init__(self, user: str, question: str, context: Optional[DataContext] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.user = user
+        self.question = question
+        # 查詢執行期間工具使用的資料上下文（通常為送出查詢的 session 所有）
+        self.context = context
+        self.status = QUEUED
+        self.events: List[Dict[str, Any]] = []
+        self.response: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._cancel_requested = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._future = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "user": self.user,
+            "question": self.question,
+            "status": self.status,
+            "response": self.response,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "event_count": len(self.events),
+        }
+
+
+class JobQueue:
+    """
+    有上限的背景查詢佇列：固定數量的 worker 執行緒，每個工作在自己的事件迴圈中消費串流事件。
+    Streamlit 只負責送出工作與在 rerun 時讀取狀態，不會被長時間的 Agent 執行卡住。
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[str], AsyncIterator[Dict[str, Any]]] = _default_runner,
+        max_workers: int = QUERY_JOB_WORKERS,
+        max_per_user: int = QUERY_JOB_MAX_PER_USER,
+        max_pending: int = QUERY_JOB_MAX_PENDING,
+        retention_seconds: int = QUERY_JOB_RETENTION,
+    ):
+        self.runner = runner
+        self.max_per_user = max_per_user
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _purge(self) -> None:
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished is not None and now - job.finished > self.retention_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, user: str, question: str, context: Optional[DataContext] = None) -> str:
+        """送出查詢並回傳工作 ID；超過同時查詢上限時拋出 JobLimitError"""
+        with self._lock:
+            self._purge()
+            active = [job for job in self._jobs.values() if job.status in ACTIVE_STATES]
+            if len(active) >= self.max_pending:
+                raise JobLimitError(f"目前系統查詢量已滿（{self.max_pending} 筆），請稍後再試")
+            if sum(job.user == user for job in active) >= self.max_per_user:
+                raise JobLimitError(f"每位使用者最多同時執行 {self.max_per_user} 筆查詢，請等待目前的查詢完成")
+            job = Job(user, question, context)
+            self._jobs[job.id] = job
+            job._future = self._executor.submit(self._run, job)
+        return job.id
+
+    def _run(self, job: Job) -> None:
+        if job._cancel_requested.is_set():
+            job.status = CANCELLED
+            job.finished = time.time()
+            return
+        if job.context is not None:
+            with use_data_context(job.context):
+                self._execute(job)
+        else:
+            self._execute(job)
+
+    def _execute(self, job: Job) -> None:
+        job.status = RUNNING
+        job.started = time.time()
+
+        async def consume():
+            async for event in self.runner(job.question):
+                if event["type"] == "final":
+                    job.response = event["response"]
+                else:
+                    job.events.append(event)
+
+        loop = asyncio.new_event_loop()
+        job._loop = loop
+        try:
+            job._task = loop.create_task(consume())
+            if job._cancel_requested.is_set():
+                # 取消請求在事件迴圈建立前送達
+                job._task.cancel()
+            loop.run_until_complete(job._task)
+            job.status = DONE if job.response and "output" in job.response else ERROR
+            if job.status == ERROR:
+                job.error = "無法取得分析結果"
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+        except Exception as e:
+            job.status = ERROR
+            job.error = str(e)
+        finally:
+            job._loop = None
+            loop.close()
+            job.finished = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.get(job_id)
+        return job.snapshot() if job else None
+
+    def events(self, job_id: str, since: int = 0) -> List[Dict[str, Any]]:
+        """取得第 since 筆之後的串流事件（工具進度、回答 token）"""
+        job = self.get(job_id)
+        return list(job.events[since:]) if job else []
+
+    def cancel(self, job_id: str) -> bool:
+        """取消排隊中或執行中的查詢；執行中的查詢會在目前的 await 點中止"""
+        job = self.get(job_id)
+        if job is None or job.status not in ACTIVE_STATES:
+            return False
+        job._cancel_requested.set()
+        if job._future is not None and job._future.cancel():
+            job.status = CANCELLED
+            job.finished = time.time()
+            return True
+        loop, task = job._loop, job._task
+        if loop is not None and task is not None:
+            loop.call_soon_threadsafe(task.cancel)
+        return True
+
+    def active_jobs(self, user: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.snapshot() for job in jobs if job.status in ACTIVE_STATES and (user is None or job.user == user)]
+
+
+# 全程序共用一個佇列（所有 Streamlit session 共享 worker 與上限）
+job_queue = JobQueue()
@@ -0,0 +1,292 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from langchain.tools import tool
+from partition_store import month_window, read_period
+from target_table import TARGET_DIMS, TargetTable, get_target_table
+
+# ==================================== 1. 欄位與代碼定義 ====================================
+# 實績種類 27＝受訂、3D＝販賣；目標種類 1＝受訂、2＝販賣
+ACTUAL_KIND_CODES = {"受訂": "27", "販賣": "3D"}
+TARGET_KIND_CODES = {"受訂": 1, "販賣": 2}
+
+# 使用者常用的維度名稱 → 實績表欄位
+DIM_ALIASES = {
+    "經銷商": "經銷商代碼",
+    "據點": "營業所代碼",
+    "營業所": "營業所代碼",
+    "據點代碼": "營業所代碼",
+    "車種": "車名",
+    "車款": "車名",
+    "課別": "課別代碼",
+}
+
+
+def _resolve_dims(group_by: Optional[List[str]]) -> List[str]:
+    return [DIM_ALIASES.get(dim, dim) for dim in (group_by or [])]
+
+
+def _value_column(df: pd.DataFrame, kind: Optional[str]) -> str:
+    """實績值欄位：統一稱作台數；舊格式則依種類使用 銷售數 / 受訂數"""
+    if "台數" in df.columns:
+        return "台數"
+    if kind == "受訂" and "受訂數" in df.columns:
+        return "受訂數"
+    if "銷售數" in df.columns:
+        return "銷售數"
+    raise ValueError("實績表缺少 台數 / 銷售數 / 受訂數 欄位")
+
+
+def _apply_filters(df: pd.DataFrame, filters: Optional[Dict[str, List]]) -> pd.DataFrame:
+    """依 {欄位: [值, ...]} 篩選；數值欄位的篩選值會先轉成數字再比對"""
+    if not filters:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in filters.items():
+        column = DIM_ALIASES.get(column, column)
+        if column not in df.columns:
+            raise ValueError(f"找不到篩選欄位: {column}")
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        if pd.api.types.is_numeric_dtype(df[column].dtype):
+            values = pd.to_numeric(pd.Series(list(values)), errors="coerce").dropna().tolist()
+        else:
+            values = [str(value).strip() for value in values]
+        mask &= df[column].isin(values).to_numpy()
+    return df[mask]
+
+
+def _select_kind(df: pd.DataFrame, kind: Optional[str]) -> pd.DataFrame:
+    if not kind or "實績種類" not in df.columns:
+        return df
+    if kind not in ACTUAL_KIND_CODES:
+        raise ValueError(f"kind 必須是 {list(ACTUAL_KIND_CODES)} 之一")
+    return df[df["實績種類"] == ACTUAL_KIND_CODES[kind]]
+
+
+def _align_keys(left: pd.DataFrame, right: pd.DataFrame, keys: List[str]):
+    """兩表的代碼欄位型態可能不同（category / 整數），合併前統一成字串或 int64"""
+    left, right = left.copy(), right.copy()
+    for key in keys:
+        if pd.api.types.is_numeric_dtype(left[key].dtype) and pd.api.types.is_numeric_dtype(right[key].dtype):
+            left[key] = left[key].astype("int64")
+            right[key] = right[key].astype("int64")
+        else:
+            left[key] = left[key].astype(str)
+            right[key] = right[key].astype(str)
+    return left, right
+
+
+def _ratio(numerator: pd.Series, denominator: pd.Series) -> pd.Series:
+    """百分比，分母為 0 時回傳 NaN（不可比較）"""
+    denominator = denominator.astype("float64").replace(0, np.nan)
+    return (numerator.astype("float64") / denominator * 100).round(1)
+
+
+# ==================================== 2. 指標計算核心 ====================================
+def kpi_snapshot(
+    df_actual: pd.DataFrame,
+    as_of: str,
+    group_by: Optional[List[str]] = None,
+    kind: Optional[str] = "販賣",
+    targets: Optional[TargetTable] = None,
+    filters: Optional[Dict[str, List]] = None,
+) -> pd.DataFrame:
+    """
+    以 as_of 日期為基準，一次 groupby 算出各維度組合的：
+    本月台數、前月比、前月同期比、去年比、去年同期比、累計台數，以及（提供目標表時）推進率/達成率。
+    """
+    dims = _resolve_dims(group_by)
+    as_of_ts = pd.Timestamp(as_of).normalize()
+    df = _apply_filters(_select_kind(df_actual, kind), filters)
+    value_col = _value_column(df, kind)
+
+    dates = df["日期"]
+    values = pd.to_numeric(df[value_col], errors="coerce").fillna(0).to_numpy(dtype="int64")
+    month_start = as_of_ts.replace(day=1)
+    prev_month_start = month_start - pd.DateOffset(months=1)
+    prev_month_same_day = as_of_ts - pd.DateOffset(months=1)
+    last_year_month_start = month_start - pd.DateOffset(years=1)
+    last_year_month_end = last_year_month_start + pd.offsets.MonthEnd(0)
+    last_year_same_day = as_of_ts - pd.DateOffset(years=1)
+    year_start = as_of_ts.replace(month=1, day=1)
+
+    # 每個時間窗口是一個布林遮罩，乘上台數後只需一次 groupby 即可得到所有窗口的合計
+    windows = {
+        "本月台數": (dates >= month_start) & (dates <= as_of_ts),
+        "上月台數": (dates >= prev_month_start) & (dates < month_start),
+        "上月同期台數": (dates >= prev_month_start) & (dates <= prev_month_same_day),
+        "去年同月台數": (dates >= last_year_month_start) & (dates <= last_year_month_end),
+        "去年同期台數": (dates >= last_year_month_start) & (dates <= last_year_same_day),
+        "累計台數": (dates >= year_start) & (dates <= as_of_ts),
+    }
+    frame = pd.DataFrame({name: np.where(mask.to_numpy(), values, 0) for name, mask in windows.items()}, index=df.index)
+    if dims:
+        frame[dims] = df[dims]
+        result = frame.groupby(dims, observed=True).sum().reset_index()
+    else:
+        result = frame.sum().to_frame().T
+
+    result["前月比(%)"] = _ratio(result["本月台數"], result["上月台數"])
+    result["前月同期比(%)"] = _ratio(result["本月台數"], result["上月同期台數"])
+    result["去年比(%)"] = _ratio(result["本月台數"], result["去年同月台數"])
+    result["去年同期比(%)"] = _ratio(result["本月台數"], result["去年同期台數"])
+
+    if targets is not None:
+        result = _attach_targets(result, targets, dims, kind, as_of_ts, filters)
+
+    return result
+
+
+def _attach_targets(result, targets: TargetTable, dims, kind, as_of_ts, filters) -> pd.DataFrame:
+    target_dims = [dim for dim in dims if dim in TARGET_DIMS]
+    if len(target_dims) != len(dims):
+        # 目標表沒有的維度（如車名）無法計算推進率
+        result["目標台數"] = np.nan
+        return result
+
+    # 長格式目標表以年月為 index：當年 1 月至當月的累計目標是一次區間切片
+    month_key = as_of_ts.year * 100 + as_of_ts.month
+    rows = targets.year_to_date(month_key, TARGET_KIND_CODES[kind] if kind else None)
+    target_filters = {k: v for k, v in (filters or {}).items() if DIM_ALIASES.get(k, k) in TARGET_DIMS}
+    rows = _apply_filters(rows, target_filters)
+    rows = rows.assign(
+        當月目標=np.where(rows.index == month_key, rows["目標"], 0),
+        累計目標=rows["目標"],
+    )
+    if target_dims:
+        agg = rows.groupby(target_dims, observed=True)[["當月目標", "累計目標"]].sum().reset_index()
+        result, agg = _align_keys(result, agg, target_dims)
+        result = result.merge(agg, on=target_dims, how="left")
+    else:
+        result["當月目標"] = rows["當月目標"].sum()
+        result["累計目標"] = rows["累計目標"].sum()
+
+    month_finished = (as_of_ts + pd.Timedelta(days=1)).day == 1
+    rate_name = "達成率(%)" if month_finished else "推進率(%)"
+    result[rate_name] = _ratio(result["本月台數"], result["當月目標"])
+    result["累計達成率(%)"] = _ratio(result["累計台數"], result["累計目標"])
+    return result
+
+
+def kpi_monthly(
+    df_actual: pd.DataFrame,
+    group_by: Optional[List[str]] = None,
+    kind: Optional[str] = "販賣",
+    filters: Optional[Dict[str, List]] = None,
+) -> pd.DataFrame:
+    """按月彙總台數，並以 groupby + shift 算出前月比、去年比與當年累計台數"""
+    dims = _resolve_dims(group_by)
+    df = _apply_filters(_select_kind(df_actual, kind), filters)
+    value_col = _value_column(df, kind)
+
+    frame = pd.DataFrame({
+        "年月": df["日期"].dt.to_period("M"),
+        "台數": pd.to_numeric(df[value_col], errors="coerce").fillna(0).astype("int64"),
+    })
+    if dims:
+        frame[dims] = df[dims]
+    monthly = frame.groupby(dims + ["年月"], observed=True)["台數"].sum()
+
+    # 補齊缺月（該月 0 台），shift 才會對到正確的月份
+    if len(monthly):
+        months = pd.period_range(monthly.index.get_level_values("年月").min(), monthly.index.get_level_values("年月").max(), freq="M")
+        if dims:
+            keys = monthly.reset_index()[dims].drop_duplicates()
+            full_index = pd.MultiIndex.from_frame(keys.merge(pd.DataFrame({"年月": months}), how="cross"))
+        else:
+            full_index = pd.Index(months, name="年月")
+        monthly = monthly.reindex(full_index, fill_value=0)
+
+    result = monthly.reset_index()
+    grouped = result.groupby(dims, observed=True)["台數"] if dims else result["台數"]
+    result["上月台數"] = grouped.shift(1)
+    result["去年同月台數"] = grouped.shift(12)
+    result["前月比(%)"] = _ratio(result["台數"], result["上月台數"])
+    result["去年比(%)"] = _ratio(result["台數"], result["去年同月台數"])
+    year = result["年月"].dt.year
+    result["累計台數"] = result.groupby(dims + [year], observed=True)["台數"].cumsum() if dims else result.groupby(year)["台數"].cumsum()
+    result["年月"] = result["年月"].astype(str)
+    return result
+
+
+# ==================================== 3. LangChain 工具 ====================================
+MAX_RESULT_ROWS = 200
+
+
+def _get_frame(key: str, start: Optional[int] = None, end: Optional[int] = None) -> pd.DataFrame:
+    """
+    取得目前 session 中 filename::sheet 對應的 DataFrame（尚未載入時由共用的解析結果取得）；
+    store::actuals 只讀取 start～end（YYYYMM）的月分區。
+    """
+    return read_period(key, start, end)
+
+
+def _to_records(df: pd.DataFrame) -> Dict:
+    rows = df.replace({np.nan: None}).head(MAX_RESULT_ROWS)
+    return {
+        "total_rows": int(len(df)),
+        "truncated": len(df) > MAX_RESULT_ROWS,
+        "rows": rows.to_dict(orient="records"),
+    }
+
+
+@tool
+def compute_sales_kpis(
+    actual_key: str,
+    as_of_date: str,
+    group_by: Optional[List[str]] = None,
+    kind: str = "販賣",
+    target_key: Optional[str] = None,
+    filters: Optional[Dict[str, List[str]]] = None,
+) -> Dict:
+    """
+    計算截至 as_of_date（YYYY-MM-DD）的業務指標：本月台數、前月比、前月同期比、去年比、去年同期比、累計台數；
+    提供 target_key 時另算推進率（當月進行中）或達成率（已結束月份）與累計達成率。
+    actual_key / target_key 為 filename::sheet 或 store::actuals / store::targets（只讀取需要的月份）；group_by 可為 經銷商代碼、營業所代碼、車名、廠牌、課別代碼 的任意組合（空白表示大盤）；
+    kind 為 販賣 或 受訂；filters 如 {"經銷商代碼": ["A"], "廠牌": ["TOYOTA"]}。
+    """
+    try:
+        # 只需要去年同月至 as_of 當月的實績，以及當年 1 月至當月的目標
+        as_of = pd.Timestamp(as_of_date)
+        start, end = month_window(as_of, 12)
+        targets = get_target_table(target_key, as_of.year * 100 + 1, end) if target_key else None
+        result = kpi_snapshot(_get_frame(actual_key, start, end), as_of_date, group_by, kind, targets, filters)
+        return _to_records(result)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@tool
+def compute_monthly_kpis(
+    actual_key: str,
+    group_by: Optional[List[str]] = None,
+    kind: str = "販賣",
+    filters: Optional[Dict[str, List[str]]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Dict:
+    """
+    按月彙總實績台數，並計算每月的前月比、去年比與當年累計台數。
+    參數格式同 compute_sales_kpis；date_from / date_to（YYYY-MM）限定輸出的月份區間，空白表示全部。
+    適合回答月趨勢、各月前月比等問題。
+    """
+    try:
+        start = end = None
+        if date_from:
+            # 去年比需要往前 12 個月的資料；累計台數需要當年 1 月起的資料
+            start = month_window(pd.Timestamp(date_from), 12)[0]
+        if date_to:
+            end = month_window(pd.Timestamp(date_to), 0)[1]
+        result = kpi_monthly(_get_frame(actual_key, start, end), group_by, kind, filters)
+        # 只有 store:: 會依時間條件讀取分區；工作表回傳整張表，兩端都要在輸出時篩選
+        if date_from:
+            result = result[result["年月"] >= pd.Timestamp(date_from).strftime("%Y-%m")].reset_index(drop=True)
+        if date_to:
+            result = result[result["年月"] <= pd.Timestamp(date_to).strftime("%Y-%m")].reset_index(drop=True)
+        return _to_records(result)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+kpi_tools = [compute_sales_kpis, compute_monthly_kpis]
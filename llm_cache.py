@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Any, Optional
+from langchain.globals import get_llm_cache, set_llm_cache
+from langchain_community.cache import SQLiteCache
+from data_cache import CACHE_DIR
+
+# ==================================== 1. 設定 ====================================
+# off：不快取；readwrite：命中時直接回傳，未命中時呼叫 API 並記錄；
+# replay：只使用已記錄的回應，未命中時拋出 LLMCacheMiss，完全不連網
+LLM_CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "readwrite")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(CACHE_DIR, "llm_calls.sqlite"))
+
+# 每次呼叫都不同、與回應內容無關的訊息欄位，計算 key 前移除
+VOLATILE_MESSAGE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+
+class LLMCacheMiss(RuntimeError):
+    """replay 模式下找不到已記錄的 LLM 回應"""
+
+
+def _strip_volatile(node: Any) -> Any:
+    if isinstance(node, dict):
+        return {
+            key: _strip_volatile(value)
+            for key, value in node.items()
+            if key not in VOLATILE_MESSAGE_FIELDS
+        }
+    if isinstance(node, list):
+        return [_strip_volatile(value) for value in node]
+    return node
+
+
+def normalize_prompt(prompt: str) -> str:
+    """序列化訊息列表的正規形式：移除訊息 id 與 token 用量等欄位，key 排序"""
+    try:
+        return json.dumps(_strip_volatile(json.loads(prompt)), ensure_ascii=False, sort_keys=True)
+    except ValueError:
+        return prompt
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ==================================== 2. SQLite 呼叫快取 ====================================
+class LLMCallCache(SQLiteCache):
+    """
+    LLM 單次呼叫的 SQLite 快取。key 為（正規化訊息, 模型設定 + 呼叫參數）的 sha256，
+    呼叫參數包含 Agent 綁定的 functions schema，因此工具集合改變時不會誤用舊回應。
+    """
+
+    def __init__(self, database_path: str = LLM_CACHE_PATH, replay: bool = False):
+        os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+        super().__init__(database_path)
+        self.database_path = database_path
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, prompt: str, llm_string: str):
+        result = super().lookup(_digest(normalize_prompt(prompt)), _digest(llm_string))
+        if result is None:
+            self.misses += 1
+            if self.replay:
+                raise LLMCacheMiss(f"replay 模式下找不到已記錄的 LLM 回應（{self.database_path}），請先以 readwrite 模式執行一次")
+        else:
+            self.hits += 1
+        return result
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        if self.replay:
+            return
+        super().update(_digest(normalize_prompt(prompt)), _digest(llm_string), return_val)
+
+
+def route_through_cache(executor):
+    """
+    AgentExecutor 預設以 .stream() 呼叫模型，這條路徑不會查詢 LLM 快取；
+    改為 invoke 後每一步都會先查快取（在 astream_events 之下仍會逐 token 串流）。
+    """
+    if hasattr(executor.agent, "stream_runnable"):
+        executor.agent.stream_runnable = False
+    return executor
+
+
+_install_lock = threading.Lock()
+
+
+def install_llm_cache(mode: Optional[str] = None) -> Optional[LLMCallCache]:
+    """
+    設定全域 LLM 快取，所有未指定 cache 參數的 ChatOpenAI 都會使用。
+    各模組在建立 ChatOpenAI 前呼叫；重複呼叫時沿用既有的快取。
+    """
+    mode = (mode or LLM_CACHE_MODE).lower()
+    with _install_lock:
+        current = get_llm_cache()
+        if mode == "off":
+            return None
+        if isinstance(current, LLMCallCache) and current.replay == (mode == "replay"):
+            return current
+        if mode == "replay":
+            # 不會實際呼叫 API，ChatOpenAI 建構時只需要一個佔位金鑰
+            os.environ.setdefault("OPENAI_API_KEY", "sk-replay")
+        cache = LLMCallCache(LLM_CACHE_PATH, replay=(mode == "replay"))
+        set_llm_cache(cache)
+        return cache
@@ -0,0 +1,62 @@
+import os
+from functools import lru_cache
+from typing import Any, List
+
+# ==================================== 1. 設定 ====================================
+# 各流程使用的模型
+GENERAL_MODEL = "gpt-4o-2024-11-20"
+COMBINE_MODEL = "gpt-4.1"
+# 模型後端：openai（預設）或 fake（fake_llm.py 的腳本化本機模型，不需 API 金鑰，供離線量測 Agent 迴圈的非 LLM 開銷）
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "openai").lower()
+
+
+def ensure_api_key() -> None:
+    """確保 API 金鑰已設定：環境變數優先，其次讀取本地 secret_key 檔案"""
+    if not os.environ.get("OPENAI_API_KEY"):
+        with open("secret_key", "r", encoding="utf-8") as f:
+            os.environ["OPENAI_API_KEY"] = f.read().strip()
+
+
+# ==================================== 2. 延遲建立的模型與 Agent ====================================
+@lru_cache(maxsize=None)
+def get_chat_model(model: str, temperature: float = 0):
+    """
+    取得指定模型的 ChatOpenAI（同一模型全程序共用一個 client）。
+    第一次呼叫時才載入 langchain_openai、設定 LLM 呼叫快取並確認 API 金鑰，import 本模組不會有任何副作用。
+    LLM_BACKEND=fake 時改為回傳依腳本回應的本機模型。
+    """
+    if LLM_BACKEND == "fake":
+        from fake_llm import get_fake_chat_model
+        return get_fake_chat_model(model)
+
+    from llm_cache import install_llm_cache
+
+    # LLM 呼叫快取（SQLite）；須在建立 ChatOpenAI 前設定，replay 模式下不需要真正的 API 金鑰
+    install_llm_cache()
+    ensure_api_key()
+
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(temperature=temperature, model=model)
+
+
+def build_agent_executor(llm, tools: List[Any], system_message: str):
+    """以系統訊息與工具建立 OpenAI Functions Agent；各模組以 lru_cache 包裝，只在第一次使用時建立"""
+    from langchain.agents import AgentExecutor, create_openai_functions_agent
+    from langchain.prompts import ChatPromptTemplate
+    from llm_cache import route_through_cache
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system_message),
+        ("human", "{input}"),
+        ("ai", "{agent_scratchpad}")
+        # LangChain 的 Agent 系統預期你的 PromptTemplate 裡會有一個叫 agent_scratchpad 的變數，
+        # 用來記錄 Agent 歷史的 intermediate steps（例如工具調用記錄、思考過程等）。
+    ])
+    agent = create_openai_functions_agent(llm, tools, prompt)
+    return route_through_cache(AgentExecutor(
+        agent=agent,
+        tools=tools,
+        verbose=True,
+        handle_parsing_errors=True,
+        return_intermediate_steps=True  # invoke() 的同名參數不會生效，須設定在 AgentExecutor 上
+    ))
@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from langchain.tools import tool
+from data_context import get_data_context
+from data_catalog import STORE_PREFIX
+from kpi_engine import DIM_ALIASES, ACTUAL_KIND_CODES
+
+# ==================================== 1. 設定 ====================================
+# 立方體維度（依序）與可彙總的實績值欄位
+CUBE_DIMS = ["日期", "廠牌", "經銷商代碼", "營業所代碼", "車名", "實績種類"]
+CUBE_MEASURES = ["台數", "銷售數", "受訂數"]
+
+# 預先彙總的層級：據點、經銷商、大盤（皆保留日期與實績種類）
+ROLLUPS = {
+    "據點": ["日期", "經銷商代碼", "營業所代碼", "實績種類"],
+    "經銷商": ["日期", "經銷商代碼", "實績種類"],
+    "大盤": ["日期", "實績種類"],
+}
+
+# 由日期衍生的維度
+MONTH_DIM = "月份"
+
+
+def _code_dtype(size: int) -> str:
+    return "int16" if size < 2 ** 15 else "int32"
+
+
+# ==================================== 2. 彙總立方體 ====================================
+class SalesCube:
+    """
+    實績資料的預彙總立方體：維度以整數編碼（字典排序，日期代碼即時間順序），
+    保存最細粒度的 base 彙總以及 據點／經銷商／大盤 三個 rollup。
+    查詢時挑選能涵蓋所需維度的最小 cuboid，不需掃描原始資料列。
+    """
+
+    def __init__(self, dims: List[str], measures: List[str], dictionaries: Dict[str, pd.Index], cuboids: Dict[str, pd.DataFrame]):
+        self.dims = dims
+        self.measures = measures
+        self.dictionaries = dictionaries
+        self.cuboids = cuboids
+        self._months: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "SalesCube":
+        dims = [dim for dim in CUBE_DIMS if dim in df.columns]
+        measures = [m for m in CUBE_MEASURES if m in df.columns]
+        if "日期" not in dims or not measures:
+            raise ValueError("建立彙總立方體需要 日期 與 台數/銷售數/受訂數 欄位")
+
+        dictionaries: Dict[str, pd.Index] = {}
+        columns = {}
+        for dim in dims:
+            codes, uniques = pd.factorize(df[dim], sort=True)
+            dictionaries[dim] = pd.Index(uniques)
+            columns[dim] = codes.astype(_code_dtype(len(uniques)))
+        for measure in measures:
+            columns[measure] = pd.to_numeric(df[measure], errors="coerce").fillna(0).to_numpy(dtype="int64")
+
+        cube = cls(dims, measures, dictionaries, {})
+        cube._materialize(pd.DataFrame(columns))
+        return cube
+
+    def _materialize(self, coded: pd.DataFrame) -> None:
+        base = coded.groupby(self.dims, sort=False)[self.measures].sum().reset_index()
+        self.cuboids = {"base": base}
+        for name, rollup_dims in ROLLUPS.items():
+            rollup_dims = [dim for dim in rollup_dims if dim in self.dims]
+            self.cuboids[name] = base.groupby(rollup_dims, sort=False)[self.measures].sum().reset_index()
+
+    def append(self, df: pd.DataFrame) -> None:
+        """
+        加入新的實績列（如每日增量）：只對新增列編碼與彙總，再接到各 cuboid 之後，成本與新增列數成正比。
+        cuboid 因此可能出現重複的維度組合；查詢一律 groupby 加總，結果不受影響。
+        """
+        missing = [col for col in self.dims + self.measures if col not in df.columns]
+        if missing:
+            raise ValueError(f"新增資料缺少立方體欄位: {missing}")
+        columns = {dim: self._extend_dictionary(dim, df[dim]) for dim in self.dims}
+        for measure in self.measures:
+            columns[measure] = pd.to_numeric(df[measure], errors="coerce").fillna(0).to_numpy(dtype="int64")
+
+        base = pd.DataFrame(columns).groupby(self.dims, sort=False)[self.measures].sum().reset_index()
+        self.cuboids["base"] = pd.concat([self.cuboids["base"], base], ignore_index=True)
+        for name, rollup_dims in ROLLUPS.items():
+            rollup_dims = [dim for dim in rollup_dims if dim in self.dims]
+            rollup = base.groupby(rollup_dims, sort=False)[self.measures].sum().reset_index()
+            self.cuboids[name] = pd.concat([self.cuboids[name], rollup], ignore_index=True)
+
+    def _extend_dictionary(self, dim: str, values: pd.Series) -> np.ndarray:
+        """把新值加入維度字典並回傳編碼；日期字典須維持排序，新日期早於既有日期時重新對應既有代碼"""
+        dictionary = self.dictionaries[dim]
+        if isinstance(dictionary, pd.CategoricalIndex):
+            dictionary = pd.Index(np.asarray(dictionary))
+        new_values = pd.Index(pd.unique(values.dropna())).difference(dictionary)
+        if len(new_values):
+            extended = dictionary.append(new_values)
+            if dim == "日期" and not extended.is_monotonic_increasing:
+                extended = extended.sort_values()
+                remap = np.append(extended.get_indexer(dictionary), -1)
+                for cuboid in self.cuboids.values():
+                    if dim in cuboid.columns:
+                        cuboid[dim] = remap[cuboid[dim].to_numpy()].astype(_code_dtype(len(extended)))
+            dictionary = extended
+            if dim == "日期":
+                self._months = None
+        self.dictionaries[dim] = dictionary
+        return dictionary.get_indexer(values).astype(_code_dtype(len(dictionary)))
+
+    def _month_lookup(self) -> np.ndarray:
+        """日期代碼 → 月份字串；最後多放一個 None，讓缺日期的代碼 -1 對應到缺值"""
+        if self._months is None:
+            months = self.dictionaries["日期"].to_period("M").astype(str).to_numpy()
+            self._months = np.append(months, None)
+        return self._months
+
+    def describe(self) -> Dict[str, int]:
+        """每個 cuboid 的列數"""
+        return {name: int(len(cuboid)) for name, cuboid in self.cuboids.items()}
+
+    def _encode(self, dim: str, values) -> np.ndarray:
+        dictionary = self.dictionaries[dim]
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        if dim == "實績種類":
+            values = [ACTUAL_KIND_CODES.get(str(v).strip(), v) for v in values]
+        if pd.api.types.is_numeric_dtype(dictionary.dtype):
+            values = pd.to_numeric(pd.Series(list(values)), errors="coerce").dropna().tolist()
+        elif pd.api.types.is_datetime64_any_dtype(dictionary.dtype):
+            values = pd.to_datetime(pd.Series(list(values)), errors="coerce").dropna().tolist()
+        else:
+            values = [str(v).strip() for v in values]
+        codes = dictionary.get_indexer(values)
+        return codes[codes >= 0]
+
+    def query(
+        self,
+        group_by: Optional[List[str]] = None,
+        measure: Optional[str] = None,
+        filters: Optional[Dict[str, List]] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        top_n: Optional[int] = None,
+        ascending: bool = False,
+    ) -> pd.DataFrame:
+        """
+        對立方體做 group-by / sum / 排名。group_by 可使用 月份 與任何維度（含別名 據點、車種…），
+        filters 為 {維度: [值, ...]}，date_from/date_to 為 YYYY-MM-DD（含頭尾）。
+        """
+        group_by = [DIM_ALIASES.get(dim, dim) for dim in (group_by or [])]
+        filters = {DIM_ALIASES.get(dim, dim): values for dim, values in (filters or {}).items()}
+        measure = measure or self.measures[0]
+        if measure not in self.measures:
+            raise ValueError(f"measure 必須是 {self.measures} 之一")
+
+        needed = {dim for dim in group_by if dim != MONTH_DIM} | set(filters)
+        if MONTH_DIM in group_by or date_from or date_to:
+            needed.add("日期")
+        unknown = needed - set(self.dims)
+        if unknown:
+            raise ValueError(f"立方體沒有這些維度: {sorted(unknown)}；可用維度: {self.dims + [MONTH_DIM]}")
+
+        # 挑選涵蓋所需維度、列數最少的 cuboid
+        candidates = [
+            cuboid for name, cuboid in self.cuboids.items()
+            if needed <= set(self.dims if name == "base" else ROLLUPS[name])
+        ]
+        cuboid = min(candidates, key=len)
+
+        mask = np.ones(len(cuboid), dtype=bool)
+        for dim, values in filters.items():
+            mask &= np.isin(cuboid[dim].to_numpy(), self._encode(dim, values))
+        if date_from or date_to:
+            days = self.dictionaries["日期"]
+            start = days.searchsorted(pd.Timestamp(date_from)) if date_from else 0
+            end = days.searchsorted(pd.Timestamp(date_to), side="right") if date_to else len(days)
+            date_codes = cuboid["日期"].to_numpy()
+            mask &= (date_codes >= start) & (date_codes < end)
+        selected = cuboid[mask]
+
+        keys = {}
+        for dim in group_by:
+            if dim == MONTH_DIM:
+                keys[MONTH_DIM] = self._month_lookup()[selected["日期"].to_numpy()]
+            else:
+                keys[dim] = selected[dim].to_numpy()
+
+        if keys:
+            grouped = pd.DataFrame(keys).assign(**{measure: selected[measure].to_numpy()})
+            result = grouped.groupby(list(keys), sort=False)[measure].sum().reset_index()
+            for dim in group_by:
+                if dim != MONTH_DIM:
+                    result[dim] = self.dictionaries[dim].take(result[dim].to_numpy(), allow_fill=True, fill_value=None)
+        else:
+            result = pd.DataFrame({measure: [int(selected[measure].sum())]})
+
+        result = result.sort_values(measure, ascending=ascending, kind="stable").reset_index(drop=True)
+        result.insert(0, "排名", np.arange(1, len(result) + 1))
+        if top_n:
+            result = result.head(int(top_n))
+        return result
+
+
+# ==================================== 3. LangChain 工具 ====================================
+def get_cube(key: str) -> SalesCube:
+    """取得目前 session 中 filename::sheet（或 store::資料集）的立方體；尚未建立時由已載入的資料或共用的解析結果建立"""
+    if key.startswith(STORE_PREFIX):
+        # 分區資料集的立方體由所有 session 共用，每日增量匯入時已增量更新
+        from partition_store import get_store
+        return get_store(key[len(STORE_PREFIX):]).cube()
+
+    context = get_data_context()
+    cubes, dataframes = context.cubes, context.frames
+    # 來源檔案已被覆蓋時先清除舊的立方體
+    dataframes.refresh(key)
+    if key not in cubes:
+        if key not in dataframes:
+            raise ValueError(f"找不到資料集 {key}，請先使用 load_excel_file 載入")
+        cubes[key] = SalesCube.from_frame(dataframes[key])
+    return cubes[key]
+
+
+@tool
+def query_sales_cube(
+    actual_key: str,
+    group_by: Optional[List[str]] = None,
+    measure: Optional[str] = None,
+    filters: Optional[Dict[str, List[str]]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    top_n: Optional[int] = None,
+    ascending: bool = False,
+) -> Dict:
+    """
+    從預彙總立方體查詢實績台數的合計與排名（不掃描原始資料）。
+    actual_key 為 filename::sheet，或已匯入每日增量的 store::actuals；group_by 可為 月份、日期、廠牌、經銷商代碼、營業所代碼、車名、實績種類 的任意組合（空白表示大盤合計）；
+    filters 如 {"實績種類": ["販賣"], "廠牌": ["TOYOTA"]}（實績種類可填 販賣/受訂 或 3D/27）；
+    date_from/date_to 為 YYYY-MM-DD（含頭尾）；ascending=True 由少到多排序，top_n 取前 N 名。
+    """
+    try:
+        result = get_cube(actual_key).query(group_by, measure, filters, date_from, date_to, top_n, ascending)
+        result = result.astype({col: str for col in result.columns if pd.api.types.is_datetime64_any_dtype(result[col])})
+        return {"total_rows": int(len(result)), "rows": result.head(200).to_dict(orient="records")}
+    except Exception as e:
+        return {"error": str(e)}
@@ -0,0 +1,270 @@
+import io
+import os
+import re
+import ast
+import zlib
+import atexit
+import threading
+import multiprocessing
+import pandas as pd
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Optional
+from data_cache import CACHE_DIR
+
+# ==================================== 1. 設定 ====================================
+# Pandas Agent 的 Python 工具改在獨立的工作程序執行：process（預設）或 off（在主程序執行，與原本相同）
+PANDAS_SANDBOX = os.environ.get("PANDAS_SANDBOX", "process").lower()
+# 工作程序數、單次執行的時間上限（秒）、每個工作程序可額外使用的記憶體（MB，僅 Unix）
+SANDBOX_WORKERS = int(os.environ.get("SANDBOX_WORKERS", "2"))
+SANDBOX_TIMEOUT = float(os.environ.get("SANDBOX_TIMEOUT", "30"))
+SANDBOX_MEMORY_MB = int(os.environ.get("SANDBOX_MEMORY_MB", "2048"))
+# 回傳給 Agent 的輸出字元上限
+SANDBOX_MAX_OUTPUT_CHARS = 20000
+# 資料集匯出為 Arrow IPC 檔，工作程序以 memory map 讀取，多個工作程序共用作業系統的分頁快取
+SANDBOX_DIR = os.path.join(CACHE_DIR, "sandbox")
+# 每個工作程序保留的資料集命名空間數（含 Agent 先前定義的變數）
+SANDBOX_NAMESPACES = 4
+
+# 工具描述沿用 PythonAstREPLTool，Pandas Agent 的 prompt 不需修改
+PYTHON_TOOL_NAME = "python_repl_ast"
+PYTHON_TOOL_DESCRIPTION = (
+    "A Python shell. Use this to execute python commands. "
+    "Input should be a valid python command. "
+    "When using this tool, sometimes output is abbreviated - "
+    "make sure it does not look abbreviated before using it in your answer."
+)
+
+
+# ==================================== 2. 工作程序 ====================================
+def _sanitize(code: str) -> str:
+    """去除程式碼前後的反引號、空白與 python 字樣（同 PythonAstREPLTool）"""
+    code = re.sub(r"^(\s|`)*(?i:python)?\s*", "", code)
+    return re.sub(r"(\s|`)*$", "", code)
+
+
+def _run_code(code: str, namespace: Dict[str, Any]) -> str:
+    """執行程式碼：最後一個敘述若為運算式則回傳其值，否則回傳 print 的輸出（同 PythonAstREPLTool）"""
+    tree = ast.parse(_sanitize(code))
+    exec(ast.unparse(ast.Module(tree.body[:-1], type_ignores=[])), namespace)
+    last = ast.unparse(ast.Module(tree.body[-1:], type_ignores=[]))
+    buffer = io.StringIO()
+    try:
+        with redirect_stdout(buffer):
+            value = eval(last, namespace)
+    except Exception:
+        with redirect_stdout(buffer):
+            exec(last, namespace)
+        value = None
+    return buffer.getvalue() if value is None else str(value)
+
+
+def _limit_memory(memory_mb: int) -> None:
+    """以 RLIMIT_AS 限制工作程序的位址空間：載入套件後的用量再加上 memory_mb"""
+    try:
+        import resource
+    except ImportError:
+        # Windows 沒有 resource，只能依賴逾時中止
+        return
+    with open("/proc/self/statm") as f:
+        baseline = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    limit = baseline + memory_mb * 1024 ** 2
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _load_frame(path: str) -> pd.DataFrame:
+    import pyarrow as pa
+
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def _worker_main(connection, memory_mb: int) -> None:
+    """
+    工作程序主迴圈：接收 (資料集路徑, 程式碼)，在該資料集的命名空間中執行後回傳結果。
+    程式碼為 None 表示主程序已釋放該資料集：丟棄其命名空間，不回覆。
+    """
+    import numpy as np
+    import pyarrow  # noqa: F401  先載入，避免之後在記憶體限制下載入失敗
+
+    try:
+        _limit_memory(memory_mb)
+    except (OSError, ValueError):
+        pass
+
+    namespaces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    while True:
+        try:
+            path, code = connection.recv()
+        except EOFError:
+            return
+        if code is None:
+            namespaces.pop(path, None)
+            continue
+        try:
+            if path not in namespaces:
+                namespaces[path] = {"df": _load_frame(path), "pd": pd, "np": np}
+                while len(namespaces) > SANDBOX_NAMESPACES:
+                    namespaces.popitem(last=False)
+            namespaces.move_to_end(path)
+            result = {"output": _run_code(code, namespaces[path])}
+        except MemoryError:
+            namespaces.pop(path, None)
+            result = {"error": "memory_limit"}
+        except Exception as e:
+            result = {"output": f"{type(e).__name__}: {e}"}
+        connection.send(result)
+
+
+# ==================================== 3. 工作程序池 ====================================
+class SandboxWorker:
+    """單一工作程序；逾時或異常結束時強制終止並重新啟動"""
+
+    def __init__(self, memory_mb: int):
+        self.memory_mb = memory_mb
+        self.lock = threading.Lock()
+        self.restarts = 0
+        self._start()
+
+    def _start(self) -> None:
+        # spawn：不複製 Streamlit 主程序的執行緒與記憶體
+        context = multiprocessing.get_context("spawn")
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child, self.memory_mb), daemon=True)
+        self.process.start()
+        child.close()
+
+    def restart(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+        self.restarts += 1
+        self._start()
+
+    def run(self, path: str, code: str, timeout: float) -> Dict[str, Any]:
+        with self.lock:
+            try:
+                self.connection.send((path, code))
+                if not self.connection.poll(timeout):
+                    self.restart()
+                    return {"error": "timeout"}
+                result = self.connection.recv()
+            except (EOFError, OSError):
+                exitcode = self.process.exitcode
+                self.restart()
+                return {"error": "crashed", "exitcode": exitcode}
+            if result.get("error") == "memory_limit":
+                self.restart()
+            return result
+
+    def drop(self, path: str) -> None:
+        """通知工作程序丟棄資料集的命名空間（df 與 Agent 定義的變數）；工作程序已結束時不需處理"""
+        with self.lock:
+            if not self.process.is_alive():
+                return
+            try:
+                self.connection.send((path, None))
+            except (EOFError, OSError):
+                pass
+
+
+class PandasSandbox:
+    """
+    Pandas Agent 的程式碼執行池：資料集匯出為 Arrow IPC 檔供工作程序以 memory map 讀取，
+    同一資料集固定由同一個工作程序執行，Agent 先前定義的變數在後續呼叫仍可使用。
+    """
+
+    def __init__(self, workers: int = SANDBOX_WORKERS, timeout: float = SANDBOX_TIMEOUT, memory_mb: int = SANDBOX_MEMORY_MB):
+        self.size = max(1, workers)
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self._workers: List[Optional[SandboxWorker]] = [None] * self.size
+        self._exports = set()
+        self._lock = threading.Lock()
+
+    def _worker(self, path: str, create: bool = True) -> Optional[SandboxWorker]:
+        """負責此資料集的工作程序（依路徑固定分配）；create=False 時尚未啟動則回傳 None"""
+        index = zlib.crc32(path.encode("utf-8")) % self.size
+        with self._lock:
+            if self._workers[index] is None and create:
+                self._workers[index] = SandboxWorker(self.memory_mb)
+            return self._workers[index]
+
+    def export(self, df: pd.DataFrame, name: str) -> str:
+        """將資料集寫成 Arrow IPC 檔（未壓縮，可 memory map），回傳路徑"""
+        import pyarrow as pa
+
+        os.makedirs(SANDBOX_DIR, exist_ok=True)
+        path = os.path.join(SANDBOX_DIR, f"{os.getpid()}_{name}.arrow")
+        tmp_path = f"{path}.tmp"
+        table = pa.Table.from_pandas(df, preserve_index=not isinstance(df.index, pd.RangeIndex))
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+        self._exports.add(path)
+        return path
+
+    def release(self, path: str) -> None:
+        """釋放資料集：通知負責的工作程序丟棄命名空間，再刪除匯出檔"""
+        self._exports.discard(path)
+        worker = self._worker(path, create=False)
+        if worker is not None:
+            worker.drop(path)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def execute(self, path: str, code: str) -> Any:
+        """執行程式碼並回傳輸出；逾時、超過記憶體上限或程序異常時回傳結構化錯誤，Agent 可據以修正程式碼"""
+        result = self._worker(path).run(path, code, self.timeout)
+        error = result.get("error")
+        if error is None:
+            output = result["output"]
+            if len(output) > SANDBOX_MAX_OUTPUT_CHARS:
+                output = output[:SANDBOX_MAX_OUTPUT_CHARS] + f"\n...（輸出過長，已截斷至 {SANDBOX_MAX_OUTPUT_CHARS} 字元）"
+            return output
+        hints = {
+            "timeout": f"程式執行超過 {self.timeout:g} 秒，已中止。",
+            "memory_limit": f"程式使用的記憶體超過 {self.memory_mb} MB，已中止。",
+            "crashed": "執行程式的工作程序異常結束。",
+        }
+        return {
+            "error": error,
+            "message": hints[error] + "工作程序已重新啟動，先前定義的變數已清除（df 仍可使用）。",
+            "suggestion": "請改用向量化的 groupby / merge / 布林篩選，避免 iterrows、apply 逐列迴圈或未篩選的交叉 join，並先縮小資料範圍後再試一次。",
+        }
+
+    def shutdown(self) -> None:
+        """結束所有工作程序並刪除匯出的資料集檔案（程序結束時自動執行）"""
+        with self._lock:
+            for worker in self._workers:
+                if worker is not None:
+                    worker.process.kill()
+            self._workers = [None] * self.size
+        for path in list(self._exports):
+            self.release(path)
+
+
+def sandboxed_python_tool(df: pd.DataFrame, name: str):
+    """
+    建立取代 PythonAstREPLTool 的工具（名稱、描述、參數皆相同），程式碼在工作程序中對 df 執行。
+    回傳 (tool, 匯出的資料集路徑)；資料集不再使用時以 pandas_sandbox.release(path) 刪除匯出檔。
+    """
+    from langchain.tools import StructuredTool
+    from langchain_experimental.tools.python.tool import PythonInputs
+
+    path = pandas_sandbox.export(df, name)
+
+    def run(query: str) -> Any:
+        return pandas_sandbox.execute(path, query)
+
+    tool = StructuredTool.from_function(
+        func=run, name=PYTHON_TOOL_NAME, description=PYTHON_TOOL_DESCRIPTION, args_schema=PythonInputs,
+    )
+    return tool, path
+
+
+# 全程序共用的執行池；工作程序在第一次執行程式碼時才啟動
+pandas_sandbox = PandasSandbox()
+atexit.register(pandas_sandbox.shutdown)
@@ -0,0 +1,410 @@
+import os
+import sys
+import json
+import time
+import threading
+import pandas as pd
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from data_cache import CACHE_DIR, file_content_hash, load_sheet
+from data_catalog import STORE_PREFIX, frame_nbytes
+
+# ==================================== 1. 設定 ====================================
+# 分區資料目錄：<PARTITION_DIR>/<資料集>/year=YYYY/month=MM/part-NNNNN.parquet，另有 _manifest.json 記錄欄位與已匯入的來源
+PARTITION_DIR = os.environ.get("PARTITION_DIR", os.path.join(CACHE_DIR, "partitions"))
+# 每個資料集常駐記憶體的分區上限，超過時淘汰最久未使用的分區（需要時再從 Parquet 讀回）
+PARTITION_CACHE_MB = float(os.environ.get("PARTITION_CACHE_MB", "512"))
+
+# MBIS 實績與經銷商目標資料集；session 中以 store::actuals、store::targets 存取
+ACTUALS, TARGETS = "actuals", "targets"
+# 各資料集的分區欄位：實績依 日期 的年月分區，目標依長格式目標表的 年月（YYYYMM）分區
+PERIOD_COLUMNS = {ACTUALS: "日期", TARGETS: "年月"}
+# 第一次匯入增量前，以此半年檔建立分區
+ACTUALS_SEED_FILE = "MBIS實績_2025上半年.xlsx"
+
+
+class SchemaMismatchError(ValueError):
+    """增量資料的欄位或型態與既有資料不一致"""
+
+
+def _dtype_family(dtype) -> str:
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    if isinstance(dtype, pd.CategoricalDtype):
+        return "category"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "integer"
+    if pd.api.types.is_float_dtype(dtype):
+        return "float"
+    return "string"
+
+
+def _year_month(values: pd.Series) -> pd.Series:
+    """分區欄位 → YYYYMM：日期取年月，年月欄位直接使用"""
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values.dt.year * 100 + values.dt.month
+    return pd.to_numeric(values, errors="coerce")
+
+
+def _shift_month(year_month: int, months: int) -> int:
+    """YYYYMM 加減 months 個月"""
+    index = year_month // 100 * 12 + year_month % 100 - 1 + months
+    return index // 12 * 100 + index % 12 + 1
+
+
+# ==================================== 2. 分區儲存 ====================================
+class PartitionStore:
+    """
+    一個資料集的年／月分區儲存：每個月一個目錄（year=YYYY/month=MM），目錄內是 Parquet 片段。
+    新增資料只寫入該批資料所屬月份的新片段，並更新已載入的分區與彙總立方體，不重新讀取既有資料；
+    讀取時依時間條件只讀入需要的分區，常駐的分區總量超過 PARTITION_CACHE_MB 時淘汰最久未使用者。
+    """
+
+    def __init__(self, name: str, root: str = PARTITION_DIR, period_column: str = "日期", cache_mb: float = PARTITION_CACHE_MB):
+        self.name = name
+        self.path = os.path.join(root, name)
+        self.period_column = period_column
+        self.cache_bytes = int(cache_mb * 1024 ** 2)
+        self._lock = threading.RLock()
+        self._manifest = self._load_manifest()
+        # 已讀入記憶體的分區 {YYYYMM: [片段, ...]}（依使用順序）；未讀入的分區在第一次使用時才讀取
+        self._parts: "OrderedDict[int, List[pd.DataFrame]]" = OrderedDict()
+        self._frame: Optional[pd.DataFrame] = None
+        self._cube = None
+
+    # ---------- manifest ----------
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, "_manifest.json")
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {"version": 0, "columns": {}, "sources": {}, "partitions": {}}
+        # 舊版 manifest 只記錄整體日期區間：各分區的區間取整體區間與該月份的交集
+        date_range = manifest.pop("date_range", None)
+        for year_month, entry in manifest["partitions"].items():
+            if "range" not in entry and date_range:
+                first = pd.Timestamp(year=int(year_month) // 100, month=int(year_month) % 100, day=1)
+                last = first + pd.offsets.MonthEnd(0)
+                entry["range"] = [max(date_range[0], str(first.date())), min(date_range[1], str(last.date()))]
+        return manifest
+
+    def _save_manifest(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self._manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self._manifest_path)
+
+    @property
+    def version(self) -> int:
+        """每次新增資料後遞增，供資料目錄與答案快取判斷資料是否已更新"""
+        return self._manifest["version"]
+
+    @property
+    def columns(self) -> Dict[str, str]:
+        """欄位名稱 → 型態（第一次匯入的資料決定，之後的增量須一致）"""
+        return self._manifest["columns"]
+
+    def partitions(self, start: Optional[int] = None, end: Optional[int] = None) -> List[int]:
+        """已有資料的分區（YYYYMM），可指定 start～end（含頭尾）只列出時間條件需要的分區"""
+        return sorted(
+            year_month for year_month in map(int, self._manifest["partitions"])
+            if (start is None or year_month >= start) and (end is None or year_month <= end)
+        )
+
+    @property
+    def date_range(self) -> Optional[List[str]]:
+        ranges = [p["range"] for p in self._manifest["partitions"].values()]
+        return [min(r[0] for r in ranges), max(r[1] for r in ranges)] if ranges else None
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "rows": sum(p["rows"] for p in self._manifest["partitions"].values()),
+            "partitions": {year_month: p["rows"] for year_month, p in sorted(self._manifest["partitions"].items())},
+            "date_range": self.date_range,
+            "sources": len(self._manifest["sources"]),
+            "resident_partitions": len(self._parts),
+        }
+
+    # ---------- 驗證 ----------
+    def _conform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """檢查欄位與既有資料相同，並把各欄位轉成既有的型態；無法轉換時拋出 SchemaMismatchError"""
+        if self.period_column not in df.columns:
+            raise SchemaMismatchError(f"缺少分區欄位: {self.period_column}")
+        if not self.columns:
+            return df
+
+        missing = [col for col in self.columns if col not in df.columns]
+        extra = [col for col in df.columns if col not in self.columns]
+        if missing or extra:
+            raise SchemaMismatchError(f"欄位與既有資料不符：缺少 {missing}，多出 {extra}")
+
+        conformed = {}
+        for column, family in self.columns.items():
+            col = df[column]
+            if family == "datetime":
+                new_col = pd.to_datetime(col, errors="coerce")
+            elif family in ("integer", "float"):
+                new_col = pd.to_numeric(col, errors="coerce")
+            else:
+                new_col = col.astype(str).str.strip().where(col.notna()) if _dtype_family(col.dtype) != family else col
+                if family == "category":
+                    new_col = new_col.astype("category")
+            invalid = int((new_col.isna() & col.notna()).sum())
+            if invalid:
+                raise SchemaMismatchError(f"欄位 {column} 有 {invalid} 筆無法轉換為 {family} 的值")
+            if family == "integer" and new_col.isna().any():
+                raise SchemaMismatchError(f"欄位 {column} 有空值，無法存為整數")
+            conformed[column] = new_col.astype("int64") if family == "integer" and new_col.dtype.kind == "f" else new_col
+        return pd.DataFrame(conformed, index=df.index)
+
+    # ---------- 寫入 ----------
+    def _partition_dir(self, year_month: int) -> str:
+        return os.path.join(self.path, f"year={year_month // 100}", f"month={year_month % 100:02d}")
+
+    def _range(self, values: pd.Series) -> List[str]:
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            return [str(values.min().date()), str(values.max().date())]
+        return [str(int(values.min())), str(int(values.max()))]
+
+    def _check_overlap(self, periods: pd.Series, values: pd.Series) -> None:
+        """同一個月份內，新資料的日期區間與已匯入的資料重疊時拋出 SchemaMismatchError（可匯入更早年度的歷史資料）"""
+        for year_month, month_values in values.groupby(periods):
+            entry = self._manifest["partitions"].get(str(int(year_month)))
+            if entry is None:
+                continue
+            low, high = self._range(month_values)
+            if low <= entry["range"][1] and high >= entry["range"][0]:
+                raise SchemaMismatchError(
+                    f"新資料的日期 {low}～{high} 與已匯入的資料（{entry['range'][0]}～{entry['range'][1]}）重疊，"
+                    "請確認是否重複匯入；補登資料請使用 allow_overlap=True"
+                )
+
+    def _write_part(self, year_month: int, part: pd.DataFrame, replace: bool) -> None:
+        directory = self._partition_dir(year_month)
+        entry = self._manifest["partitions"].get(str(year_month))
+        if entry is not None and replace:
+            for name in entry["files"]:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+            entry = None
+        if entry is None:
+            entry = self._manifest["partitions"][str(year_month)] = {"rows": 0, "files": [], "range": self._range(part[self.period_column])}
+            self._parts.pop(year_month, None)
+
+        os.makedirs(directory, exist_ok=True)
+        filename = f"part-{len(entry['files']):05d}.parquet"
+        tmp_path = os.path.join(directory, f".{filename}.{os.getpid()}.tmp")
+        part.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(directory, filename))
+        low, high = self._range(part[self.period_column])
+        entry["files"].append(filename)
+        entry["rows"] += len(part)
+        entry["range"] = [min(low, entry["range"][0]), max(high, entry["range"][1])]
+        if year_month in self._parts:
+            self._parts[year_month].append(part)
+
+    def append(
+        self,
+        df: pd.DataFrame,
+        source: Optional[str] = None,
+        label: str = "",
+        allow_overlap: bool = False,
+        replace: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        新增一批已清理的資料（每日增量或更早年度的歷史資料），依月份寫入新的分區片段。
+        source 為來源識別（如檔案內容雜湊），同一來源只會匯入一次；
+        日期與已匯入的資料重疊時拋出 SchemaMismatchError（allow_overlap=True 時允許，如補登資料）。
+        replace=True 時，新資料涵蓋的月份整個取代既有分區（如修訂後的目標）。
+        """
+        with self._lock:
+            if source and source in self._manifest["sources"]:
+                return {"skipped": True, "reason": f"{label or source} 已匯入過", **self.describe()}
+
+            df = self._conform(df)
+            periods = _year_month(df[self.period_column])
+            if periods.isna().any():
+                raise SchemaMismatchError(f"{self.period_column} 有 {int(periods.isna().sum())} 筆空值或無法解析的值")
+            if df.empty:
+                return {"skipped": True, "reason": "沒有資料列", **self.describe()}
+            if not (allow_overlap or replace):
+                self._check_overlap(periods, df[self.period_column])
+
+            written = {}
+            for year_month, part in df.groupby(periods, sort=True):
+                self._write_part(int(year_month), part.reset_index(drop=True), replace)
+                written[int(year_month)] = len(part)
+
+            if not self.columns:
+                self._manifest["columns"] = {column: _dtype_family(df[column].dtype) for column in df.columns}
+            if source:
+                self._manifest["sources"][source] = {"label": label, "rows": len(df), "ingested_at": time.time()}
+            self._manifest["version"] += 1
+            self._save_manifest()
+
+            self._frame = None
+            if self._cube is not None:
+                if replace:
+                    self._cube = None
+                else:
+                    # 立方體只彙總新增的列
+                    self._cube.append(df)
+            self._evict()
+            return {"skipped": False, "appended_rows": int(len(df)), "written": written, **self.describe()}
+
+    # ---------- 讀取 ----------
+    def _load_partition(self, year_month: int) -> List[pd.DataFrame]:
+        if year_month in self._parts:
+            self._parts.move_to_end(year_month)
+        else:
+            directory = self._partition_dir(year_month)
+            files = self._manifest["partitions"][str(year_month)]["files"]
+            self._parts[year_month] = [pd.read_parquet(os.path.join(directory, name)) for name in files]
+        return self._parts[year_month]
+
+    def _evict(self, keep: Optional[set] = None) -> None:
+        """常駐分區超過上限時，依最久未使用順序移出記憶體（keep 為本次讀取需要的分區）"""
+        sizes = {year_month: sum(frame_nbytes(part) for part in parts) for year_month, parts in self._parts.items()}
+        total = sum(sizes.values())
+        for year_month in list(self._parts):
+            if total <= self.cache_bytes:
+                break
+            if keep and year_month in keep:
+                continue
+            total -= sizes[year_month]
+            del self._parts[year_month]
+
+    def memory_usage(self) -> int:
+        with self._lock:
+            return sum(frame_nbytes(part) for parts in self._parts.values() for part in parts)
+
+    def read(self, start: Optional[int] = None, end: Optional[int] = None) -> pd.DataFrame:
+        """
+        讀取 start～end（YYYYMM，含頭尾）分區的資料，未指定表示全部；只會讀入時間條件需要的分區。
+        全部資料的合併結果快取到下一次新增資料為止。
+        """
+        with self._lock:
+            whole = start is None and end is None
+            if whole and self._frame is not None:
+                return self._frame
+            months = self.partitions(start, end)
+            if not months and not self.partitions():
+                raise ValueError(f"資料集 {self.name} 尚未匯入任何資料")
+            parts = [part for year_month in months for part in self._load_partition(year_month)]
+            self._evict(keep=set(months))
+            if not parts:
+                # 時間條件內沒有分區：回傳欄位相同的空表
+                parts = [self._load_partition(self.partitions()[0])[0].iloc[:0]]
+            frame = pd.concat(parts, ignore_index=True)
+            # 各片段的 category 類別不同，合併後會變成 object，重新轉回 category
+            categories = [column for column, family in self.columns.items() if family == "category"]
+            frame = frame.astype({column: "category" for column in categories})
+            if whole:
+                self._frame = frame
+            return frame
+
+    def cube(self):
+        """資料集的預彙總立方體（所有 session 共用）；建立後新增資料只會增量彙總"""
+        from olap_cube import SalesCube
+
+        with self._lock:
+            if self._cube is None:
+                self._cube = SalesCube.from_frame(self.read())
+            return self._cube
+
+
+_stores: Dict[str, PartitionStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(name: str = ACTUALS) -> PartitionStore:
+    """取得資料集的分區儲存（全程序共用同一個實例）"""
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = PartitionStore(name, period_column=PERIOD_COLUMNS.get(name, "日期"))
+        return _stores[name]
+
+
+def store_versions() -> Dict[str, int]:
+    """已有資料的分區資料集與其版本 {store::名稱: 版本}，供答案快取判斷資料是否已更新"""
+    if not os.path.isdir(PARTITION_DIR):
+        return {}
+    names = sorted(name for name in os.listdir(PARTITION_DIR) if os.path.exists(os.path.join(PARTITION_DIR, name, "_manifest.json")))
+    return {f"{STORE_PREFIX}{name}": get_store(name).version for name in names}
+
+
+# ==================================== 3. 匯入 ====================================
+def ingest_file(filename: str, store: str = ACTUALS, sheet_name: Optional[str] = None, allow_overlap: bool = False) -> Dict[str, Any]:
+    """
+    匯入一個實績檔（每日增量或其他年度的歷史檔，格式同半年實績檔）。清理與型態壓縮沿用 load_sheet（依檔案內容雜湊快取），
+    以檔案內容雜湊作為來源識別，同一個檔案重複匯入會直接略過。
+    """
+    df = load_sheet(filename, sheet_name)
+    return get_store(store).append(df, source=file_content_hash(filename), label=os.path.basename(filename), allow_overlap=allow_overlap)
+
+
+def ingest_daily_actuals(filename: str, seed_file: str = ACTUALS_SEED_FILE) -> Dict[str, Any]:
+    """匯入每日實績增量；實績資料集還沒有資料時，先以半年實績檔建立分區"""
+    store = get_store(ACTUALS)
+    if not store.partitions() and os.path.abspath(filename) != os.path.abspath(seed_file) and os.path.exists(seed_file):
+        ingest_file(seed_file, ACTUALS)
+    return ingest_file(filename, ACTUALS)
+
+
+def ingest_targets(filename: str, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    匯入目標檔：先轉為長格式目標表（寬表格式的 X月目標 依檔名判斷年度），再依 年月 分區。
+    目標會修訂，檔案涵蓋的月份整個取代既有分區。
+    """
+    from target_table import TargetTable, infer_year
+
+    table = TargetTable.from_frame(load_sheet(filename, sheet_name), infer_year(filename))
+    return get_store(TARGETS).append(
+        table.frame.reset_index(), source=file_content_hash(filename), label=os.path.basename(filename), replace=True
+    )
+
+
+def ingest_any(filename: str) -> Dict[str, Any]:
+    """匯入任一年度的實績或目標檔：目標表（含 目標台數 / X月目標）進 store::targets，其餘視為實績進 store::actuals"""
+    from target_table import is_target_frame
+
+    if is_target_frame(load_sheet(filename)):
+        return {"store": f"{STORE_PREFIX}{TARGETS}", **ingest_targets(filename)}
+    return {"store": f"{STORE_PREFIX}{ACTUALS}", **ingest_daily_actuals(filename)}
+
+
+# ==================================== 4. 依時間條件讀取 ====================================
+def read_period(key: str, start: Optional[int] = None, end: Optional[int] = None) -> pd.DataFrame:
+    """
+    依時間條件取得資料：store::資料集 只讀取 start～end（YYYYMM）的分區；
+    其他 key（filename::sheet）為單一工作表，直接由目前 session 的資料目錄取得整張表，由呼叫端篩選。
+    """
+    if key.startswith(STORE_PREFIX):
+        return get_store(key[len(STORE_PREFIX):]).read(start, end)
+    from data_context import get_data_context
+
+    dataframes = get_data_context().frames
+    if key not in dataframes:
+        raise ValueError(f"找不到資料集 {key}，請先使用 load_excel_file 載入")
+    return dataframes[key]
+
+
+def month_window(as_of: pd.Timestamp, months_before: int) -> tuple:
+    """as_of 所在月份往前 months_before 個月至當月的 (start, end) YYYYMM"""
+    end = as_of.year * 100 + as_of.month
+    return _shift_month(end, -months_before), end
+
+
+if __name__ == "__main__":
+    # python partition_store.py 檔案.xlsx [...]：依序匯入每日實績增量、其他年度的實績或目標檔
+    for path in sys.argv[1:]:
+        print(path, ingest_any(path))
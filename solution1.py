@@ -1,25 +1,66 @@
 import os
+import threading
 import pandas as pd
 import glob
-from typing import List, Dict, Any, Optional
-from langchain.agents.agent_types import AgentType
-from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
-from langchain_openai import ChatOpenAI
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 from langchain.tools import tool
-from langchain.agents import AgentExecutor, create_openai_functions_agent
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema import SystemMessage
-from langchain.tools.render import format_tool_to_openai_function
-
-print("當前工作目錄是：", os.getcwd())
-
-# 確保 API 金鑰已設定
-if not os.environ.get("OPENAI_API_KEY"):
-    with open("secret_key", "r", encoding="utf-8") as f:
-        os.environ["OPENAI_API_KEY"] = f.read().strip()
-
-# 建立基本的語言模型
-llm = ChatOpenAI(temperature=0, model="gpt-4o-2024-11-20")
+from data_cache import list_sheet_names
+from data_context import get_data_context, shared_frames
+from llm_factory import GENERAL_MODEL, build_agent_executor, get_chat_model
+
+# Pandas Agent 池：key 為 (id(current_df), 資料版本)，同一份資料集的後續分析直接重用已建立的 Agent。
+# current_df 與版本存於各 session 的 DataContext，池本身由所有 session 共用。
+# 所有 Agent 共用同一個 ChatOpenAI，底層 HTTP 連線池保持溫熱；超過上限時淘汰最久未使用者。
+# Agent 產生的 pandas 程式碼在 pandas_sandbox 的工作程序中執行（逾時、記憶體上限、異常時重啟），不會拖住 Streamlit 主程序。
+PANDAS_AGENT_POOL_SIZE = int(os.environ.get("PANDAS_AGENT_POOL_SIZE", "8"))
+_pandas_agent_pool: "OrderedDict[Tuple[int, int], Tuple[pd.DataFrame, Any, Optional[str]]]" = OrderedDict()
+_pandas_agent_lock = threading.Lock()
+
+
+def get_pandas_agent(df: pd.DataFrame, version: int):
+    """取得（或建立）對應資料集的 Pandas Agent；池中同時保留 df 參照，避免 id 被重複使用"""
+    key = (id(df), version)
+    with _pandas_agent_lock:
+        entry = _pandas_agent_pool.get(key)
+        if entry is not None:
+            _pandas_agent_pool.move_to_end(key)
+            return entry[1]
+
+    from langchain.agents.agent_types import AgentType
+    from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
+    from llm_cache import route_through_cache
+    from pandas_sandbox import PANDAS_SANDBOX, pandas_sandbox, sandboxed_python_tool
+
+    # 主程序內執行 LLM 產生的程式碼時給完整複本，就地修改（.loc 指派、inplace=True）不會寫回共用資料；
+    # 沙箱模式下程式碼在工作程序中對 Arrow 檔載入的資料執行，主程序的 df 只用於建立 prompt
+    agent_df = df if PANDAS_SANDBOX == "process" else df.copy()
+    df_agent = route_through_cache(create_pandas_dataframe_agent(
+        get_chat_model(GENERAL_MODEL),  # 系統訊息已經寫在prompt了 這邊就不需要再寫 model_kwargs
+        agent_df,
+        verbose=True,
+        agent_type=AgentType.OPENAI_FUNCTIONS,
+        allow_dangerous_code=True
+    ))
+    path = None
+    if PANDAS_SANDBOX == "process":
+        # 以同名、同參數的工具取代主程序內的 PythonAstREPLTool，Agent 的 prompt 與 functions schema 不變
+        sandbox_tool, path = sandboxed_python_tool(df, f"{key[0]}_{key[1]}")
+        df_agent.tools = [sandbox_tool]
+
+    evicted = []
+    with _pandas_agent_lock:
+        _pandas_agent_pool[key] = (df, df_agent, path)
+        _pandas_agent_pool.move_to_end(key)
+        while len(_pandas_agent_pool) > PANDAS_AGENT_POOL_SIZE:
+            _, (_, _, evicted_path) = _pandas_agent_pool.popitem(last=False)
+            if evicted_path:
+                evicted.append(evicted_path)
+    # 釋放時要等負責的工作程序空出來才能通知它丟棄命名空間，不在池的鎖內進行
+    for evicted_path in evicted:
+        pandas_sandbox.release(evicted_path)
+    return df_agent
 
 
 # 定義自訂工具函數
@@ -34,10 +75,8 @@ def list_files(file_extension: str = "xlsx") -> List[str]:
 def read_excel_head(filename: str, sheet_name: Optional[str] = None, n_rows: int = 5) -> Dict:
     """預覽 Excel 檔案的表頭和前幾筆資料"""
     try:
-        if sheet_name:
-            df = pd.read_excel(filename, sheet_name=sheet_name, nrows=n_rows)
-        else:
-            df = pd.read_excel(filename, nrows=n_rows)
+        # 已解析過（或有 Parquet 快取）時直接取前幾列，否則只讀取前 n_rows 列，不解析整張工作表
+        df = shared_frames.head(filename, sheet_name, n_rows)
 
         # 取得欄位名稱並返回欄位資訊和範例資料
         columns = df.columns.tolist()
@@ -56,24 +95,14 @@ def read_excel_head(filename: str, sheet_name: Optional[str] = None, n_rows: int
 def read_excel_file(filename: str, sheet_name: Optional[str] = None) -> str:
     """完整讀取指定的 Excel 檔案，並返回資料集的摘要資訊"""
     try:
-        if sheet_name:
-            df = pd.read_excel(filename, sheet_name=sheet_name)
-        else:
-            df = pd.read_excel(filename)
-
-        # 清理資料：去除字串欄位的前後空白
-        df = df.apply(lambda col: col.str.strip() if col.dtype == "object" else col)
-
-        # 2. 強制轉換「日期」欄位為 datetime
-        if "日期" in df.columns:
-            df["日期"] = pd.to_datetime(df["日期"], errors="coerce")
-
-        # 3. 強制轉換「實績種類」欄位為乾淨字串
-        if "實績種類" in df.columns:
-            df["實績種類"] = df["實績種類"].astype(str).str.strip()
+        # 讀取並清理資料（去除字串空白、日期轉型、實績種類轉字串），結果依檔案內容快取並由所有 session 共用
+        context = get_data_context()
+        context.frames.register_workbook(filename)
+        key = f"{filename}::{sheet_name or list_sheet_names(filename)[0]}"
+        df = context.frames[key]
 
-        # 將 DataFrame 保存為全域變數
-        globals()['current_df'] = df
+        # 設為目前 session 的資料集並換新版本，讓 analyze_dataframe 改用新的 Agent
+        context.set_current(key)
 
         # 返回資訊摘要
         info = {
@@ -92,26 +121,13 @@ def read_excel_file(filename: str, sheet_name: Optional[str] = None) -> str:
 @tool
 def analyze_dataframe(query: str) -> str:
     """使用 Pandas Agent 分析當前的資料框架，根據使用者的自然語言查詢執行操作"""
-    if 'current_df' not in globals():
+    context = get_data_context()
+    if context.current_df is None:
         return "尚未載入任何資料集，請先使用 read_excel_file 載入資料。"
 
     try:
-        # 使用修改過的系統訊息建立 Pandas Agent，但使用標準的 create_pandas_dataframe_agent 方法
-        from langchain_experimental.agents import create_pandas_dataframe_agent
-        from langchain_openai import ChatOpenAI
-
-        custom_llm = ChatOpenAI(
-            temperature=0,
-            model="gpt-4o-2024-11-20"
-        ) # 系統訊息已經寫在prompt了 這邊就不需要再寫 model_kwargs
-
-        df_agent = create_pandas_dataframe_agent(
-            custom_llm,
-            globals()['current_df'],
-            verbose=True,
-            agent_type=AgentType.OPENAI_FUNCTIONS,
-            allow_dangerous_code=True
-        )
+        # 同一份資料集重用 Agent 池中的 Pandas Agent，不必每次重建 prompt 與 LLM client
+        df_agent = get_pandas_agent(context.current_df, context.current_version)
 
         # 執行查詢
         result = df_agent.run(query)
@@ -133,7 +149,7 @@ system_message = """
     1-3. 執行轉換後，**必須檢查是否成功**（例如使用 `df[欄位].isna().sum()` 確認 NaT 數量）。
     1-4. 僅在確認欄位為 datetime 格式後，才可使用 `.dt` 相關操作（如 `.dt.month`、`.dt.quarter`）。
 2. 請列出你的推理與處理步驟，避免直接跳過關鍵步驟（如篩選、groupby）
-3. 優先使用 pandas 的 groupby / sort / filter 工具來做正確統計與排序。
+3. 優先使用 pandas 的 groupby / sort / filter 工具來做正確統計與排序。代碼與名稱欄位為 category 型態，groupby 時**必須**加上 `observed=True`，避免產生不存在的組合。
 4. 若使用者詢問「最慢的 N 項」「最快的 N 項」「排行前 N」等需求：
     4-1. 4-1. **不得**先排除任何數值 —— 包括負值 (`-1`) 和 0，所有原始數字都必須參與分析。
     4-2. 先對所需維度（如「車名」、「SFX」）執行 `groupby(...).sum()`，再使用 `.sort_values(目標欄位)` 排序，並用 `.head(N)`（或 `.tail(N)`）取結果。
@@ -178,29 +194,10 @@ system_message = """
 
 
 
-# 創建 OpenAI Functions Agent
-prompt = ChatPromptTemplate.from_messages([
-    ("system", system_message),
-    ("human", "{input}"),
-    ("ai", "{agent_scratchpad}")
-    # LangChain 的 Agent 系統預期你的 PromptTemplate 裡會有一個叫 agent_scratchpad 的變數，
-    # 用來記錄 Agent 歷史的 intermediate steps（例如工具調用記錄、思考過程等）。
-    # 當你建立自定義 Prompt 且漏掉這個變數時，AgentExecutor 就無法正常運作。
-])
-
-# 將工具函數轉換為 OpenAI Functions 格式
-functions = [format_tool_to_openai_function(t) for t in tools]
-
-# 建立 Agent
-agent = create_openai_functions_agent(llm, tools, prompt)
-agent_executor = AgentExecutor(
-    agent=agent,
-    tools=tools,
-    verbose=True,
-    handle_parsing_errors=True
-)
-
-from langchain.callbacks import get_openai_callback
+# 第一次使用時才建立 Agent（import 本模組不會建立任何 LLM client）
+@lru_cache(maxsize=None)
+def get_agent_executor():
+    return build_agent_executor(get_chat_model(GENERAL_MODEL), tools, system_message)
 
 
 # 測試 Agent
@@ -209,9 +206,11 @@ def query_agent(question: str) -> None:
     print(f"問題: {question}")
     print("\n正在處理...\n")
 
+    from langchain.callbacks import get_openai_callback
+
     # 使用 get_openai_callback 來捕獲詳細的執行過程
     with get_openai_callback() as cb:
-        response = agent_executor.invoke(
+        response = get_agent_executor().invoke(
             {"input": question},
             return_intermediate_steps=True,  # 確保返回中間步驟
             include_run_info=True  # 包含運行信息
@@ -251,10 +250,13 @@ def query_agent(question: str) -> None:
 # result = query_agent("哪一個營業所 1 月販賣進度最快？")
 
 if __name__ == "__main__":
+    from langchain.callbacks import get_openai_callback
+
+    print("當前工作目錄是：", os.getcwd())
     user_input = "哪一個據點在 1 月販賣進度最快？"
 
     with get_openai_callback() as cb:
-        response = agent_executor.invoke({"input": user_input})
+        response = get_agent_executor().invoke({"input": user_input})
 
     print("🧾 分析結果：")
     print(response["output"])
\ No newline at end of file
@@ -1,29 +1,27 @@
 import os
+import numpy as np
 import pandas as pd
 import glob
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
-from langchain.agents.agent_types import AgentType
-from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
-from langchain.agents import AgentExecutor, create_openai_functions_agent
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
 from langchain.tools import tool
-from langchain.tools.render import format_tool_to_openai_function
-
-print("當前工作目錄：", os.getcwd())
-print("該目錄下的 Excel 檔案列表：", glob.glob("*.xlsx"))
+from data_cache import read_header_rows, SignatureIndex
+from data_context import get_data_context, shared_frames
+from dealer_mapping import dealer_mapping
+from olap_cube import SalesCube, CUBE_MEASURES
+from kpi_engine import ACTUAL_KIND_CODES, TARGET_KIND_CODES
+from partition_store import read_period
+from target_table import TargetTable, get_target_table, infer_year, is_target_frame
+from llm_factory import GENERAL_MODEL, build_agent_executor, get_chat_model
 
 
 # ==================================== 1. 設定 ====================================
-# 確保 API 金鑰已設定
-if not os.environ.get("OPENAI_API_KEY"):
-    with open("secret_key", "r", encoding="utf-8") as f:
-        os.environ["OPENAI_API_KEY"] = f.read().strip()
-
-llm = ChatOpenAI(temperature=0, model="gpt-4o-2024-11-20")
+# 檔案分類結果索引：檔案路徑、mtime、大小都未變動時直接沿用，不再開檔
+classification_index = SignatureIndex("classification_index")
 
-# 全域字典儲存多個 DataFrame
-dataframes = {}
+# 目標 vs 實際比對：回傳給 LLM 的明細每頁筆數與上限，完整結果保留在 session 資料中
+COMPARISON_PAGE_SIZE = int(os.environ.get("COMPARISON_PAGE_SIZE", "20"))
+COMPARISON_MAX_PAGE_SIZE = 100
 
 
 # ==================================== 2. 定義自訂工具函數 ====================================
@@ -36,186 +34,340 @@ def list_and_classify_files(file_extension: str = "xlsx") -> Dict[str, List[str]
     grouped = {"target": [], "actual": [], "unknown": []}
 
     for f in files:
-        classification = classify_file_type.invoke({"filename": f}).get("classification", "unknown")
+        classification = _classify_file(f).get("classification", "unknown")
         grouped[classification].append(f)
 
     return grouped
 
 @tool
-def load_excel_file(filename: str, preview_rows: int = 5) -> Dict:
+def load_excel_file(filename: str, preview_rows: int = 5, build_cube: bool = False) -> Dict:
     """
-    載入 Excel 所有工作表，資料儲存於全域變數 dataframes，key 為 filename::sheet。
+    載入 Excel 所有工作表，資料儲存於目前 session 的 DataContext.frames，key 為 filename::sheet。
     回傳每個工作表的欄位與前幾列預覽。
+    build_cube=True 時，對含 日期 與 台數 的實績工作表建立預彙總立方體，供 query_sales_cube 查詢。
+    目標工作表（含 目標台數 或 X月目標）一律轉為長格式目標表，供達標比對與推進率計算。
     """
-    global dataframes
+    context = get_data_context()
+    dataframes, cubes, targets = context.frames, context.cubes, context.targets
     try:
-        xls = pd.ExcelFile(filename)
+        # 清理（去空白、日期、實績種類）後的工作表依檔案內容雜湊快取，並由所有 session 共用同一份解析結果
+        sheets = shared_frames.workbook(filename)
+        dataframes.register_workbook(filename)
         preview = {}
 
-        for sheet in xls.sheet_names:
-            df = pd.read_excel(xls, sheet_name=sheet)
-            # 1. 去除所有 object 欄位的前後空白
-            df = df.apply(lambda col: col.str.strip() if col.dtype == "object" else col)
-
-            # 2. 強制轉換「日期」欄位
-            if "日期" in df.columns:
-                df["日期"] = pd.to_datetime(df["日期"], errors="coerce")
-
-            # 3. 強制轉換「實績種類」欄位為純字串並 strip
-            if "實績種類" in df.columns:
-                df["實績種類"] = df["實績種類"].astype(str).str.strip()
-
+        for sheet in sheets:
             key = f"{filename}::{sheet}"
-            dataframes[key] = df
+            df = dataframes[key]
+            cubes.pop(key, None)
+            targets.pop(key, None)
+            if build_cube and "日期" in df.columns and df.columns.isin(CUBE_MEASURES).any():
+                cubes[key] = SalesCube.from_frame(df)
+            if is_target_frame(df):
+                # 目標表在載入時轉為以年月為 index 的長格式，當月／累計目標直接切片
+                targets[key] = TargetTable.from_frame(df, infer_year(filename))
             preview[key] = {
                 "columns": df.columns.tolist(),
                 "sample_data": df.head(preview_rows).to_dict(orient="records")
             }
 
-        return {
+        result = {
             "filename": filename,
-            "sheets_loaded": len(xls.sheet_names),
+            "sheets_loaded": len(sheets),
             "preview": preview
         }
+        cube_keys = [key for key in preview if key in cubes]
+        if cube_keys:
+            result["cubes"] = {key: cubes[key].describe() for key in cube_keys}
+        target_keys = [key for key in preview if key in targets]
+        if target_keys:
+            result["target_tables"] = {key: targets[key].describe() for key in target_keys}
+        return result
 
     except Exception as e:
         return {"error": str(e)}
 
-@tool
-def classify_file_type(filename: str) -> Dict:
-    """
-      分類資料表為 target / actual，根據檔名與欄位內容回傳詳細說明。
-      """
+def _classify_file(filename: str) -> Dict:
+    """依檔名、工作表名稱與表頭欄位分類檔案；結果記錄於 classification_index"""
+    try:
+        cached = classification_index.get(filename)
+    except OSError as e:
+        return {"filename": filename, "error": str(e)}
+    if cached is not None:
+        return cached
+
     target_keywords = ["目標", "target"]
     actual_keywords = ["統計", "實際", "actual", "實績"]
 
+    # 只讀取工作表名稱與表頭列（唯讀串流模式），不解析任何資料列
     try:
-        xls = pd.ExcelFile(filename)
+        headers = read_header_rows(filename)
     except Exception as e:
         return {"filename": filename, "error": str(e)}
 
-    for sheet in xls.sheet_names:
-        try:
-            df = pd.read_excel(xls, sheet_name=sheet, nrows=5)
-            columns = set(df.columns.str.lower())
-
-            if any(kw in filename.lower() or kw in sheet.lower() for kw in target_keywords):
-                if columns & {"目標", "target", "銷售目標", "經銷商"}:
-                    return {
-                        "filename": filename,
-                        "classification": "target",
-                        "reason": f"於 sheet【{sheet}】發現目標相關欄位: {columns & {'目標', 'target', '銷售目標', '經銷商'}}"
-                    }
-
-            if any(kw in filename.lower() or kw in sheet.lower() for kw in actual_keywords):
-                if columns & {"實際", "actual", "銷售", "銷售數", "實績"}:
-                    return {
-                        "filename": filename,
-                        "classification": "actual",
-                        "reason": f"於 sheet【{sheet}】發現實際相關欄位: {columns & {'實際', 'actual', '銷售', '銷售數'}}"
-                    }
-
-        except Exception:
-            continue
-
-    return {
+    result = {
         "filename": filename,
         "classification": "unknown",
         "reason": "無法根據檔案內容判斷類型"
     }
+    for sheet, header in headers.items():
+        columns = {col.lower() for col in header}
+
+        if any(kw in filename.lower() or kw in sheet.lower() for kw in target_keywords):
+            if columns & {"目標", "target", "銷售目標", "經銷商"}:
+                result = {
+                    "filename": filename,
+                    "classification": "target",
+                    "reason": f"於 sheet【{sheet}】發現目標相關欄位: {columns & {'目標', 'target', '銷售目標', '經銷商'}}"
+                }
+                break
+
+        if any(kw in filename.lower() or kw in sheet.lower() for kw in actual_keywords):
+            if columns & {"實際", "actual", "銷售", "銷售數", "實績"}:
+                result = {
+                    "filename": filename,
+                    "classification": "actual",
+                    "reason": f"於 sheet【{sheet}】發現實際相關欄位: {columns & {'實際', 'actual', '銷售', '銷售數'}}"
+                }
+                break
+
+    classification_index.put(filename, result)
+    return result
+
 
 @tool
-def compare_target_vs_actual(target_key: str, actual_key: str) -> Dict[str, Any]:
+def classify_file_type(filename: str) -> Dict:
+    """
+      分類資料表為 target / actual，根據檔名與欄位內容回傳詳細說明。
+      """
+    return _classify_file(filename)
+
+
+def _as_list(values) -> List:
+    if values is None:
+        return []
+    return list(values) if isinstance(values, (list, tuple, set)) else [values]
+
+
+def _match(series: pd.Series, values: List) -> np.ndarray:
+    """series 是否等於 values 之一；數值欄位的篩選值先轉成數字（'01' → 1）"""
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        values = pd.to_numeric(pd.Series([str(v).strip() for v in values]), errors="coerce").dropna().tolist()
+    else:
+        values = [str(v).strip() for v in values]
+    return series.isin(values).to_numpy()
+
+
+def _month_match(year_month: np.ndarray, months: List[int]) -> np.ndarray:
+    """months 可為月份（1–12，不分年）或年月（YYYYMM）"""
+    return np.isin(year_month % 100, [m for m in months if m <= 12]) | np.isin(year_month, [m for m in months if m > 12])
+
+
+def _require(df: pd.DataFrame, columns: List[str], label: str) -> None:
+    for col in columns:
+        if col not in df.columns:
+            raise ValueError(f"{label}缺少必要欄位: {col}")
+
+
+def _target_totals(table: TargetTable, kind: Optional[str], dealers: List, sites: List, months: List[int]) -> pd.DataFrame:
+    """長格式目標表依月份切片後，再以經銷商、據點篩選並彙總為 target_sales"""
+    rows = table.select(months, TARGET_KIND_CODES[kind] if kind else None)
+    for col in ("經銷商代碼", "營業所代碼"):
+        if col not in rows.columns:
+            raise ValueError(f"目標表缺少必要欄位: {'據點代碼' if col == '營業所代碼' else col}")
+    mask = np.ones(len(rows), dtype=bool)
+    if dealers:
+        mask &= _match(rows["經銷商代碼"], dealers)
+    if sites:
+        mask &= _match(rows["營業所代碼"], sites)
+    rows = rows[mask]
+    return rows.groupby(["經銷商代碼", "營業所代碼"], observed=True)["目標"].sum().rename("target_sales").reset_index()
+
+
+def _actual_totals(df: pd.DataFrame, kind: Optional[str], dealers: List, sites: List, months: List[int]) -> pd.DataFrame:
+    """實績表依（經銷商代碼, 營業所代碼）彙總為 actual_sales；有 經銷商名稱、據點 欄位時一併帶出（不作為 key）"""
+    _require(df, ["經銷商代碼", "營業所代碼"], "實際表")
+    if "台數" in df.columns:
+        value_col = "台數"
+    elif kind == "受訂" and "受訂數" in df.columns:
+        value_col = "受訂數"
+    elif "銷售數" in df.columns:
+        value_col = "銷售數"
+    else:
+        raise ValueError("實際表缺少 台數 / 銷售數 / 受訂數 欄位")
+
+    mask = np.ones(len(df), dtype=bool)
+    if kind and "實績種類" in df.columns:
+        mask &= _match(df["實績種類"], [ACTUAL_KIND_CODES[kind]])
+    if dealers:
+        mask &= _match(df["經銷商代碼"], dealers)
+    if sites:
+        mask &= _match(df["營業所代碼"], sites)
+    if months:
+        if "日期" not in df.columns:
+            raise ValueError("實際表沒有 日期 欄位，無法依月份篩選")
+        dates = pd.to_datetime(df["日期"], errors="coerce")
+        mask &= _month_match((dates.dt.year * 100 + dates.dt.month).to_numpy(), months)
+
+    keys = ["經銷商代碼", "營業所代碼"]
+    name_cols = [col for col in ("經銷商名稱", "據點") if col in df.columns]
+    grouped = df.loc[mask, keys + name_cols + [value_col]].groupby(keys, observed=True)
+    totals = grouped[value_col].sum().rename("actual_sales").to_frame()
+    if name_cols:
+        totals = grouped[name_cols].first().join(totals)
+    return totals.reset_index()
+
+
+def _comparison_page(df: pd.DataFrame, page: int, page_size: int, achieved: Optional[bool] = None) -> Dict[str, Any]:
+    """合併結果的單頁明細；每頁筆數上限為 COMPARISON_MAX_PAGE_SIZE"""
+    page_size = max(1, min(int(page_size), COMPARISON_MAX_PAGE_SIZE))
+    if achieved is not None:
+        df = df[df["達標"] == achieved]
+    total = len(df)
+    total_pages = max(1, -(-total // page_size))
+    page = min(max(1, int(page)), total_pages)
+    rows = df.iloc[(page - 1) * page_size: page * page_size]
+    return {
+        "page": page,
+        "page_size": page_size,
+        "total_rows": int(total),
+        "total_pages": total_pages,
+        "rows": rows.astype(object).where(rows.notna(), None).to_dict(orient="records"),
+    }
+
+
+@tool
+def compare_target_vs_actual(
+    target_key: str,
+    actual_key: str,
+    kind: Optional[str] = None,
+    dealers: Optional[List[str]] = None,
+    sites: Optional[List[str]] = None,
+    months: Optional[List[int]] = None,
+    include_missing: bool = False,
+) -> Dict[str, Any]:
     """
     比對目標與實際資料，只用經銷商代碼 + 據點代碼做 join，
     若實績表中有名稱欄位（如 經銷商名稱、據點），則在合併後一併帶出。
-    key 為 filename::sheet_name 格式。
+    key 為 filename::sheet_name 或 store::targets / store::actuals 格式；kind 為 販賣 或 受訂，未指定時不區分種類。
+    dealers（經銷商代碼，如 ["A"]）、sites（據點代碼，如 ["01"]）、months（月份 1–12 或年月 YYYYMM）在彙總前先篩選。
+    預設只比對兩表都有的據點（inner join）；include_missing=True 時保留有目標但沒有實績的據點，以 0 台計算。
+    回傳 summary 與第一頁明細；完整合併結果保存在 merged_key，其餘頁請以 get_comparison_page 取得。
     """
-    import pandas as pd
-
-    # 1. 檢查是否已載入
+    # 1. 檢查是否已載入（目前 session 的資料）
+    dataframes = get_data_context().frames
     if target_key not in dataframes or actual_key not in dataframes:
         return {"error": f"請確認這兩個 key 是否存在於 dataframes：{target_key}, {actual_key}"}
 
-    df_target = dataframes[target_key].copy()
-    df_actual = dataframes[actual_key].copy()
-
-    # 2. 核心欄位
-    dist_code_col    = "經銷商代碼"
-    target_point_col = "據點代碼"
-    actual_point_col = "營業所代碼"
-
-    # 3. 確認必要欄位
-    for col in (dist_code_col, target_point_col):
-        if col not in df_target.columns:
-            return {"error": f"目標表缺少必要欄位: {col}"}
-    for col in (dist_code_col, actual_point_col):
-        if col not in df_actual.columns:
-            return {"error": f"實際表缺少必要欄位: {col}"}
-
-    # 4. 找銷售欄位
-    target_sales_col = next((c for c in df_target.columns if any(k in c for k in ["目標", "目標數", "目標銷售數"])), None)
-    actual_sales_col = next((c for c in df_actual.columns if any(k in c for k in ["實績", "銷售", "受訂"])), None)
-    if not target_sales_col or not actual_sales_col:
-        return {"error": "缺少目標或實際銷售欄位"}
-
-    df_target[target_sales_col] = pd.to_numeric(df_target[target_sales_col], errors="coerce")
-    df_actual[actual_sales_col] = pd.to_numeric(df_actual[actual_sales_col], errors="coerce")
-
-
-    # 5. group by 只用代碼去聚合
-    df_t = (
-        df_target
-        .groupby([dist_code_col, target_point_col], as_index=False)[target_sales_col]
-        .sum()
-        .rename(columns={target_point_col: actual_point_col, target_sales_col: "target_sales"})
-    )
-
-    # 如果實績表有經銷商名稱、據點名稱，就在聚合時一起保留
-    extra_cols = []
-    if "經銷商名稱" in df_actual.columns:
-        extra_cols.append("經銷商名稱")
-    if "據點" in df_actual.columns:
-        extra_cols.append("據點")
-
-    df_a = (
-        df_actual
-        .groupby([dist_code_col, actual_point_col] + extra_cols, as_index=False)[actual_sales_col]
-        .sum()
-        .rename(columns={actual_sales_col: "actual_sales"})
-    )
+    try:
+        if kind is not None and kind not in ACTUAL_KIND_CODES:
+            raise ValueError(f"kind 必須是 {list(ACTUAL_KIND_CODES)} 之一")
+        dealers, sites = _as_list(dealers), _as_list(sites)
+        months = [int(m) for m in _as_list(months)]
+
+        # 2. 各自篩選後彙總（不複製來源表；目標由長格式目標表依月份切片）
+        # months 全為年月（YYYYMM）時，store:: 分區資料集只讀取涵蓋的月份
+        start, end = (min(months), max(months)) if months and min(months) > 12 else (None, None)
+        df_t = _target_totals(get_target_table(target_key, start, end), kind, dealers, sites, months)
+        df_a = _actual_totals(read_period(actual_key, start, end), kind, dealers, sites, months)
+    except Exception as e:
+        return {"error": str(e)}
 
-    # 6. 合併
-    df_merge = pd.merge(
-        df_t, df_a,
-        on=[dist_code_col, actual_point_col],
-        how="inner"
-    )
+    # 3. 合併：預設只保留兩表都有的據點；include_missing 時以目標為主，沒有實績的據點以 0 台計算（未達標）
+    keys = ["經銷商代碼", "營業所代碼"]
+    for key in keys:
+        # 兩表的代碼欄位型態可能不同（category / 整數 / 字串），只在彙總後的小表上統一
+        numeric = pd.api.types.is_numeric_dtype(df_t[key].dtype) and pd.api.types.is_numeric_dtype(df_a[key].dtype)
+        df_t[key] = df_t[key].astype("int64" if numeric else str)
+        df_a[key] = df_a[key].astype("int64" if numeric else str)
+    df_merge = df_t.merge(df_a, on=keys, how="left" if include_missing else "inner").sort_values(keys, ignore_index=True)
+    if include_missing:
+        df_merge["actual_sales"] = df_merge["actual_sales"].fillna(0).astype("int64")
+    df_merge["達成率"] = (df_merge["actual_sales"] / df_merge["target_sales"].replace(0, np.nan) * 100).round(1)
     df_merge["達標"] = df_merge["actual_sales"] >= df_merge["target_sales"]
 
-    # 7. 寫回全域
-    merged_key = f"{target_key}_vs_{actual_key}"
+    # 4. 完整結果寫回目前 session 的資料（資料檢視頁可直接瀏覽），不同篩選條件各自保存
+    filters = {"kind": kind, "dealers": dealers, "sites": sites, "months": months, "include_missing": include_missing}
+    label = ";".join(
+        [kind or "全部"]
+        + [f"{name}={','.join(map(str, values))}" for name, values in filters.items() if name in ("dealers", "sites", "months") and values]
+        + (["include_missing"] if include_missing else [])
+    )
+    merged_key = f"{target_key}_vs_{actual_key}[{label}]"
     dataframes[merged_key] = df_merge
 
-    # 8. summary
+    # 5. summary
     total    = int(len(df_merge))
     achieved = int(df_merge["達標"].sum())
     rate     = achieved / total if total else 0.0
 
-    return {
+    detail = _comparison_page(df_merge, 1, COMPARISON_PAGE_SIZE)
+    result = {
         "merged_key": merged_key,
+        "filters": filters,
         "summary": {
             "total_matches": total,
             "achieved": achieved,
-            "achievement_rate": rate
+            "achievement_rate": rate,
+            "target_total": int(df_merge["target_sales"].sum()),
+            "actual_total": int(df_merge["actual_sales"].sum()),
         },
-        "detail": df_merge.to_dict(orient="records")
+        "detail": detail,
     }
+    if detail["total_pages"] > 1:
+        result["note"] = f"明細共 {detail['total_pages']} 頁，此處只回傳第 1 頁；請以 get_comparison_page(merged_key, page) 取得其餘頁"
+    return result
 
 
+@tool
+def get_comparison_page(
+    merged_key: str,
+    page: int = 1,
+    page_size: int = COMPARISON_PAGE_SIZE,
+    achieved: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    分頁取得 compare_target_vs_actual 合併結果（merged_key）的明細，每頁最多 100 筆。
+    achieved=True 只列出達標據點、False 只列出未達標據點；回傳 total_pages 供判斷是否還有下一頁。
+    """
+    dataframes = get_data_context().frames
+    if merged_key not in dataframes:
+        return {"error": f"找不到比對結果 {merged_key}，請重新呼叫 compare_target_vs_actual"}
+    try:
+        return {"merged_key": merged_key, **_comparison_page(dataframes[merged_key], page, page_size, achieved)}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@tool
+def resolve_dealer_name(name: str, limit: int = 5) -> str:
+    """
+    以名稱模糊查詢經銷商代碼與營業所代碼（支援「國都新莊」、「南臺中」、「高都的鳳山」等寫法），
+    回傳依相似度排序的候選清單。
+    """
+    try:
+        candidates = dealer_mapping.resolve_name(name, limit)
+    except Exception as e:
+        return f"查詢映射資料時發生錯誤: {str(e)}"
+    if not candidates:
+        return f"找不到與 '{name}' 相近的經銷商或營業所名稱。"
+
+    top = candidates[0]
+    if top["match"] == "經銷商":
+        site_count = len(dealer_mapping.by_dealer.get(top["經銷商代碼"], []))
+        return (
+            f"'{name}' 對應經銷商 {top['經銷商代碼']} ({top['經銷商名稱']})，共 {site_count} 個營業所；"
+            f"如需列出所有營業所，請呼叫 get_dealer_mapping('{top['經銷商代碼']}')。"
+        )
+
+    lines = [
+        f"{i + 1}. 經銷商 {c['經銷商代碼']} ({c['經銷商名稱']}) - 營業所 {c['營業所代碼']} ({c['營業所名稱']})  相似度 {c['score']:.2f}"
+        for i, c in enumerate(candidates)
+    ]
+    return f"'{name}' 的候選對應（依相似度排序，第 1 筆為最佳匹配）：\n" + "\n".join(lines)
+
 
 # 工具集合
-tools = [list_and_classify_files, load_excel_file, classify_file_type, compare_target_vs_actual]
+tools = [list_and_classify_files, load_excel_file, classify_file_type, compare_target_vs_actual, get_comparison_page, resolve_dealer_name]
 
 # ==================================== 3. 處理映射表：建立 Mapping 處理函數 ====================================
 def generate_mapping_text(mapping_path: str) -> str:
@@ -235,11 +387,8 @@ def generate_mapping_text(mapping_path: str) -> str:
     mapping_str = "\n".join(mapping_lines)
     return f"映射資料如下：\n{mapping_str}"
 
-# 讀取並轉換 mapping 資料
-mapping_text = generate_mapping_text("Mapping Dataframe.xlsx")
-
 # ==================================== 4. 建立系統訊息 ====================================
-system_message = f"""
+system_message = """
 你是資料分析助理，會處理兩類 Excel 檔案：目標檔案（target）和實際檔案（actual）。
 每個檔案會透過 classify_file_type 工具標示類型，回傳 JSON 格式包含 filename、classification（"target"、"actual"、"unknown"）、reason。
 請注意以下欄位名稱在不同資料表中具有相同意義：
@@ -249,7 +398,8 @@ system_message = f"""
 - 先比對檔名經銷商、經銷商代碼等資訊
 - 同一經銷商與經銷商代碼的目標與實際檔案配對
 - 無法配對則告知缺少哪方
-- 配對後呼叫 compare_target_vs_actual(target_filename, actual_filename) 進行銷售達標分析
+- 配對後呼叫 compare_target_vs_actual(target_key, actual_key, kind, dealers, sites, months) 進行銷售達標分析；問題只涉及特定經銷商、據點或月份時，以 dealers / sites / months 參數先篩選
+- 明細只回傳第一頁，需要更多據點時以 get_comparison_page(merged_key, page) 翻頁，直到 total_pages
 
 判斷依據與工具結果請逐步說明。
 
@@ -288,15 +438,11 @@ system_message = f"""
 回答規則：
 - 使用者問的經銷商名稱與營業所名稱就是此次資料查詢的唯一標準，且結果必須只包含該經銷商/營業所的資料。
 - 若經銷商名稱變更，必須完整更新並重置資料上下文，不得帶入之前的經銷商資料。
-- 若使用者輸入的是經銷商名稱與營業所名稱，請參照下列對應資訊查找對應的代碼：{mapping_text}
+- 若使用者輸入的是經銷商名稱與營業所名稱，請呼叫 resolve_dealer_name(name) 查找對應的代碼（支援模糊比對）。
 - 如果使用者問『完整列出所有據點』，請完整輸出用戶指定的經銷商下的所有據點資料，Markdown表格格式。
 - 如果問『某據點達標狀況』，只回答該據點達標狀況。
-- 如果問『某經銷商達標數量』，請從該經銷商完整的所有據點資料中，計算並回覆達標據點數、總據點數與達標率，所有據點必須完整列出，且不得用模糊字眼（如：其他據點）或省略號替代。
-- 在輸出 Markdown 明細表後，所有「總據點數」、「達標據點數」與「達標率」**必須**完全依照下列方式從表格文字中解析，**不得**使用任何額外計算或隱性推斷：
-    1. **總據點數**：直接數表格中標題列以下、每一行資料的行數（即 Markdown 列數減去標題和分隔線）。
-    2. **達標據點數**：逐行檢查「達標」欄，**只有**等於字串 `True` 的那幾行才計入，其他一律不計。
-    3. **達標率**：以「達標據點數／總據點數」計算，並顯示為百分比（保留一位小數）。
-    4. **嚴禁**重複或另行運算、導入 DataFrame 物件、或憑印象回推；所有 summary 數字都必須和上方 Markdown 表格的文字完全一致。
+- 如果問『某經銷商達標數量』，請以 dealers=[該經銷商代碼] 呼叫 compare_target_vs_actual，回覆達標據點數、總據點數與達標率，並以 get_comparison_page 取得所有頁，所有據點必須完整列出，且不得用模糊字眼（如：其他據點）或省略號替代。
+- 所有「總據點數」、「達標據點數」與「達標率」**必須**直接取自 compare_target_vs_actual 回傳的 summary（total_matches、achieved、achievement_rate，達標率以百分比顯示並保留一位小數），**嚴禁**由明細表另行計算或憑印象回推。
 - 其他情況，請依上下文盡量準確回覆。
 - 若無要求，不須顯示據點名稱，回答時皆以代碼提供。
 """
@@ -311,27 +457,10 @@ system_message = f"""
 # 這樣的回答模式能確保分析準確、互動有效。
 
 # ==================================== 5. Agent ====================================
-prompt = ChatPromptTemplate.from_messages([
-    ("system", system_message),
-    ("human", "{input}"),
-    ("ai", "{agent_scratchpad}")
-    # LangChain 的 Agent 系統預期你的 PromptTemplate 裡會有一個叫 agent_scratchpad 的變數，
-    # 用來記錄 Agent 歷史的 intermediate steps（例如工具調用記錄、思考過程等）。
-    # 當你建立自定義 Prompt 且漏掉這個變數時，AgentExecutor 就無法正常運作。
-])
-
-# 將工具函數轉換為 OpenAI Functions 格式
-functions = [format_tool_to_openai_function(t) for t in tools]
-# 建立 Agent
-agent = create_openai_functions_agent(llm, tools, prompt)
-agent_executor = AgentExecutor(
-    agent=agent,
-    tools=tools,
-    verbose=True,
-    handle_parsing_errors=True
-)
-
-from langchain.callbacks import get_openai_callback
+# 第一次使用時才建立 Agent（import 本模組不會建立任何 LLM client）
+@lru_cache(maxsize=None)
+def get_agent_executor():
+    return build_agent_executor(get_chat_model(GENERAL_MODEL), tools, system_message)
 
 
 # 測試 Agent
@@ -340,9 +469,11 @@ def query_agent(question: str) -> None:
     print(f"問題: {question}")
     print("\n正在處理...\n")
 
+    from langchain.callbacks import get_openai_callback
+
     # 使用 get_openai_callback 來捕獲詳細的執行過程
     with get_openai_callback() as cb:
-        response = agent_executor.invoke(
+        response = get_agent_executor().invoke(
             {"input": question},
             return_intermediate_steps=True,  # 確保返回中間步驟
             include_run_info=True  # 包含運行信息
@@ -378,10 +509,14 @@ def query_agent(question: str) -> None:
 
 # ==================================== 使用範例  ====================================
 if __name__ == "__main__":
+    from langchain.callbacks import get_openai_callback
+
+    print("當前工作目錄：", os.getcwd())
+    print("該目錄下的 Excel 檔案列表：", glob.glob("*.xlsx"))
     user_input = "哪個車款販售得最少？"
 
     with get_openai_callback() as cb:
-        response = agent_executor.invoke({"input": user_input})
+        response = get_agent_executor().invoke({"input": user_input})
 
     print("🧾 分析結果：")
     print(response["output"])
\ No newline at end of file
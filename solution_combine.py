@@ -1,29 +1,21 @@
 import os
+import queue
+import asyncio
+import threading
 import pandas as pd
 import glob
-from typing import List, Dict, Any, Optional
-from langchain.agents.agent_types import AgentType
-from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
-from langchain_openai import ChatOpenAI
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
 from langchain.tools import tool
-from langchain.agents import AgentExecutor, create_openai_functions_agent
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema import SystemMessage
-from langchain.tools.render import format_tool_to_openai_function
-from langchain.callbacks import get_openai_callback
 from solution1 import list_files, read_excel_head, read_excel_file, analyze_dataframe
-from solution3 import list_and_classify_files, load_excel_file, classify_file_type, compare_target_vs_actual, generate_mapping_text
-
-# 確保 API 金鑰已設定
-if not os.environ.get("OPENAI_API_KEY"):
-    with open("secret_key", "r", encoding="utf-8") as f:
-        os.environ["OPENAI_API_KEY"] = f.read().strip()
-
-# 建立基本的語言模型
-llm = ChatOpenAI(temperature=0, model="gpt-4.1")
-
-# 全域字典儲存多個 DataFrame
-dataframes = {}
+from solution3 import list_and_classify_files, load_excel_file, classify_file_type, compare_target_vs_actual, get_comparison_page, resolve_dealer_name
+from dealer_mapping import dealer_mapping
+from kpi_engine import compute_sales_kpis, compute_monthly_kpis
+from olap_cube import query_sales_cube
+from sql_engine import sql_tools
+from answer_cache import agent_version, answer_cache, data_fingerprint
+from llm_factory import COMBINE_MODEL, GENERAL_MODEL, LLM_BACKEND, build_agent_executor, get_chat_model
+from tracing import QueryTracer
 
 # 新增映射表查詢工具
 @tool
@@ -40,70 +32,20 @@ def get_dealer_mapping(query_code: str) -> str:
         str: 對應的映射資訊，包含經銷商名稱和營業所名稱
     """
     try:
-        import pandas as pd
-        df = pd.read_excel("Mapping Dataframe.xlsx", dtype=str)
-        
-        # 清理查詢代碼
-        query_code = str(query_code).strip().upper()
-        
-        # 檢查是否為組合代碼（字母+數字）
-        if len(query_code) >= 2 and query_code[0].isalpha() and query_code[1:].isdigit():
-            # 組合代碼拆解：D01, D1 等
-            dealer_code = query_code[0]
-            site_code = query_code[1:].zfill(2)  # 自動補零：D1 → 01
-            
-            # 精確查詢：指定經銷商的指定營業所
-            exact_match = df[
-                (df['經銷商代碼'].str.strip() == dealer_code) & 
-                (df['營業所代碼'].str.strip() == site_code)
-            ]
-            
-            if len(exact_match) > 0:
-                # 找到精確匹配
-                row = exact_match.iloc[0]
-                dealer_name = row['經銷商名稱'].strip()
-                site_name = row['營業所名稱'].strip()
-                return f"找到匹配 '{query_code}':\n經銷商 {dealer_code} ({dealer_name}) - 營業所 {site_code} ({site_name})"
-            else:
-                # 沒有精確匹配，檢查經銷商是否存在
-                dealer_exists = df[df['經銷商代碼'].str.strip() == dealer_code]
-                if len(dealer_exists) > 0:
-                    return f"組合代碼 '{query_code}' 不存在。\n經銷商 {dealer_code} ({dealer_exists.iloc[0]['經銷商名稱'].strip()}) 沒有營業所 {site_code}。"
-                else:
-                    return f"組合代碼 '{query_code}' 不存在。\n經銷商代碼 {dealer_code} 不存在。"
-        
-        else:
-            # 單一代碼查詢（原有邏輯）
-            # 搜尋代碼 - 同時搜尋經銷商代碼和營業所代碼
-            dealer_match = df[df['經銷商代碼'].str.strip() == query_code]
-            site_match = df[df['營業所代碼'].str.strip() == query_code]
-            
-            results = []
-            
-            if len(dealer_match) > 0:
-                # 找到經銷商代碼匹配
-                for _, row in dealer_match.iterrows():
-                    dealer_name = row['經銷商名稱'].strip()
-                    site_name = row['營業所名稱'].strip() 
-                    site_code = row['營業所代碼'].strip()
-                    results.append(f"經銷商 {query_code} ({dealer_name}) - 營業所 {site_code} ({site_name})")
-            
-            if len(site_match) > 0:
-                # 找到營業所代碼匹配
-                for _, row in site_match.iterrows():
-                    dealer_name = row['經銷商名稱'].strip()
-                    dealer_code = row['經銷商代碼'].strip()
-                    site_name = row['營業所名稱'].strip()
-                    results.append(f"營業所 {query_code} ({site_name}) - 屬於經銷商 {dealer_code} ({dealer_name})")
-            
-            if results:
-                return "找到以下映射資訊:\n" + "\n".join(results)
-            else:
-                return f"找不到代碼 '{query_code}' 的對應資訊。請確認代碼是否正確。"
-            
+        # 映射表只在檔案變動時重新讀取，查詢直接走記憶體索引
+        return dealer_mapping.lookup(query_code)
     except Exception as e:
         return f"查詢映射資料時發生錯誤: {str(e)}"
 
+
+@tool
+def get_dealer_mappings(query_codes: List[str]) -> Dict[str, str]:
+    """批次映射表查詢工具：一次查詢多個代碼（格式同 get_dealer_mapping），回傳 {代碼: 映射資訊}"""
+    try:
+        return dealer_mapping.lookup_many(query_codes)
+    except Exception as e:
+        return {"error": f"查詢映射資料時發生錯誤: {str(e)}"}
+
 # 工具集合
 tools = [
     list_files,
@@ -114,14 +56,17 @@ tools = [
     load_excel_file,
     classify_file_type,
     compare_target_vs_actual,
+    get_comparison_page,  # 比對明細分頁
     get_dealer_mapping,  # 新增映射表查詢工具
+    get_dealer_mappings,
+    resolve_dealer_name,
+    compute_sales_kpis,  # 業務指標計算工具
+    compute_monthly_kpis,
+    query_sales_cube,  # 預彙總立方體查詢
+    *sql_tools,  # SQL 分析（已安裝 duckdb 時）
 ]
 
-# 映射表處理
-mapping_text = generate_mapping_text("Mapping Dataframe.xlsx")
-
-
-system_message = f"""
+system_message = """
 你是一個資料分析助理，能同時處理兩大類任務──「一般性資料探索與分析」以及「目標 vs. 實際 銷售達標比對」。請依照使用者問題，自動判斷並執行最合適的流程。
 
   # 運算與名詞定義
@@ -140,6 +85,11 @@ system_message = f"""
      例：3月目標100台，實績92台 → 92/100×100%=92%
   7. **累計台數**：若無特別說明時間，預設為當年1/1至指定時間之累計。
 
+  **指標計算工具（優先使用）：**
+  - 上述 1–7 項指標請直接呼叫 `compute_sales_kpis(actual_key, as_of_date, group_by, kind, target_key, filters)`（指定日期的快照，提供 target_key 時含推進率／達成率）或 `compute_monthly_kpis(actual_key, group_by, kind, filters)`（逐月趨勢），**不要**自行撰寫 pandas 程式碼計算。
+  - `group_by` 可為 `經銷商代碼`、`營業所代碼`、`車名`、`廠牌`、`課別代碼` 的任意組合，空白代表大盤；`kind` 為 `販賣`（3D）或 `受訂`（27）。
+  - 回答時直接引用工具回傳的數字，不得再次計算。
+
   **常見名詞定義：**
   - **C CROSS** 簡稱 **CC**  
   - **Y CROSS** 簡稱 **YC**  
@@ -181,6 +131,14 @@ filtered = df[df['日期'].dt.date == pd.to_datetime('2025-05-22').date()]
 
 # 一般性資料探索與分析流程
 - 適用情境：使用者詢問排行（最慢／最快 N 項）、時間切片（如 1 月、Q2、最近三個月）、熱門項目、敘述性統計等。
+- 每日增量：`store::actuals` 為半年實績檔加上之後匯入的每日增量，可直接作為 `query_sales_cube`、`compute_sales_kpis` 等工具的 actual_key（不需 load_excel_file），問題涉及最新日期時優先使用；工具回報找不到資料集時表示尚未匯入增量，改用實績檔的 filename::sheet。
+- 歷年資料：`store::actuals` 與 `store::targets`（依年月分區的目標）可包含多個年度，查詢時請帶時間條件（`compute_sales_kpis` 的 as_of_date、`compute_monthly_kpis` 的 date_from / date_to、`compare_target_vs_actual` 的 months 以 YYYYMM 表示），工具只會讀取涵蓋的月份。
+- 合計與排行捷徑：問題只是 `台數` 在 日期／月份 × 經銷商 × 據點 × 車名 × `實績種類` 某些組合上的加總或排名時（如「5/22 TOYOTA 各車種販賣台數」、「1 月哪個據點販賣最多」），請優先呼叫 `query_sales_cube(actual_key, group_by, filters, date_from, date_to, top_n, ascending)`，不必載入資料或撰寫 pandas 程式碼。
+- SQL 分析：需要多維度彙總、實績與目標或映射表 join、跨月份的前月比／去年同期比等計算時，可先以 `list_sql_tables()` 查看欄位，再以 `run_sql(query)` 執行單一 SELECT（DuckDB 語法），不必載入資料或撰寫 pandas 程式碼。
+  - 資料表：`actuals`（實績，含 `year`、`month` 欄位）、`targets`（長格式目標：`年月` 為 YYYYMM、`目標種類` 1＝受訂 2＝販賣、`目標`）、`mapping`（經銷商／營業所名稱）。
+  - `實績種類` 為字串（`'3D'`＝販賣、`'27'`＝受訂）；以 `year`、`month` 篩選時只會掃描對應月份的資料。
+  - 前月比用 `LAG(台數) OVER (PARTITION BY 經銷商代碼 ORDER BY 年月)`；去年同期比請以 `年月 - 100` 自我 join 去年同月，不要用 `LAG(台數, 12)`（缺月時會對錯月份）。
+  - 請在 SQL 中完成彙總、排序與 LIMIT，結果最多回傳 200 列。
 - 工具順序：
   1. list_files()
   2. read_excel_head(filename, sheet_name, n_rows)
@@ -188,6 +146,7 @@ filtered = df[df['日期'].dt.date == pd.to_datetime('2025-05-22').date()]
   4. analyze_dataframe(query)
 - 共通規則：
   - 時間篩選必先檢查 datetime，若未轉型則執行上述「欄位型態處理」中的日期轉型步驟。
+  - category 欄位：代碼與名稱欄位（如 `經銷商代碼`、`車名`、`實績種類`）載入時已轉為 category，groupby 時**必須**加上 `observed=True`，例如 `df.groupby(['車名'], observed=True)['台數'].sum()`。
   - 強制 groupby：任何涉及統計、排行、計數或達標分析，模型必須先辨識「問題中提及的所有關鍵維度欄位」，並對這些欄位一起呼叫 `groupby(...)` 再做聚合；絕不可直接在原始 df 上用 `idxmax()`/`idxmin()` 或只對單一欄位做 groupby。
   - 保留原始值：排行需求須保留所有原始數值（含 -1、0），並同時 groupby 代碼與名稱，例如：
     ```python
@@ -211,54 +170,57 @@ filtered = df[df['日期'].dt.date == pd.to_datetime('2025-05-22').date()]
   1. list_and_classify_files()
   2. load_excel_file(filename)
   3. classify_file_type(filename)
-  4. compare_target_vs_actual(target_key, actual_key)
+  4. compare_target_vs_actual(target_key, actual_key, kind, dealers, sites, months, include_missing)
+  5. get_comparison_page(merged_key, page, page_size, achieved)（需要更多明細時）
 - 共通規則：
   - 多 sheet 檔案由 load_excel_file 一次讀入所有 sheet，存於 dataframes["filename::sheet"]。
-  - compare_target_vs_actual 執行後須把合併結果寫回 dataframes，並由工具輸出 summary 與 detail。
+  - `kind` 為 `販賣` 或 `受訂`（未指定時不區分種類）；預設只比對目標與實績都有的據點，需要把「有目標但沒有實績」的據點以 0 台列入時才設 `include_missing=True`；問題只涉及特定經銷商、據點或月份時，**必須**以 `dealers`（經銷商代碼）、`sites`（據點代碼）、`months`（月份 1–12 或年月 YYYYMM）參數篩選，不要比對全部資料後再自行挑選。
+  - compare_target_vs_actual 會把完整合併結果寫回 dataframes（key 為回傳的 merged_key），並輸出 summary 與第一頁 detail；需要其餘明細時以 get_comparison_page 翻頁（可用 `achieved=False` 只列未達標據點）。
   - 所有數字結果必須從合併後的表格內容衍生，禁止憑空或二次計算。
 
 # 回答要求
 - 請先回報「已選擇：A. 一般分析流程」或「已選擇：B. 目標 vs. 實際流程」。
 - 當使用者詢問「某經銷商達標數量」時：
-    1. 先呼叫 compare_target_vs_actual(target_key, actual_key) 取得 merged_key。
-    2. 再呼叫 summarize_performance_summary(merged_key, dealer_name) 取得該經銷商的 summary。
-    3. 最終回傳的「總筆數／達標筆數／達標率」都取自 summarize_performance_summary 的結果，
-        不可再次自行計算。
+    1. 呼叫 compare_target_vs_actual(target_key, actual_key, dealers=[經銷商代碼]) 取得該經銷商的 summary。
+    2. 最終回傳的「總筆數／達標筆數／達標率」都取自該 summary，不可再次自行計算。
 - 不須顯示關鍵 pandas 程式碼片段與運行結果。
 - 最終回傳清晰的 Markdown 表格，以及**必須**使用 compare_target_vs_actual 回傳的 `summary` 欄位來填充「總筆數／達標筆數／達標率」，不允許模型另行計算。
 - 若資料不足或欄位不符，請明確提出並請求補充。
-- 若使用者輸入的是經銷商名稱與營業所名稱，請參照下列對應資訊查找對應的代碼：{mapping_text}
+- 若使用者輸入的是經銷商名稱與營業所名稱，請呼叫 resolve_dealer_name(name) 查找對應的代碼（支援模糊比對，如「國都新莊」、「南臺中」）。
+- 需要查詢多個經銷商/營業所代碼的名稱時，請用 get_dealer_mappings 一次查完，不要逐一呼叫 get_dealer_mapping。
 - **若結果只回傳了某個代碼（如據點代碼），務必再到原始 DataFrame 中以該代碼為 key，抓出對應的「據點名稱」或「營業所」欄位，一併回覆**。
 - 在group by 代碼的時候，必須連同名稱一並納入再去group by。
 """
 
+# 答案快取 key 的一部分：換模型、改 prompt 或工具後，舊答案不會再命中
+AGENT_VERSION = agent_version([LLM_BACKEND, COMBINE_MODEL, GENERAL_MODEL], system_message, tools)
 
-# 1. 建立 PromptTemplate（共用於兩種流程）
-prompt = ChatPromptTemplate.from_messages([
-    ("system", system_message),
-    ("human", "{input}"),
-    ("ai", "{agent_scratchpad}")
-])
-
-# 2. 轉換所有工具為 OpenAI Functions 格式
-functions = [format_tool_to_openai_function(t) for t in tools]
 
-# 3. 建立 AgentExecutor
-agent = create_openai_functions_agent(llm, tools, prompt)
-agent_executor = AgentExecutor(
-    agent=agent,
-    tools=tools,
-    verbose=True,
-    handle_parsing_errors=True
-)
+# 1–3. 建立 AgentExecutor（PromptTemplate 共用於兩種流程）；第一次查詢時才建立，import 本模組不會建立 LLM client
+@lru_cache(maxsize=None)
+def get_agent_executor():
+    return build_agent_executor(get_chat_model(COMBINE_MODEL), tools, system_message)
 
 # 4. 定義 query_agent 函式，供互動與除錯使用
-def query_agent(question: str) -> dict:
-    """向 Agent 提問並顯示中間步驟與結果"""
+def query_agent(question: str, use_cache: bool = True) -> dict:
+    """向 Agent 提問並顯示中間步驟與結果；相同問題且資料檔未變時直接回傳快取答案"""
     print(f"問題: {question}\n正在處理...\n")
+    fingerprint = data_fingerprint()
+    if use_cache:
+        cached = answer_cache.get(question, fingerprint, AGENT_VERSION)
+        if cached is not None:
+            print("（命中答案快取）")
+            print("回答:")
+            print(cached["output"])
+            return {**cached, "from_cache": True}
+    from langchain.callbacks import get_openai_callback
+
+    # 每個 Agent 步驟、模型呼叫與工具的時間、token 與記憶體，寫入 .cache/excel/traces/
+    tracer = QueryTracer(question)
     with get_openai_callback() as cb:
-        response = agent_executor.invoke(
+        response = get_agent_executor().invoke(
             {"input": question},
+            config={"callbacks": [tracer]},
             return_intermediate_steps=True,
             include_run_info=True
         )
@@ -275,9 +237,76 @@ def query_agent(question: str) -> dict:
             print(f"步驟 {i+1}: 工具=`{tool_name}` 輸入={tool_input} 輸出={tool_output}")
     # 輸出使用統計
     print(f"\n總令牌: {cb.total_tokens}  總花費: ${cb.total_cost:.6f}  請求次數: {cb.successful_requests}")
-    return response
+    trace = tracer.result()
+    if trace["summary"]:
+        print(f"總時間: {trace['summary']['duration_ms']:.0f} ms（模型 {trace['summary']['llm_ms']:.0f} ms、工具 {trace['summary']['tool_ms']:.0f} ms）")
+    if use_cache and response.get("output"):
+        answer_cache.set(question, response, fingerprint, AGENT_VERSION)
+    # 追蹤結果只屬於這一次執行，不寫入答案快取
+    return {**response, "trace": trace}
+
+# 5. 串流版本：邊執行邊回報工具進度與最終回答的 token
+async def astream_query_agent(question: str, use_cache: bool = True) -> AsyncIterator[Dict[str, Any]]:
+    """
+    以 get_agent_executor().astream_events 執行查詢，依序產生事件：
+    {"type": "tool_start", "tool", "input"}、{"type": "tool_end", "tool", "output"}、
+    {"type": "token", "text"}（主 Agent 的回答 token），最後為 {"type": "final", "response"}（含 trace）。
+    """
+    fingerprint = data_fingerprint()
+    if use_cache:
+        cached = answer_cache.get(question, fingerprint, AGENT_VERSION)
+        if cached is not None:
+            yield {"type": "final", "response": {**cached, "from_cache": True}}
+            return
+
+    response = None
+    tracer = QueryTracer(question)
+    # 第一個模型呼叫一定來自主 Agent；只轉送同一層的 token，工具內部（如 Pandas Agent）的輸出不混入回答
+    llm_depth = None
+    async for event in get_agent_executor().astream_events({"input": question}, config={"callbacks": [tracer]}, version="v2"):
+        kind = event["event"]
+        depth = len(event.get("parent_ids", []))
+        if kind == "on_chat_model_start" and llm_depth is None:
+            llm_depth = depth
+        elif kind == "on_chat_model_stream" and depth == llm_depth:
+            text = event["data"]["chunk"].content
+            if text:
+                yield {"type": "token", "text": text}
+        elif kind == "on_chain_stream" and depth == 0:
+            # AgentExecutor 的串流區塊：actions 在工具執行前送出，steps 在工具完成後送出
+            chunk = event["data"]["chunk"]
+            for action in chunk.get("actions", []):
+                yield {"type": "tool_start", "tool": action.tool, "input": action.tool_input}
+            for step in chunk.get("steps", []):
+                yield {"type": "tool_end", "tool": step.action.tool, "output": step.observation}
+        elif kind == "on_chain_end" and depth == 0:
+            response = event["data"]["output"]
+
+    if use_cache and response and response.get("output"):
+        answer_cache.set(question, response, fingerprint, AGENT_VERSION)
+    if response is not None:
+        response = {**response, "trace": tracer.result()}
+    yield {"type": "final", "response": response}
+
+
+def stream_query_agent(question: str, use_cache: bool = True) -> Iterator[Dict[str, Any]]:
+    """astream_query_agent 的同步版本（供 Streamlit 使用）：事件迴圈在背景執行緒執行，事件一產生就交回呼叫端"""
+    events: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+
+    async def pump():
+        try:
+            async for event in astream_query_agent(question, use_cache):
+                events.put(event)
+        except Exception as e:
+            events.put({"type": "error", "error": str(e)})
+        finally:
+            events.put(None)
+
+    threading.Thread(target=lambda: asyncio.run(pump()), daemon=True).start()
+    while (event := events.get()) is not None:
+        yield event
 
-# 5. 範例：在 __main__ 中呼叫 query_agent
+# 6. 範例：在 __main__ 中呼叫 query_agent
 if __name__ == "__main__":
     user_input = "請提供5/22 TOYOTA各車種的販賣台數"
     response = query_agent(user_input)
\ No newline at end of file
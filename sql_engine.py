@@ -0,0 +1,234 @@
+import os
+import json
+import importlib.util
+import pandas as pd
+from typing import Any, Dict, List, Optional, Union
+from langchain.tools import tool
+from data_cache import CACHE_DIR, cached_sheet_path, load_sheet
+from data_catalog import SHEET
+from data_context import get_data_context
+from dealer_mapping import MAPPING_FILE
+from partition_store import ACTUALS, ACTUALS_SEED_FILE, PARTITION_DIR, TARGETS, get_store
+
+# ==================================== 1. 設定 ====================================
+# duckdb 為選用套件：未安裝時 SQL 工具不加入 Agent，其餘功能不受影響
+SQL_ENGINE_AVAILABLE = importlib.util.find_spec("duckdb") is not None
+
+# 查詢使用的執行緒數（預設為 CPU 核心數）、記憶體上限，超過上限時中間結果寫入暫存目錄（out-of-core）
+SQL_ENGINE_THREADS = int(os.environ.get("SQL_ENGINE_THREADS", str(os.cpu_count() or 1)))
+SQL_MEMORY_LIMIT = os.environ.get("SQL_MEMORY_LIMIT", "1GB")
+SQL_TEMP_DIR = os.path.join(CACHE_DIR, "duckdb_tmp")
+# 單次查詢回傳給 LLM 的最大列數
+SQL_MAX_ROWS = int(os.environ.get("SQL_MAX_ROWS", "200"))
+
+# 資料庫只能存取這些目錄（Parquet 快取、分區資料集、暫存目錄），其他檔案一律拒絕
+SQL_ALLOWED_DIRS = [CACHE_DIR, PARTITION_DIR, SQL_TEMP_DIR]
+
+# 資料表來源：Parquet 路徑（含 glob）或記憶體中的 DataFrame
+Source = Union[str, pd.DataFrame]
+
+
+# ==================================== 2. 資料表登記 ====================================
+def _store_glob(name: str) -> Optional[str]:
+    """分區資料集的 Parquet 路徑樣式（year=YYYY/month=MM 目錄成為 year、month 欄位）"""
+    if not get_store(name).partitions():
+        return None
+    return os.path.join(PARTITION_DIR, name, "year=*", "month=*", "*.parquet")
+
+
+def _sheet_source(filename: str, sheet: Optional[str] = None) -> Source:
+    """工作表優先掃描清理後的 Parquet 快取檔，沒有快取時登記記憶體中的 DataFrame"""
+    return cached_sheet_path(filename, sheet) or load_sheet(filename, sheet)
+
+
+def _session_actuals() -> Optional[Source]:
+    """目前 session 已載入的實績工作表（有 日期、實績種類、台數 欄位）"""
+    frames = get_data_context().frames
+    for item in frames.resident():
+        if item["kind"] != SHEET:
+            continue
+        columns = frames[item["key"]].columns
+        if {"日期", "實績種類", "台數"}.issubset(columns):
+            filename, _, sheet = item["key"].partition("::")
+            return _sheet_source(filename, sheet or None)
+    return None
+
+
+def _session_targets() -> Optional[Source]:
+    """目前 session 已建立的長格式目標表（年月 為欄位）"""
+    targets = get_data_context().targets
+    for table in targets.values():
+        return table.frame.reset_index()
+    return None
+
+
+def resolve_tables() -> Dict[str, Source]:
+    """
+    SQL 可查詢的資料表：
+    actuals（store::actuals，否則為 session 已載入的實績工作表或半年實績檔）、
+    targets（store::targets，否則為 session 已載入的長格式目標表）、mapping（經銷商／營業所映射表）。
+    """
+    tables: Dict[str, Source] = {}
+    actuals = _store_glob(ACTUALS) or _session_actuals()
+    if actuals is None and os.path.exists(ACTUALS_SEED_FILE):
+        actuals = _sheet_source(ACTUALS_SEED_FILE)
+    if actuals is not None:
+        tables["actuals"] = actuals
+    targets = _store_glob(TARGETS) or _session_targets()
+    if targets is not None:
+        tables["targets"] = targets
+    if os.path.exists(MAPPING_FILE):
+        tables["mapping"] = _sheet_source(MAPPING_FILE)
+    return tables
+
+
+# ==================================== 3. 查詢 ====================================
+_database = None
+
+
+def _connect():
+    """
+    全程序共用一個記憶體資料庫；每次查詢以 cursor 建立獨立連線，資料表登記為該連線的暫存 view。
+    資料庫啟動後立即關閉外部存取，只保留 SQL_ALLOWED_DIRS，且不能再重新開啟；也不會以名稱掃描 Python 變數。
+    """
+    global _database
+    if _database is None:
+        import duckdb
+
+        os.makedirs(SQL_TEMP_DIR, exist_ok=True)
+        database = duckdb.connect(config={
+            "threads": SQL_ENGINE_THREADS,
+            "memory_limit": SQL_MEMORY_LIMIT,
+            "temp_directory": os.path.abspath(SQL_TEMP_DIR),
+            "python_enable_replacements": False,
+        })
+        allowed = ", ".join(_quote(os.path.join(os.path.abspath(path), "")) for path in SQL_ALLOWED_DIRS)
+        database.execute(f"SET allowed_directories = [{allowed}]")
+        database.execute("SET enable_external_access = false")
+        _database = database
+    return _database.cursor()
+
+
+def _quote(path: str) -> str:
+    return "'" + path.replace("'", "''") + "'"
+
+
+def _register(connection, tables: Dict[str, Source]) -> None:
+    """
+    登記資料表為暫存 view：分區資料集以 hive 分區讀取（year、month 由目錄取得，篩選時略過其他月份的檔案）；
+    工作表來源的實績另以 日期 算出 year、month 欄位，兩種來源可用相同的 SQL 查詢。
+    """
+    for name, source in tables.items():
+        if isinstance(source, pd.DataFrame):
+            connection.register(f"{name}_source", source)
+            scan = f"{name}_source"
+        elif "*" in source:
+            scan = f"read_parquet({_quote(os.path.abspath(source))}, hive_partitioning = true, hive_types = {{'year': INTEGER, 'month': INTEGER}}, union_by_name = true)"
+        else:
+            scan = f"read_parquet({_quote(os.path.abspath(source))})"
+        columns = [row[0] for row in connection.execute(f"DESCRIBE SELECT * FROM {scan}").fetchall()]
+        derived = ", year(日期) AS year, month(日期) AS month" if "日期" in columns and "year" not in columns else ""
+        connection.execute(f"CREATE TEMP VIEW {name} AS SELECT *{derived} FROM {scan}")
+
+
+def _table_refs(node: Any, refs: List[Dict[str, Any]], ctes: set) -> None:
+    """走訪 json_serialize_sql 的語法樹，收集所有 FROM 來源（資料表、表函數）與 CTE 名稱"""
+    if isinstance(node, dict):
+        if node.get("type") in ("BASE_TABLE", "TABLE_FUNCTION"):
+            refs.append(node)
+        for item in (node.get("cte_map") or {}).get("map", []):
+            ctes.add(item["key"].lower())
+        for value in node.values():
+            _table_refs(value, refs, ctes)
+    elif isinstance(node, list):
+        for value in node:
+            _table_refs(value, refs, ctes)
+
+
+def _check_query(connection, query: str, tables: List[str]) -> None:
+    """
+    只允許單一 SELECT（含 WITH）查詢，且 FROM 只能是已登記的資料表或 CTE：
+    表函數（read_csv、glob…）與以字串指定的檔案路徑（FROM 'x.csv'）都會被拒絕。
+    """
+    import duckdb
+
+    statements = connection.extract_statements(query)
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        raise ValueError("只允許單一 SELECT 查詢")
+    tree = json.loads(connection.execute("SELECT json_serialize_sql($1)", [query]).fetchone()[0])
+    if tree.get("error"):
+        raise ValueError(tree.get("error_message", "無法解析 SQL"))
+    refs, ctes = [], set()
+    _table_refs(tree["statements"], refs, ctes)
+    allowed = {name.lower() for name in tables} | ctes
+    for ref in refs:
+        if ref["type"] == "TABLE_FUNCTION" or ref.get("schema_name") or ref.get("catalog_name") or ref["table_name"].lower() not in allowed:
+            name = ref.get("table_name") or ref.get("function", {}).get("function_name", "")
+            raise ValueError(f"只能查詢已登記的資料表（{'、'.join(tables)}），不可直接讀取檔案或使用表函數：{name}")
+
+
+def execute_sql(query: str, max_rows: int = SQL_MAX_ROWS) -> pd.DataFrame:
+    """在目前 session 的資料表上執行唯讀 SQL，最多取回 max_rows + 1 列（用來判斷是否截斷），不會取回完整結果"""
+    connection = _connect()
+    try:
+        tables = resolve_tables()
+        _register(connection, tables)
+        _check_query(connection, query, list(tables))
+        cursor = connection.execute(query)
+        rows = cursor.fetchmany(int(max_rows) + 1)
+        return pd.DataFrame(rows, columns=[column[0] for column in cursor.description])
+    finally:
+        connection.close()
+
+
+def describe_tables() -> Dict[str, Any]:
+    connection = _connect()
+    try:
+        tables = resolve_tables()
+        _register(connection, tables)
+        described = {}
+        for name, source in tables.items():
+            columns = connection.execute(f"DESCRIBE {name}").fetchall()
+            described[name] = {
+                "source": "memory" if isinstance(source, pd.DataFrame) else source,
+                "rows": connection.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0],
+                "columns": {column[0]: column[1] for column in columns},
+            }
+        return described
+    finally:
+        connection.close()
+
+
+# ==================================== 4. LangChain 工具 ====================================
+@tool
+def list_sql_tables() -> Dict[str, Any]:
+    """
+    列出 run_sql 可查詢的資料表與欄位型態：actuals（實績）、targets（長格式目標，年月 為 YYYYMM）、mapping（經銷商／營業所映射表）。
+    來自分區資料集的資料表另有 year、month 欄位，以它們篩選時只會掃描對應月份的檔案。
+    """
+    try:
+        return describe_tables()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@tool
+def run_sql(query: str) -> Dict[str, Any]:
+    """
+    以 SQL（DuckDB 語法）查詢 actuals、targets、mapping 資料表，適合多維度彙總、join 與視窗函數
+    （如以 LAG 計算前月比、去年同期比）。只允許單一 SELECT 查詢，最多回傳 SQL_MAX_ROWS 列，請在 SQL 中完成彙總與排序。
+    """
+    try:
+        result = execute_sql(query)
+    except Exception as e:
+        return {"error": str(e)}
+    rows = result.head(SQL_MAX_ROWS)
+    return {
+        "columns": list(result.columns),
+        "row_count": int(len(rows)),
+        "truncated": len(result) > SQL_MAX_ROWS,
+        "rows": rows.astype(object).where(rows.notna(), None).to_dict(orient="records"),
+    }
+
+
+sql_tools: List = [list_sql_tables, run_sql] if SQL_ENGINE_AVAILABLE else []
@@ -3,6 +3,8 @@ import pandas as pd
 import os
 from typing import Dict, List, Optional
 import io
+import uuid
+import threading
 from datetime import datetime
 
 # 確保 API Key 可用於 LangChain 程式碼
@@ -20,8 +22,33 @@ def setup_api_key():
 # 設定 API Key
 setup_api_key()
 
-# 導入您現有的 LangChain 程式碼（不做任何修改）
-from solution_combine import query_agent, dataframes
+# LangChain 程式碼（solution_combine）在背景執行緒載入，頁面不必等待；查詢由 job_queue 取用
+from data_context import DataContext
+from job_queue import job_queue, JobLimitError, ACTIVE_STATES
+from data_cache import schema_report
+from data_schema import format_report
+from answer_cache import answer_cache
+from data_catalog import STORE_PREFIX
+from partition_store import ACTUALS, PARTITION_DIR, TARGETS, SchemaMismatchError, get_store, ingest_any
+
+# 背景查詢進行中時，進度區塊（fragment）自動更新的間隔（秒）；只重新執行該區塊，不會 rerun 整個頁面
+JOB_POLL_INTERVAL = 0.5
+
+
+@st.cache_resource(show_spinner=False)
+def warm_up_agent() -> threading.Thread:
+    """在背景預先載入 LangChain 並建立 Agent（整個程序只執行一次），第一個查詢不必等待載入"""
+    def warm():
+        try:
+            import solution_combine
+            solution_combine.get_agent_executor()
+        except Exception as e:
+            # 預熱失敗不影響頁面；第一次查詢時會重新建立並回報錯誤
+            print(f"Agent 預熱失敗: {e}")
+
+    thread = threading.Thread(target=warm, name="agent-warm-up", daemon=True)
+    thread.start()
+    return thread
 
 # 頁面配置
 st.set_page_config(
@@ -64,6 +91,17 @@ def init_session_state():
         st.session_state.chat_history = []
     if 'uploaded_files' not in st.session_state:
         st.session_state.uploaded_files = []
+    # 背景查詢：以 session 作為使用者識別，計算每位使用者的同時查詢上限
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = uuid.uuid4().hex
+    if 'active_jobs' not in st.session_state:
+        st.session_state.active_jobs = []
+    # 此 session 每個問題的成本記錄（時間、token、花費）
+    if 'cost_ledger' not in st.session_state:
+        st.session_state.cost_ledger = []
+    # 每個 session 自己的工作資料（已載入的工作表、目前資料集），解析結果則由所有 session 共用
+    if 'data_context' not in st.session_state:
+        st.session_state.data_context = DataContext(st.session_state.user_id)
 
 init_session_state()
 
@@ -95,16 +133,48 @@ def sidebar_navigation():
         else:
             st.sidebar.markdown(f"❌ {file}")
     
-    # 顯示已載入的 dataframes 狀態
-    if dataframes:
+    # 顯示此 session 在記憶體中的資料與占用量
+    catalog = st.session_state.data_context.frames
+    resident = catalog.resident()
+    if resident:
         st.sidebar.markdown("### 📊 已載入資料")
-        for key in dataframes.keys():
-            df = dataframes[key]
-            st.sidebar.markdown(f"• {key}: {len(df)} 行")
+        for item in resident:
+            icon = {"derived": "🧮", "store": "🗂️"}.get(item["kind"], "📄")
+            st.sidebar.markdown(f"{icon} {item['key']}: {item['rows']:,} 行，{item['memory_bytes'] / 1024 ** 2:.1f} MB")
+        budget_mb = catalog.budget_usage() / 1024 ** 2
+        st.sidebar.caption(
+            f"合計 {catalog.memory_usage() / 1024 ** 2:.1f} MB；"
+            f"衍生資料與分區資料集 {budget_mb:.1f} / {catalog.derived_budget_bytes / 1024 ** 2:.0f} MB（超過時淘汰最久未使用者）"
+        )
     
     return page
 
 # 檔案上傳功能
+def ingest_delta_files(delta_files) -> None:
+    """保存並匯入每日實績增量、其他年度的實績或目標檔；檔案存於分區目錄下，不會出現在 list_files 的資料檔中"""
+    incoming_dir = os.path.join(PARTITION_DIR, "incoming")
+    os.makedirs(incoming_dir, exist_ok=True)
+    for delta_file in delta_files:
+        path = os.path.join(incoming_dir, delta_file.name)
+        try:
+            with open(path, "wb") as f:
+                f.write(delta_file.getbuffer())
+            result = ingest_any(path)
+        except SchemaMismatchError as e:
+            st.error(f"❌ {delta_file.name} 格式不符，未匯入：{e}")
+            continue
+        except Exception as e:
+            st.error(f"❌ 匯入失敗：{delta_file.name} - {str(e)}")
+            continue
+
+        if result["skipped"]:
+            st.info(f"ℹ️ {delta_file.name}：{result['reason']}")
+        else:
+            months = "、".join(str(month) for month in result["written"])
+            st.success(f"✅ 已匯入 {delta_file.name} → {result['store']}：{result['appended_rows']:,} 筆（{months}）")
+            answer_cache.invalidate_file(result["store"])
+
+
 def file_upload_page():
     st.markdown('<div class="main-header">📤 資料上傳</div>', unsafe_allow_html=True)
     
@@ -147,6 +217,12 @@ def file_upload_page():
                     
                     st.success(f"✅ 已保存檔案：{uploaded_file.name}")
                     
+                    # 資料已變更：此 session 已載入的工作表、衍生資料、立方體與目標表重新取得，並清除依賴此檔案的快取答案
+                    st.session_state.data_context.frames.invalidate_file(file_path)
+                    invalidated = answer_cache.invalidate_file(file_path)
+                    if invalidated:
+                        st.info(f"🧹 已清除 {invalidated} 筆相關的快取答案")
+                    
                     # 顯示檔案基本資訊
                     file_size = len(uploaded_file.getbuffer())
                     st.info(f"📁 檔案大小：{file_size:,} bytes")
@@ -156,6 +232,27 @@ def file_upload_page():
         
         st.markdown("---")
         
+        st.markdown("### 📥 每日實績增量與歷年資料")
+        delta_files = st.file_uploader(
+            "選擇每日 MBIS 實績增量檔、其他年度的實績檔或目標檔",
+            type=['xlsx', 'xls'],
+            accept_multiple_files=True,
+            key="delta_uploader",
+            help="實績檔欄位須與 MBIS實績_2025上半年.xlsx 相同，依日期的年月分區；目標檔依年月分區，同月份的目標以新檔取代"
+        )
+        if delta_files and st.button("📥 匯入", key="ingest_delta"):
+            ingest_delta_files(delta_files)
+        for name, label in ((ACTUALS, "實績"), (TARGETS, "目標")):
+            store = get_store(name)
+            if store.partitions():
+                info = store.describe()
+                st.caption(
+                    f"分區{label}資料（{STORE_PREFIX}{name}）：{info['rows']:,} 筆，"
+                    f"{info['date_range'][0]} ～ {info['date_range'][1]}，共 {len(info['partitions'])} 個月分區"
+                )
+        
+        st.markdown("---")
+        
         st.markdown("### 📁 目前檔案狀態")
         
         # 檢查並顯示檔案狀態
@@ -207,7 +304,8 @@ def file_upload_page():
 def data_view_page():
     st.markdown('<div class="main-header">📊 資料檢視</div>', unsafe_allow_html=True)
     
-    # 顯示目前已載入的 dataframes
+    # 顯示此 session 目前已載入的資料
+    dataframes = st.session_state.data_context.frames
     if not dataframes:
         st.info("📝 尚未載入任何資料。請先在「智能問答」中提問以載入資料，或確保必要檔案存在於目錄中。")
         return
@@ -253,6 +351,14 @@ def data_view_page():
             })
             st.dataframe(col_info, use_container_width=True)
 
+            # 型態壓縮報告（載入時將代碼/名稱轉 category、台數轉最小整數型態）
+            filename, _, sheet_name = selected_key.partition("::")
+            if sheet_name and "_vs_" not in selected_key and os.path.exists(filename):
+                report = schema_report(filename, sheet_name)
+                if report:
+                    with st.expander("💾 型態壓縮報告", expanded=False):
+                        st.dataframe(format_report(report), use_container_width=True)
+
 # 智能問答功能
 def qa_interface_page():
     st.markdown('<div class="main-header">💬 智能問答</div>', unsafe_allow_html=True)
@@ -321,83 +427,96 @@ def qa_interface_page():
             st.rerun()
     
     with col1:
-        # 顯示聊天歷史
-        for message in st.session_state.chat_history:
+        # 顯示聊天歷史；最近一次回答附上 DEBUG 資訊
+        history = st.session_state.chat_history
+        for i, message in enumerate(history):
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+                if "debug" in message and i == len(history) - 1:
+                    display_debug_info(message["debug"]["response"], message["debug"]["question"])
+        
+        # 顯示背景查詢的進度與結果
+        for job_id in list(st.session_state.active_jobs):
+            render_job(job_id)
         
         # 處理範例查詢
         if 'example_query' in st.session_state:
             prompt = st.session_state.example_query
             del st.session_state.example_query
-            
-            # 添加用戶消息
-            st.session_state.chat_history.append({"role": "user", "content": prompt})
-            
-            with st.chat_message("user"):
-                st.markdown(prompt)
-            
-            # 生成回應
-            with st.chat_message("assistant"):
-                with st.spinner("正在分析..."):
-                    try:
-                        # 呼叫您現有的 query_agent 函數（完全不修改）
-                        response = query_agent(prompt)
-                        
-                        # 顯示結果
-                        if response and "output" in response:
-                            result = response["output"]
-                            st.markdown(result)
-                            
-                            # 顯示 DEBUG 資訊
-                            display_debug_info(response, prompt)
-                            
-                            # 添加助手回應到聊天記錄
-                            st.session_state.chat_history.append({"role": "assistant", "content": result})
-                        else:
-                            error_msg = "❌ 無法取得分析結果"
-                            st.error(error_msg)
-                            st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
-                            
-                    except Exception as e:
-                        error_msg = f"❌ 處理查詢時發生錯誤: {str(e)}"
-                        st.error(error_msg)
-                        st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
+            submit_query(prompt)
         
         # 用戶輸入
         if prompt := st.chat_input("請輸入您的問題..."):
-            # 添加用戶消息
-            st.session_state.chat_history.append({"role": "user", "content": prompt})
-            
-            with st.chat_message("user"):
-                st.markdown(prompt)
-            
-            # 生成回應
-            with st.chat_message("assistant"):
-                with st.spinner("正在分析..."):
-                    try:
-                        # 呼叫您現有的 query_agent 函數（完全不修改）
-                        response = query_agent(prompt)
-                        
-                        # 顯示結果
-                        if response and "output" in response:
-                            result = response["output"]
-                            st.markdown(result)
-                            
-                            # 顯示 DEBUG 資訊
-                            display_debug_info(response, prompt)
-                            
-                            # 添加助手回應到聊天記錄
-                            st.session_state.chat_history.append({"role": "assistant", "content": result})
-                        else:
-                            error_msg = "❌ 無法取得分析結果"
-                            st.error(error_msg)
-                            st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
-                            
-                    except Exception as e:
-                        error_msg = f"❌ 處理查詢時發生錯誤: {str(e)}"
-                        st.error(error_msg)
-                        st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
+            submit_query(prompt)
+
+# 送出問題到背景佇列
+def submit_query(prompt: str):
+    """送出問題到背景查詢佇列，進度與結果由 render_job 取回"""
+    # 添加用戶消息
+    st.session_state.chat_history.append({"role": "user", "content": prompt})
+    try:
+        job_id = job_queue.submit(st.session_state.user_id, prompt, st.session_state.data_context)
+        st.session_state.active_jobs.append(job_id)
+    except JobLimitError as e:
+        st.session_state.chat_history.append({"role": "assistant", "content": f"⏳ {e}"})
+    st.rerun()
+
+# 顯示背景查詢的進度與結果
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def render_job(job_id: str):
+    """
+    顯示工作目前為止的工具進度與回答 token，每 JOB_POLL_INTERVAL 秒只更新此區塊。
+    完成後把結果與 DEBUG 資訊寫入聊天記錄，再 rerun 整個頁面讓結果移入聊天歷史、停止更新。
+    """
+    job = job_queue.status(job_id)
+    if job is None:
+        st.session_state.active_jobs.remove(job_id)
+        st.rerun()
+    
+    with st.chat_message("assistant"):
+        running = job["status"] in ACTIVE_STATES
+        label = "⏳ 排隊中..." if job["status"] == "queued" else "正在分析..."
+        status = st.status(label, expanded=False, state="running" if running else "complete")
+        answer = st.empty()
+        tokens = []
+        
+        for event in job_queue.events(job_id):
+            if event["type"] == "tool_start":
+                # 工具呼叫前的文字不是最終回答，清掉重新累積
+                tokens = []
+                status.update(label=f"🔧 執行工具：{event['tool']}")
+                status.markdown(f"🔧 `{event['tool']}` 輸入：`{event['input']}`")
+            elif event["type"] == "tool_end":
+                status.markdown(f"✅ `{event['tool']}` 完成")
+            elif event["type"] == "token":
+                tokens.append(event["text"])
+        
+        if running:
+            if tokens:
+                answer.markdown("".join(tokens) + "▌")
+            if st.button("⏹️ 取消查詢", key=f"cancel_{job_id}"):
+                job_queue.cancel(job_id)
+            return
+        
+    st.session_state.active_jobs.remove(job_id)
+    response = job["response"]
+    
+    # 結果寫入聊天記錄（DEBUG 資訊隨回答保存，由聊天歷史顯示）
+    if job["status"] == "done":
+        # 記錄此問題的成本（命中答案快取時沒有追蹤結果）
+        trace = response.get("trace") or {}
+        if trace.get("summary"):
+            st.session_state.cost_ledger.append(trace["summary"])
+        st.session_state.chat_history.append({
+            "role": "assistant",
+            "content": response["output"],
+            "debug": {"response": response, "question": job["question"]},
+        })
+    elif job["status"] == "cancelled":
+        st.session_state.chat_history.append({"role": "assistant", "content": "⏹️ 查詢已取消"})
+    else:
+        st.session_state.chat_history.append({"role": "assistant", "content": f"❌ 處理查詢時發生錯誤: {job['error']}"})
+    st.rerun()
 
 # DEBUG INFO 顯示函數
 def display_debug_info(response: dict, prompt: str):
@@ -479,20 +598,97 @@ def display_debug_info(response: dict, prompt: str):
     with st.expander("📊 執行統計", expanded=False):
         st.markdown("### 查詢資訊")
         st.markdown(f"**原始查詢:** `{prompt}`")
+        if response.get("from_cache"):
+            st.markdown("**⚡ 此回答來自答案快取（問題與資料檔皆未變更）**")
         
         if hasattr(response, 'get'):
             # 如果有統計資訊
             if 'usage' in response:
                 st.json(response['usage'])
             
+            # 每個 Agent 步驟、模型呼叫與工具的時間軸
+            if response.get("trace") and response["trace"].get("summary"):
+                display_trace(response["trace"])
+            
+            # 此 session 的問題成本記錄
+            if st.session_state.get("cost_ledger"):
+                st.markdown("### 💰 問題成本記錄")
+                ledger = pd.DataFrame(st.session_state.cost_ledger)
+                st.dataframe(
+                    ledger[["started_at", "question", "duration_ms", "llm_ms", "tool_ms", "llm_calls", "total_tokens", "cost_usd"]]
+                    .rename(columns={
+                        "started_at": "時間", "question": "問題", "duration_ms": "總時間 ms", "llm_ms": "模型 ms",
+                        "tool_ms": "工具 ms", "llm_calls": "模型呼叫", "total_tokens": "tokens", "cost_usd": "花費 USD",
+                    })
+                    .round(1),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+                st.caption(f"共 {len(ledger)} 題，合計 {ledger['total_tokens'].sum():,} tokens、${ledger['cost_usd'].sum():.4f}")
+            
             # 顯示回應的所有 key
             st.markdown("**回應結構:**")
             st.code(f"回應類型: {type(response)}")
             if isinstance(response, dict):
                 st.code(f"回應欄位: {list(response.keys())}")
 
+# 追蹤結果的時間軸（waterfall）
+def display_trace(trace: dict):
+    """顯示查詢的成本摘要與各 span（查詢、Agent 步驟、模型呼叫、工具）的時間軸"""
+    import altair as alt
+    
+    summary = trace["summary"]
+    st.markdown("### ⏱️ 執行時間軸")
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("總時間", f"{summary['duration_ms'] / 1000:.2f} 秒")
+    col2.metric("模型", f"{summary['llm_ms'] / 1000:.2f} 秒", f"{summary['llm_calls']} 次呼叫", delta_color="off")
+    tool_calls = f"{summary['tool_calls']} 次呼叫"
+    if summary.get("nested_llm_calls"):
+        tool_calls += f"（含模型 {summary['nested_llm_calls']} 次、{summary['nested_llm_ms'] / 1000:.2f} 秒）"
+    col3.metric("工具", f"{summary['tool_ms'] / 1000:.2f} 秒", tool_calls, delta_color="off")
+    col4.metric("Tokens", f"{summary['total_tokens']:,}", f"輸入 {summary['prompt_tokens']:,}／輸出 {summary['completion_tokens']:,}", delta_color="off")
+    col5.metric("花費", f"${summary['cost_usd']:.4f}")
+    
+    spans = trace["spans"]
+    root_start = min(span["start"] for span in spans)
+    by_id = {span["span_id"]: span for span in spans}
+    rows = []
+    for i, span in enumerate(spans):
+        # 依巢狀深度縮排，工具內的 Pandas Agent 顯示在該工具之下
+        depth, parent = 0, by_id.get(span["parent_id"])
+        while parent is not None:
+            depth, parent = depth + 1, by_id.get(parent["parent_id"])
+        rows.append({
+            "span": f"{i + 1:02d} {'　' * depth}{span['name']}",
+            "種類": span["kind"],
+            "開始 ms": (span["start"] - root_start) * 1000,
+            "結束 ms": (span["end"] - root_start) * 1000,
+            "耗時 ms": round(span["duration_ms"], 1),
+            "輸入 tokens": span.get("prompt_tokens"),
+            "輸出 tokens": span.get("completion_tokens"),
+            "記憶體峰值增量 MB": None if span.get("memory_peak_delta_mb") is None else round(span["memory_peak_delta_mb"], 1),
+            "錯誤": span.get("error"),
+        })
+    timeline = pd.DataFrame(rows)
+    chart = alt.Chart(timeline).mark_bar().encode(
+        x=alt.X("開始 ms:Q", title="ms"),
+        x2="結束 ms:Q",
+        y=alt.Y("span:N", sort=None, title=None),
+        color=alt.Color("種類:N"),
+        tooltip=["span", "種類", "耗時 ms", "輸入 tokens", "輸出 tokens", "記憶體峰值增量 MB", "錯誤"],
+    ).properties(height=max(120, 22 * len(timeline)))
+    st.altair_chart(chart, use_container_width=True)
+    with st.expander("各 span 明細", expanded=False):
+        st.dataframe(timeline.drop(columns=["開始 ms", "結束 ms"]), use_container_width=True, hide_index=True)
+    st.caption(
+        f"模型與工具以外的時間（prompt 組裝、解析、序列化）約 {summary['other_ms']:.0f} ms；"
+        f"追蹤 ID `{summary['trace_id']}`，完整記錄於 .cache/excel/traces/"
+    )
+
 # 主要應用程式
 def main():
+    warm_up_agent()
+
     # 頁面導航
     current_page = sidebar_navigation()
     
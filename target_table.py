@@ -0,0 +1,150 @@
+import os
+import re
+import pandas as pd
+from typing import Dict, List, Optional
+from data_context import get_data_context
+
+# ==================================== 1. 設定 ====================================
+# 目標表的維度欄位（據點代碼統一改稱營業所代碼，與實績表相同）
+TARGET_COLUMN_ALIASES = {"據點代碼": "營業所代碼"}
+TARGET_DIMS = ["廠牌", "經銷商代碼", "營業所代碼", "課別代碼"]
+TARGET_VALUE_COLUMNS = ["目標台數", "目標數"]
+
+# 寬表格式的月份目標欄位，如 1月目標、12月目標
+MONTHLY_TARGET_PATTERN = re.compile(r"(\d{1,2})月目標")
+
+
+def _monthly_columns(df: pd.DataFrame) -> Dict[int, str]:
+    return {int(m.group(1)): col for col in df.columns if (m := MONTHLY_TARGET_PATTERN.fullmatch(str(col)))}
+
+
+def is_target_frame(df: pd.DataFrame) -> bool:
+    """是否為目標表：有經銷商與據點代碼，以及 目標台數 / 目標數 或 X月目標 欄位"""
+    has_keys = "經銷商代碼" in df.columns and ("據點代碼" in df.columns or "營業所代碼" in df.columns)
+    return has_keys and (df.columns.isin(TARGET_VALUE_COLUMNS).any() or bool(_monthly_columns(df)))
+
+
+def infer_year(name: str) -> Optional[int]:
+    """由檔名（如 目標_2025上半年.xlsx）取得年度"""
+    match = re.search(r"(20\d{2})", os.path.basename(name))
+    return int(match.group(1)) if match else None
+
+
+def _year_month(values: pd.Series) -> pd.Series:
+    """年月欄位統一為 YYYYMM 整數（接受 202501、'2025-01'、'2025/01'、日期）"""
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values.dt.year * 100 + values.dt.month
+    digits = values.astype(str).str.replace(r"\D", "", regex=True).str[:6]
+    return pd.to_numeric(digits, errors="coerce")
+
+
+# ==================================== 2. 長格式目標表 ====================================
+class TargetTable:
+    """
+    目標表的長格式：每列為（年月, 目標種類, 廠牌, 經銷商代碼, 營業所代碼, 課別代碼）→ 目標，
+    以 年月（YYYYMM）為排序後的 index。載入時轉換一次，之後當月與累計目標都是 index 區間切片。
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, year: Optional[int] = None) -> "TargetTable":
+        """
+        由原始目標工作表建立：已有 年月 + 目標台數（或目標數）欄位時直接整理，
+        寬表格式（X月目標）則 melt 成長格式，年度取自 年度 欄位或 year 參數。
+        """
+        df = df.rename(columns=TARGET_COLUMN_ALIASES)
+        dims = [dim for dim in TARGET_DIMS if dim in df.columns]
+        keys = dims + (["目標種類"] if "目標種類" in df.columns else [])
+        value_col = next((col for col in TARGET_VALUE_COLUMNS if col in df.columns), None)
+        monthly = _monthly_columns(df)
+
+        if value_col is not None:
+            if "年月" not in df.columns:
+                raise ValueError(f"目標表有 {value_col} 但缺少 年月 欄位")
+            long = df[keys].assign(年月=_year_month(df["年月"]), 目標=df[value_col])
+        elif monthly:
+            if "年度" in df.columns:
+                years = pd.to_numeric(df["年度"], errors="coerce")
+            elif year is not None:
+                years = pd.Series(year, index=df.index)
+            else:
+                raise ValueError("X月目標 格式的目標表缺少 年度 欄位，且無法由檔名判斷年度")
+            long = df[keys + list(monthly.values())].assign(年度=years).melt(
+                id_vars=keys + ["年度"], value_vars=list(monthly.values()), var_name="月份欄位", value_name="目標"
+            )
+            long["年月"] = long["年度"] * 100 + long["月份欄位"].map({col: month for month, col in monthly.items()})
+            long = long.drop(columns=["年度", "月份欄位"])
+        else:
+            raise ValueError("目標表缺少 目標台數 / 目標數 / X月目標 欄位")
+
+        long = long.dropna(subset=["年月"])
+        long["年月"] = long["年月"].astype("int32")
+        long["目標"] = pd.to_numeric(long["目標"], errors="coerce").fillna(0).astype("int64")
+        if "目標種類" in long.columns:
+            long["目標種類"] = pd.to_numeric(long["目標種類"], errors="coerce").astype("Int8")
+        frame = long.set_index("年月").sort_index(kind="stable")
+        return cls(frame[keys + ["目標"]])
+
+    @property
+    def year_months(self) -> List[int]:
+        return self.frame.index.unique().tolist()
+
+    def _select_kind(self, frame: pd.DataFrame, kind: Optional[int]) -> pd.DataFrame:
+        if kind is None or "目標種類" not in frame.columns:
+            return frame
+        return frame[(frame["目標種類"] == kind).to_numpy(dtype=bool, na_value=False)]
+
+    def between(self, start: Optional[int] = None, end: Optional[int] = None, kind: Optional[int] = None) -> pd.DataFrame:
+        """年月介於 start～end（YYYYMM，含頭尾）的目標；kind 為目標種類代碼（1＝受訂、2＝販賣）"""
+        return self._select_kind(self.frame.loc[start:end], kind)
+
+    def month(self, year_month: int, kind: Optional[int] = None) -> pd.DataFrame:
+        """單月目標"""
+        return self.between(year_month, year_month, kind)
+
+    def year_to_date(self, year_month: int, kind: Optional[int] = None) -> pd.DataFrame:
+        """當年 1 月至 year_month 的累計目標"""
+        return self.between(year_month // 100 * 100 + 1, year_month, kind)
+
+    def select(self, months: Optional[List[int]] = None, kind: Optional[int] = None) -> pd.DataFrame:
+        """指定月份的目標：months 可為月份（1–12，表中每個年度的該月）或年月（YYYYMM），空白表示全部"""
+        if not months:
+            return self.between(kind=kind)
+        years = {year_month // 100 for year_month in self.year_months}
+        wanted = sorted({m for m in months if m > 12} | {year * 100 + m for m in months if m <= 12 for year in years})
+        wanted = [year_month for year_month in wanted if year_month in self.frame.index]
+        return self._select_kind(self.frame.loc[wanted], kind)
+
+    def describe(self) -> Dict:
+        months = self.year_months
+        return {
+            "rows": int(len(self.frame)),
+            "year_months": [int(months[0]), int(months[-1])] if months else [],
+            "dims": [col for col in self.frame.columns if col != "目標"],
+        }
+
+
+# ==================================== 3. Session 取用 ====================================
+def get_target_table(key: str, start: Optional[int] = None, end: Optional[int] = None) -> TargetTable:
+    """
+    取得目前 session 中 filename::sheet 的長格式目標表；load_excel_file 未預先建立時於第一次使用時建立。
+    store::targets 為依年月分區的目標資料集，只讀取 start～end（YYYYMM）的分區，結果不保存在 session 中。
+    """
+    from data_catalog import STORE_PREFIX
+
+    if key.startswith(STORE_PREFIX):
+        from partition_store import read_period
+
+        return TargetTable(read_period(key, start, end).set_index("年月").sort_index(kind="stable"))
+
+    context = get_data_context()
+    targets, dataframes = context.targets, context.frames
+    # 來源檔案已被覆蓋時先清除舊的目標表
+    dataframes.refresh(key)
+    if key not in targets:
+        if key not in dataframes:
+            raise ValueError(f"找不到資料集 {key}，請先使用 load_excel_file 載入")
+        targets[key] = TargetTable.from_frame(dataframes[key], infer_year(key.partition("::")[0]))
+    return targets[key]
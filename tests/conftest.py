@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 快取、分區與追蹤都寫到暫存目錄，不影響專案目錄中的 .cache（須在匯入專案模組前設定）
+_CACHE_ROOT = tempfile.mkdtemp(prefix="hotai-tests-")
+os.environ.setdefault("EXCEL_CACHE_DIR", os.path.join(_CACHE_ROOT, "excel"))
+os.environ.setdefault("PARTITION_DIR", os.path.join(_CACHE_ROOT, "partitions"))
+os.environ.setdefault("TRACING", "off")
+
+
+@pytest.fixture
+def write_workbook():
+    """
+    寫入活頁簿 {工作表: DataFrame}，回傳路徑字串。
+    覆蓋既有檔案時把 mtime 往後推，大小相同、在同一時間刻度內寫入也能被 (mtime, size) 判斷為已變動。
+    """
+    def write(path, sheets):
+        path = str(path)
+        previous = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        with pd.ExcelWriter(path) as writer:
+            for sheet, df in sheets.items():
+                df.to_excel(writer, sheet_name=sheet, index=False)
+        if previous is not None:
+            mtime = max(os.stat(path).st_mtime_ns, previous + 1_000_000_000)
+            os.utime(path, ns=(mtime, mtime))
+        return path
+
+    return write
@@ -0,0 +1,75 @@
+import os
+import time
+import pandas as pd
+import pytest
+from answer_cache import AnswerCache, DiskBackend, MemoryBackend, data_fingerprint, normalize_question
+
+FINGERPRINT = {"MBIS實績_2025上半年.xlsx": "aaa", "經銷商目標_2025上半年.xlsx": "bbb"}
+
+
+@pytest.fixture
+def cache():
+    return AnswerCache(MemoryBackend())
+
+
+# ==================================== 1. key 的組成 ====================================
+def test_equivalent_questions_share_a_key(cache):
+    cache.set("TOYOTA 販賣台數？", {"output": "1"}, FINGERPRINT)
+    assert normalize_question("ｔｏｙｏｔａ  販賣台數。") == normalize_question("TOYOTA 販賣台數？")
+    assert cache.get("ｔｏｙｏｔａ  販賣台數。", FINGERPRINT) == {"output": "1"}
+
+
+def test_changed_data_misses(cache):
+    cache.set("問題", {"output": "1"}, FINGERPRINT)
+    assert cache.get("問題", {**FINGERPRINT, "MBIS實績_2025上半年.xlsx": "ccc"}) is None
+    assert cache.get("問題", {**FINGERPRINT, "actuals": "2"}) is None
+
+
+def test_changed_agent_version_misses(cache):
+    cache.set("問題", {"output": "1"}, FINGERPRINT, version="v1")
+    assert cache.get("問題", FINGERPRINT, version="v1") == {"output": "1"}
+    assert cache.get("問題", FINGERPRINT, version="v2") is None
+    assert cache.get("問題", FINGERPRINT) is None
+
+
+def test_fingerprint_follows_file_content(tmp_path, monkeypatch, write_workbook):
+    monkeypatch.chdir(tmp_path)
+    write_workbook("a.xlsx", {"工作表1": pd.DataFrame({"台數": [1]})})
+    before = data_fingerprint()
+    assert set(before) >= {"a.xlsx"}
+    write_workbook("a.xlsx", {"工作表1": pd.DataFrame({"台數": [2]})})
+    assert data_fingerprint()["a.xlsx"] != before["a.xlsx"]
+
+
+# ==================================== 2. 失效與淘汰 ====================================
+def test_invalidate_file_drops_dependent_answers(cache):
+    cache.set("問題一", {"output": "1"}, FINGERPRINT)
+    cache.set("問題二", {"output": "2"}, {"其他.xlsx": "ddd"})
+    assert cache.invalidate_file("/uploads/MBIS實績_2025上半年.xlsx") == 1
+    assert cache.get("問題一", FINGERPRINT) is None
+    assert cache.get("問題二", {"其他.xlsx": "ddd"}) == {"output": "2"}
+
+
+def test_ttl_expiry():
+    cache = AnswerCache(MemoryBackend(), ttl_seconds=0)
+    cache.set("問題", {"output": "1"}, FINGERPRINT)
+    time.sleep(0.01)
+    assert cache.get("問題", FINGERPRINT) is None
+
+
+def test_disk_lru_order_survives_restart(tmp_path):
+    directory = str(tmp_path / "answers")
+    cache = AnswerCache(DiskBackend(directory), max_entries=2)
+    cache.set("舊問題", {"output": "1"}, FINGERPRINT)
+    time.sleep(0.02)
+    cache.set("新問題", {"output": "2"}, FINGERPRINT)
+    time.sleep(0.02)
+    # 命中使舊問題成為最近使用者
+    assert cache.get("舊問題", FINGERPRINT) == {"output": "1"}
+
+    restarted = AnswerCache(DiskBackend(directory), max_entries=2)
+    time.sleep(0.02)
+    restarted.set("第三個問題", {"output": "3"}, FINGERPRINT)
+    assert restarted.get("舊問題", FINGERPRINT) == {"output": "1"}
+    assert restarted.get("新問題", FINGERPRINT) is None
+    assert len(os.listdir(directory)) == 2
@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+from data_context import DataContext, use_data_context
+from solution3 import COMPARISON_MAX_PAGE_SIZE, COMPARISON_PAGE_SIZE, compare_target_vs_actual, get_comparison_page
+
+TARGET_KEY = "目標_2025.xlsx::工作表1"
+ACTUAL_KEY = "實績_2025.xlsx::工作表1"
+SITES = 25
+
+
+@pytest.fixture
+def context():
+    """經銷商 A 的 25 個據點 1 月目標各 10 台；據點 i 的實績為 i 台，最後一個據點沒有實績"""
+    context = DataContext("comparison")
+    context.frames[TARGET_KEY] = pd.DataFrame({
+        "經銷商代碼": "A", "據點代碼": range(1, SITES + 1), "1月目標": 10, "2月目標": 0,
+    })
+    context.frames[ACTUAL_KEY] = pd.DataFrame({
+        "日期": pd.Timestamp("2025-01-15"), "經銷商代碼": "A", "營業所代碼": range(1, SITES), "實績種類": "3D",
+        "台數": range(1, SITES),
+    })
+    with use_data_context(context):
+        yield context
+
+
+def _compare(**kwargs):
+    return compare_target_vs_actual.invoke({"target_key": TARGET_KEY, "actual_key": ACTUAL_KEY, "months": [1], **kwargs})
+
+
+# ==================================== 1. 比對與 summary ====================================
+def test_inner_join_skips_sites_without_actuals(context):
+    result = _compare()
+    assert result["summary"]["total_matches"] == SITES - 1
+    # 據點 10～24 達標
+    assert result["summary"]["achieved"] == 15
+    assert context.frames[result["merged_key"]]["營業所代碼"].max() == SITES - 1
+
+
+def test_include_missing_counts_sites_as_zero(context):
+    result = _compare(include_missing=True)
+    assert result["summary"]["total_matches"] == SITES
+    assert result["summary"]["achieved"] == 15
+    last = context.frames[result["merged_key"]].iloc[-1]
+    assert (last["營業所代碼"], last["actual_sales"], last["達標"]) == (SITES, 0, False)
+
+
+# ==================================== 2. 分頁 ====================================
+def test_first_page_and_note(context):
+    result = _compare()
+    detail = result["detail"]
+    assert (detail["page"], detail["page_size"], detail["total_pages"]) == (1, COMPARISON_PAGE_SIZE, 2)
+    assert len(detail["rows"]) == COMPARISON_PAGE_SIZE
+    assert "get_comparison_page" in result["note"]
+
+
+def test_page_bounds_are_clamped(context):
+    merged_key = _compare()["merged_key"]
+    last = get_comparison_page.invoke({"merged_key": merged_key, "page": 2})
+    assert [row["營業所代碼"] for row in last["rows"]] == [21, 22, 23, 24]
+    # 超出範圍的頁碼取最後一頁 / 第一頁
+    assert get_comparison_page.invoke({"merged_key": merged_key, "page": 99})["page"] == 2
+    assert get_comparison_page.invoke({"merged_key": merged_key, "page": 0})["page"] == 1
+
+    large = get_comparison_page.invoke({"merged_key": merged_key, "page_size": 1000})
+    assert (large["page_size"], large["total_pages"], len(large["rows"])) == (COMPARISON_MAX_PAGE_SIZE, 1, SITES - 1)
+    single = get_comparison_page.invoke({"merged_key": merged_key, "page_size": 0})
+    assert (single["page_size"], single["total_pages"]) == (1, SITES - 1)
+
+
+def test_achieved_filter(context):
+    merged_key = _compare()["merged_key"]
+    missed = get_comparison_page.invoke({"merged_key": merged_key, "achieved": False})
+    assert missed["total_rows"] == 9
+    assert not any(row["達標"] for row in missed["rows"])
+
+
+def test_empty_result_has_one_page(context):
+    merged_key = _compare(dealers=["Z"])["merged_key"]
+    page = get_comparison_page.invoke({"merged_key": merged_key, "page": 3})
+    assert (page["page"], page["total_pages"], page["rows"]) == (1, 1, [])
+
+
+def test_unknown_key_returns_error(context):
+    assert "error" in get_comparison_page.invoke({"merged_key": "不存在"})
+    assert "error" in compare_target_vs_actual.invoke({"target_key": "不存在", "actual_key": ACTUAL_KEY})
@@ -0,0 +1,71 @@
+import os
+import threading
+import pandas as pd
+from data_cache import SignatureIndex, cached_sheet_path, file_content_hash, load_sheet, load_sheet_head
+
+
+def _sales(counts):
+    return pd.DataFrame({"車名": [f" 車款{i} " for i in range(len(counts))], "台數": counts})
+
+
+# ==================================== 1. 依檔案內容快取 ====================================
+def test_load_sheet_reparses_after_overwrite(tmp_path, write_workbook):
+    path = write_workbook(tmp_path / "actual.xlsx", {"工作表1": _sales([1, 2])})
+    first_hash = file_content_hash(path)
+    assert load_sheet(path)["台數"].tolist() == [1, 2]
+    assert load_sheet(path)["車名"].tolist() == ["車款0", "車款1"]
+    assert cached_sheet_path(path) is not None
+
+    write_workbook(path, {"工作表1": _sales([3, 4, 5])})
+    assert file_content_hash(path) != first_hash
+    assert cached_sheet_path(path) is None
+    assert load_sheet(path)["台數"].tolist() == [3, 4, 5]
+
+
+def test_sheet_head_does_not_parse_whole_sheet(tmp_path, write_workbook):
+    path = write_workbook(tmp_path / "actual.xlsx", {"工作表1": _sales(list(range(50)))})
+
+    head = load_sheet_head(path, n_rows=3)
+    assert head["台數"].tolist() == [0, 1, 2]
+    assert head["車名"].tolist() == ["車款0", "車款1", "車款2"]
+    # 預覽不會建立完整工作表的快取
+    assert cached_sheet_path(path) is None
+
+    load_sheet(path)
+    assert load_sheet_head(path, n_rows=2)["台數"].tolist() == [0, 1]
+
+
+# ==================================== 2. 持久化索引 ====================================
+def test_signature_index_misses_after_file_changes(tmp_path, write_workbook):
+    path = write_workbook(tmp_path / "target.xlsx", {"工作表1": _sales([1])})
+    index = SignatureIndex("test_signature_index")
+    index.put(path, {"type": "target"})
+    assert index.get(path) == {"type": "target"}
+    # 另一個程序（新的實例）讀回持久化的結果
+    assert SignatureIndex("test_signature_index").get(path) == {"type": "target"}
+
+    write_workbook(path, {"工作表1": _sales([1, 2])})
+    assert index.get(path) is None
+
+
+def test_signature_index_concurrent_puts(tmp_path):
+    paths = []
+    for i in range(16):
+        path = tmp_path / f"f{i}.txt"
+        path.write_text(str(i))
+        paths.append(str(path))
+    index = SignatureIndex("test_signature_concurrent")
+
+    def put_many(path):
+        for _ in range(10):
+            index.put(path, {"name": path})
+
+    threads = [threading.Thread(target=put_many, args=(path,)) for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reloaded = SignatureIndex("test_signature_concurrent")
+    assert all(reloaded.get(path) == {"name": path} for path in paths)
+    assert not [name for name in os.listdir(os.path.dirname(index.path)) if name.endswith(".tmp")]
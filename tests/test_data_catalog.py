@@ -0,0 +1,94 @@
+import pandas as pd
+import pytest
+import partition_store
+from data_catalog import STORE_PREFIX, DataCatalog, frame_nbytes
+from partition_store import PartitionStore
+
+
+def _sales(counts):
+    return pd.DataFrame({"車名": [f"車款{i}" for i in range(len(counts))], "台數": counts})
+
+
+# ==================================== 1. 來源檔案變動 ====================================
+def test_catalog_reloads_sheet_and_drops_derived_after_overwrite(tmp_path, write_workbook):
+    path = write_workbook(tmp_path / "actual.xlsx", {"工作表1": _sales([1, 2])})
+    catalog = DataCatalog()
+    invalidated = []
+    catalog.listeners.append(invalidated.extend)
+
+    key = catalog.register_workbook(path)[0]
+    assert catalog[key]["台數"].tolist() == [1, 2]
+    derived_key = f"{key}_vs_目標"
+    catalog[derived_key] = pd.DataFrame({"達標": [True]})
+
+    write_workbook(path, {"工作表1": _sales([7, 8, 9])})
+    assert catalog[key]["台數"].tolist() == [7, 8, 9]
+    assert derived_key not in catalog
+    assert key in invalidated and derived_key in invalidated
+
+
+def test_catalog_keeps_data_when_file_unchanged(tmp_path, write_workbook):
+    path = write_workbook(tmp_path / "actual.xlsx", {"工作表1": _sales([1, 2])})
+    catalog = DataCatalog()
+    invalidated = []
+    catalog.listeners.append(invalidated.extend)
+
+    key = catalog.register_workbook(path)[0]
+    frame = catalog[key]
+    catalog[f"{key}_vs_目標"] = pd.DataFrame({"達標": [True]})
+
+    catalog.register_workbook(path)
+    assert catalog[key] is frame
+    assert f"{key}_vs_目標" in catalog
+    assert invalidated == []
+
+
+def test_invalidate_file_matches_whole_filename(tmp_path, monkeypatch, write_workbook):
+    monkeypatch.chdir(tmp_path)
+    write_workbook("a.xlsx", {"工作表1": _sales([1])})
+    write_workbook("ba.xlsx", {"工作表1": _sales([2])})
+    write_workbook("target.xlsx", {"工作表1": _sales([3])})
+    catalog = DataCatalog()
+    for name in ("a.xlsx", "ba.xlsx", "target.xlsx"):
+        catalog.register_workbook(name)
+    from_a = "target.xlsx::工作表1_vs_a.xlsx::工作表1[販賣]"
+    from_ba = "target.xlsx::工作表1_vs_ba.xlsx::工作表1[販賣]"
+    a_as_target = "a.xlsx::工作表1_vs_ba.xlsx::工作表1[受訂]"
+    for key in (from_a, from_ba, a_as_target):
+        catalog[key] = pd.DataFrame({"達標": [True]})
+
+    affected = catalog.invalidate_file("a.xlsx")
+    assert sorted(affected) == sorted(["a.xlsx::工作表1", from_a, a_as_target])
+    assert from_ba in catalog
+    assert catalog["ba.xlsx::工作表1"]["台數"].tolist() == [2]
+
+
+# ==================================== 2. 記憶體預算 ====================================
+@pytest.fixture
+def store_key(tmp_path, monkeypatch):
+    store = PartitionStore("budget_test", root=str(tmp_path / "partitions"))
+    store.append(pd.DataFrame({"日期": pd.date_range("2025-01-01", periods=500), "台數": 1}), source="seed")
+    monkeypatch.setitem(partition_store._stores, "budget_test", store)
+    return f"{STORE_PREFIX}budget_test"
+
+
+def test_store_frame_counts_against_budget(store_key):
+    catalog = DataCatalog()
+    store_bytes = frame_nbytes(catalog[store_key])
+    catalog.derived_budget_bytes = store_bytes + 100
+    assert catalog.budget_usage() == store_bytes
+
+    # 衍生資料加上分區資料集超過預算：較久未使用的分區資料集只丟棄資料，登記保留
+    catalog["合併結果"] = pd.DataFrame({"台數": range(50)})
+    assert [item["key"] for item in catalog.resident()] == ["合併結果"]
+    assert store_key in catalog
+    assert len(catalog[store_key]) == 500
+    # 重新讀入後換成衍生資料被淘汰
+    assert "合併結果" not in catalog
+
+
+def test_store_read_evicts_older_derived_data(store_key):
+    catalog = DataCatalog(derived_budget_bytes=1)
+    catalog["合併結果"] = pd.DataFrame({"台數": range(50)})
+    assert len(catalog[store_key]) == 500
+    assert [item["key"] for item in catalog.resident()] == [store_key]
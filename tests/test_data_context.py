@@ -0,0 +1,51 @@
+import pandas as pd
+from data_context import DataContext, get_data_context, shared_frames, use_data_context
+
+
+def _sales(counts):
+    return pd.DataFrame({"車名": [f"車款{i}" for i in range(len(counts))], "台數": counts})
+
+
+# ==================================== 1. 跨 session 共用的解析結果 ====================================
+def test_shared_frames_follow_file_content(tmp_path, write_workbook):
+    path = write_workbook(tmp_path / "actual.xlsx", {"工作表1": _sales([1])})
+    assert len(shared_frames.sheet(path)) == 1
+
+    write_workbook(path, {"工作表1": _sales([1, 2, 3])})
+    assert len(shared_frames.sheet(path)) == 3
+
+
+def test_column_assignment_does_not_leak_between_sessions(tmp_path, write_workbook):
+    path = write_workbook(tmp_path / "actual.xlsx", {"工作表1": _sales([1, 2])})
+    mine = shared_frames.sheet(path)
+    mine["台數"] = mine["台數"] * 10
+    assert shared_frames.sheet(path)["台數"].tolist() == [1, 2]
+
+
+# ==================================== 2. Session 資料上下文 ====================================
+def test_contexts_keep_separate_current_data(tmp_path, write_workbook):
+    path = write_workbook(tmp_path / "actual.xlsx", {"工作表1": _sales([1, 2])})
+    first, second = DataContext("a"), DataContext("b")
+    key = first.frames.register_workbook(path)[0]
+    first.set_current(key)
+
+    with use_data_context(second):
+        assert get_data_context() is second
+        assert get_data_context().current_df is None
+    assert get_data_context() is not second
+    assert first.current_df["台數"].tolist() == [1, 2]
+
+
+def test_overwrite_bumps_current_version_and_drops_cubes(tmp_path, write_workbook):
+    path = write_workbook(tmp_path / "actual.xlsx", {"工作表1": _sales([1, 2])})
+    context = DataContext()
+    key = context.frames.register_workbook(path)[0]
+    context.set_current(key)
+    assert context.current_df["台數"].tolist() == [1, 2]
+    context.cubes[key] = object()
+    version = context.current_version
+
+    write_workbook(path, {"工作表1": _sales([5])})
+    assert context.current_df["台數"].tolist() == [5]
+    assert context.current_version != version
+    assert key not in context.cubes
@@ -0,0 +1,75 @@
+import os
+import pandas as pd
+import pytest
+from conftest import ROOT
+from dealer_mapping import MAPPING_FILE, DealerMappingIndex
+
+
+def legacy_lookup(df: pd.DataFrame, query_code: str) -> str:
+    """改用記憶體索引前 get_dealer_mapping 的查詢邏輯（逐次篩選 DataFrame），作為比對基準"""
+    query_code = str(query_code).strip().upper()
+
+    if len(query_code) >= 2 and query_code[0].isalpha() and query_code[1:].isdigit():
+        dealer_code = query_code[0]
+        site_code = query_code[1:].zfill(2)
+        exact_match = df[(df['經銷商代碼'].str.strip() == dealer_code) & (df['營業所代碼'].str.strip() == site_code)]
+        if len(exact_match) > 0:
+            row = exact_match.iloc[0]
+            return f"找到匹配 '{query_code}':\n經銷商 {dealer_code} ({row['經銷商名稱'].strip()}) - 營業所 {site_code} ({row['營業所名稱'].strip()})"
+        dealer_exists = df[df['經銷商代碼'].str.strip() == dealer_code]
+        if len(dealer_exists) > 0:
+            return f"組合代碼 '{query_code}' 不存在。\n經銷商 {dealer_code} ({dealer_exists.iloc[0]['經銷商名稱'].strip()}) 沒有營業所 {site_code}。"
+        return f"組合代碼 '{query_code}' 不存在。\n經銷商代碼 {dealer_code} 不存在。"
+
+    results = []
+    for _, row in df[df['經銷商代碼'].str.strip() == query_code].iterrows():
+        results.append(f"經銷商 {query_code} ({row['經銷商名稱'].strip()}) - 營業所 {row['營業所代碼'].strip()} ({row['營業所名稱'].strip()})")
+    for _, row in df[df['營業所代碼'].str.strip() == query_code].iterrows():
+        results.append(f"營業所 {query_code} ({row['營業所名稱'].strip()}) - 屬於經銷商 {row['經銷商代碼'].strip()} ({row['經銷商名稱'].strip()})")
+    if results:
+        return "找到以下映射資訊:\n" + "\n".join(results)
+    return f"找不到代碼 '{query_code}' 的對應資訊。請確認代碼是否正確。"
+
+
+def _queries(df: pd.DataFrame):
+    """映射表中所有經銷商、營業所與組合代碼（含未補零、小寫、前後空白），以及不存在的代碼"""
+    dealers = sorted(df["經銷商代碼"].str.strip().unique())
+    sites = sorted(df["營業所代碼"].str.strip().unique())
+    pairs = [f"{d}{s}" for d, s in zip(df["經銷商代碼"].str.strip(), df["營業所代碼"].str.strip())]
+    variants = [f"{d}{int(s)}" for d, s in zip(df["經銷商代碼"].str.strip(), df["營業所代碼"].str.strip()) if s.isdigit()]
+    variants += [f" {d.lower()} " for d in dealers]
+    missing = ["Z01", f"{dealers[0]}99", "ZZ", "999", "9", ""]
+    return dealers + sites + pairs + variants + missing
+
+
+def _assert_same_as_legacy(path: str) -> None:
+    df = pd.read_excel(path, dtype=str)
+    index = DealerMappingIndex(path)
+    for query in _queries(df):
+        assert index.lookup(query) == legacy_lookup(df, query), query
+
+
+@pytest.mark.skipif(not os.path.exists(os.path.join(ROOT, MAPPING_FILE)), reason="缺少映射表檔案")
+def test_lookup_matches_legacy_on_mapping_file():
+    _assert_same_as_legacy(os.path.join(ROOT, MAPPING_FILE))
+
+
+def test_lookup_matches_legacy_on_shared_codes(tmp_path, write_workbook):
+    # 同一營業所代碼屬於多個經銷商、同一組合代碼重複出現、名稱前後有空白
+    df = pd.DataFrame({
+        "經銷商代碼": ["A", "A", "B", "B", "C"],
+        "經銷商名稱": ["國都", "國都", " 北都 ", "北都", "中部"],
+        "營業所代碼": ["01", "02", "01", "01", "10"],
+        "營業所名稱": ["新莊", "三重", "南港", "南港二", " 南臺中 "],
+    })
+    _assert_same_as_legacy(write_workbook(tmp_path / "mapping.xlsx", {"工作表1": df}))
+
+
+def test_lookup_reloads_after_mapping_file_changes(tmp_path, write_workbook):
+    df = pd.DataFrame({"經銷商代碼": ["A"], "經銷商名稱": ["國都"], "營業所代碼": ["01"], "營業所名稱": ["新莊"]})
+    path = write_workbook(tmp_path / "mapping.xlsx", {"工作表1": df})
+    index = DealerMappingIndex(path)
+    assert "新莊" in index.lookup("A01")
+
+    write_workbook(path, {"工作表1": df.assign(營業所名稱=["板橋"])})
+    assert "板橋" in index.lookup("A01")
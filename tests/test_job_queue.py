@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+import pytest
+from data_context import DataContext, get_data_context
+from job_queue import CANCELLED, DONE, ERROR, JobLimitError, JobQueue
+
+
+class Runner:
+    """可控制的假 Agent：每個問題在 release 之前停在 await 點，並記錄執行時的資料上下文"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.contexts = {}
+
+    async def __call__(self, question):
+        self.contexts[question] = get_data_context().name
+        yield {"type": "tool_start", "tool": "list_files"}
+        while not self.release.is_set():
+            await asyncio.sleep(0.01)
+        if question == "失敗":
+            raise ValueError("工具錯誤")
+        yield {"type": "final", "response": {"output": f"答：{question}"}}
+
+
+def _wait(queue, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status["finished"] is not None:
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+@pytest.fixture
+def runner():
+    runner = Runner()
+    yield runner
+    runner.release.set()
+
+
+# ==================================== 1. 執行結果 ====================================
+def test_job_runs_in_submitted_context(runner):
+    queue = JobQueue(runner, max_workers=2)
+    job_id = queue.submit("u1", "問題", DataContext("session-1"))
+    runner.release.set()
+    status = _wait(queue, job_id)
+    assert status["status"] == DONE
+    assert status["response"] == {"output": "答：問題"}
+    assert queue.events(job_id) == [{"type": "tool_start", "tool": "list_files"}]
+    assert runner.contexts["問題"] == "session-1"
+
+
+def test_runner_exception_becomes_error(runner):
+    queue = JobQueue(runner)
+    job_id = queue.submit("u1", "失敗")
+    runner.release.set()
+    status = _wait(queue, job_id)
+    assert (status["status"], status["error"]) == (ERROR, "工具錯誤")
+
+
+# ==================================== 2. 同時查詢上限 ====================================
+def test_per_user_and_global_limits(runner):
+    queue = JobQueue(runner, max_workers=4, max_per_user=2, max_pending=3)
+    first = queue.submit("u1", "一")
+    queue.submit("u1", "二")
+    with pytest.raises(JobLimitError):
+        queue.submit("u1", "三")
+    queue.submit("u2", "四")
+    with pytest.raises(JobLimitError):
+        queue.submit("u3", "五")
+    assert len(queue.active_jobs("u1")) == 2
+
+    runner.release.set()
+    _wait(queue, first)
+    # 完成的工作不再佔用名額
+    queue.submit("u1", "六")
+
+
+# ==================================== 3. 取消 ====================================
+def test_cancel_running_and_queued_jobs(runner):
+    queue = JobQueue(runner, max_workers=1)
+    running = queue.submit("u1", "執行中")
+    queued = queue.submit("u2", "排隊中")
+    deadline = time.time() + 5
+    while queue.status(running)["status"] != "running" and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert queue.cancel(queued)
+    assert queue.status(queued)["status"] == CANCELLED
+    assert queue.cancel(running)
+    assert _wait(queue, running)["status"] == CANCELLED
+    # 已結束的工作不能再取消
+    assert not queue.cancel(running)
+    assert "排隊中" not in runner.contexts
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+import partition_store
+from data_catalog import STORE_PREFIX
+from data_context import DataContext, use_data_context
+from kpi_engine import compute_monthly_kpis, kpi_monthly, kpi_snapshot
+from partition_store import PartitionStore
+
+AS_OF = "2025-03-15"
+
+
+@pytest.fixture
+def actuals():
+    rows = [
+        # (日期, 經銷商代碼, 實績種類, 台數)
+        ("2024-03-10", "A", "3D", 5),    # 去年同月、去年同期
+        ("2024-03-20", "A", "3D", 7),    # 去年同月、晚於去年同日
+        ("2025-01-05", "A", "3D", 2),
+        ("2025-02-10", "A", "3D", 4),    # 上月、上月同期
+        ("2025-02-20", "A", "3D", 6),    # 上月、晚於上月同日
+        ("2025-03-01", "A", "3D", 3),
+        ("2025-03-15", "A", "3D", 1),    # as_of 當天計入
+        ("2025-03-20", "A", "3D", 100),  # 晚於 as_of，不計入本月
+        ("2025-03-10", "A", "27", 50),   # 受訂，不計入販賣
+        ("2025-03-05", "B", "3D", 10),
+    ]
+    df = pd.DataFrame(rows, columns=["日期", "經銷商代碼", "實績種類", "台數"])
+    df["日期"] = pd.to_datetime(df["日期"])
+    return df
+
+
+# ==================================== 1. 截至某日的時間窗口 ====================================
+def test_snapshot_windows(actuals):
+    result = kpi_snapshot(actuals, AS_OF, group_by=["經銷商"]).set_index("經銷商代碼")
+    a = result.loc["A"]
+    assert (a["本月台數"], a["上月台數"], a["上月同期台數"]) == (4, 10, 4)
+    assert (a["去年同月台數"], a["去年同期台數"], a["累計台數"]) == (12, 5, 16)
+    assert a["前月比(%)"] == 40.0
+    assert a["前月同期比(%)"] == 100.0
+    assert a["去年比(%)"] == 33.3
+    assert a["去年同期比(%)"] == 80.0
+
+    b = result.loc["B"]
+    assert b["本月台數"] == 10 and b["上月台數"] == 0
+    # 分母為 0 時不可比較
+    assert np.isnan(b["前月比(%)"])
+
+
+def test_snapshot_total_and_kind(actuals):
+    total = kpi_snapshot(actuals, AS_OF).iloc[0]
+    assert total["本月台數"] == 14
+    assert kpi_snapshot(actuals, AS_OF, kind="受訂").iloc[0]["本月台數"] == 50
+    assert kpi_snapshot(actuals, AS_OF, filters={"經銷商": ["B"]}).iloc[0]["本月台數"] == 10
+
+
+# ==================================== 2. 按月彙總與 shift ====================================
+def test_monthly_fills_missing_months_before_shift(actuals):
+    result = kpi_monthly(actuals, group_by=["經銷商"])
+    a = result[result["經銷商代碼"] == "A"].set_index("年月")
+    # 2024-03～2025-03 共 13 個月，中間沒有實績的月份補 0
+    assert len(a) == 13
+    assert a.loc["2024-04", "台數"] == 0
+    march = a.loc["2025-03"]
+    assert (march["台數"], march["上月台數"], march["去年同月台數"]) == (104, 10, 12)
+    assert march["前月比(%)"] == 1040.0
+    assert march["去年比(%)"] == 866.7
+
+
+def test_monthly_cumulative_resets_each_year(actuals):
+    a = kpi_monthly(actuals, group_by=["經銷商"]).query("經銷商代碼 == 'A'").set_index("年月")
+    assert a.loc["2024-12", "累計台數"] == 12
+    assert a.loc["2025-01", "累計台數"] == 2
+    assert a.loc["2025-03", "累計台數"] == 116
+
+
+def test_monthly_shift_stays_within_group(actuals):
+    b = kpi_monthly(actuals, group_by=["經銷商"]).query("經銷商代碼 == 'B'").set_index("年月")
+    assert b.loc["2025-03", "台數"] == 10
+    # 上月與去年同月取自 B 自己補 0 的月份，不會取到 A 的值
+    assert b.loc["2025-03", "上月台數"] == 0
+    assert b.loc["2025-03", "去年同月台數"] == 0
+
+
+# ==================================== 3. 工具的月份區間 ====================================
+@pytest.fixture
+def store_key(tmp_path, monkeypatch, actuals):
+    store = PartitionStore("kpi_test", root=str(tmp_path / "partitions"))
+    store.append(actuals, source="seed")
+    monkeypatch.setitem(partition_store._stores, "kpi_test", store)
+    return f"{STORE_PREFIX}kpi_test"
+
+
+@pytest.fixture
+def sheet_key(tmp_path, write_workbook, actuals):
+    return f"{write_workbook(tmp_path / '實績.xlsx', {'工作表1': actuals})}::工作表1"
+
+
+@pytest.mark.parametrize("source", ["sheet_key", "store_key"])
+def test_monthly_tool_limits_both_ends(request, source):
+    key = request.getfixturevalue(source)
+    with use_data_context(DataContext()):
+        result = compute_monthly_kpis.invoke({"actual_key": key, "date_from": "2025-02", "date_to": "2025-02"})
+        assert [row["年月"] for row in result["rows"]] == ["2025-02"]
+        # 輸出區間之前的月份仍用於計算上月與累計
+        assert (result["rows"][0]["上月台數"], result["rows"][0]["累計台數"]) == (2, 12)
+
+        result = compute_monthly_kpis.invoke({"actual_key": key, "date_to": "2024-12"})
+        months = [row["年月"] for row in result["rows"]]
+        assert months[0] == "2024-03" and max(months) <= "2024-12"
@@ -0,0 +1,48 @@
+import json
+import pytest
+from langchain_core.outputs import Generation
+from llm_cache import LLMCacheMiss, LLMCallCache, normalize_prompt
+
+
+def _prompt(message_id: str, tokens: int, text: str = "請列出販賣台數前五名的車名") -> str:
+    """與 LangChain 序列化後的訊息列表同樣形式的 prompt 字串"""
+    return json.dumps([{
+        "lc": 1, "type": "constructor", "id": ["langchain", "schema", "messages", "HumanMessage"],
+        "kwargs": {"content": text, "id": message_id, "usage_metadata": {"total_tokens": tokens}},
+    }], ensure_ascii=False)
+
+
+LLM_STRING = "gpt-4.1---functions=[list_files]"
+
+
+# ==================================== 1. key 的正規化 ====================================
+def test_volatile_fields_do_not_change_the_key():
+    assert normalize_prompt(_prompt("run-1", 10)) == normalize_prompt(_prompt("run-2", 99))
+    assert normalize_prompt(_prompt("run-1", 10)) != normalize_prompt(_prompt("run-1", 10, text="其他問題"))
+
+
+def test_plain_text_prompt_is_kept():
+    assert normalize_prompt("not json") == "not json"
+
+
+# ==================================== 2. 讀寫與離線重播 ====================================
+def test_hit_after_update(tmp_path):
+    cache = LLMCallCache(str(tmp_path / "calls.sqlite"))
+    assert cache.lookup(_prompt("run-1", 10), LLM_STRING) is None
+    cache.update(_prompt("run-1", 10), LLM_STRING, [Generation(text="A")])
+
+    assert [g.text for g in cache.lookup(_prompt("run-2", 20), LLM_STRING)] == ["A"]
+    # 模型或綁定的工具不同時不命中
+    assert cache.lookup(_prompt("run-1", 10), LLM_STRING + ",get_dealer_mapping") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_replay_reads_recorded_calls_and_never_writes(tmp_path):
+    path = str(tmp_path / "calls.sqlite")
+    LLMCallCache(path).update(_prompt("run-1", 10), LLM_STRING, [Generation(text="A")])
+
+    replay = LLMCallCache(path, replay=True)
+    assert [g.text for g in replay.lookup(_prompt("run-3", 5), LLM_STRING)] == ["A"]
+    replay.update(_prompt("run-1", 10, text="新問題"), LLM_STRING, [Generation(text="B")])
+    with pytest.raises(LLMCacheMiss):
+        replay.lookup(_prompt("run-1", 10, text="新問題"), LLM_STRING)
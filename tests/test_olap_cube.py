@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+from olap_cube import SalesCube
+
+
+def _actuals(seed: int, days: pd.DatetimeIndex, rows: int = 2000) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "日期": rng.choice(days, rows),
+        "廠牌": rng.choice(["TOYOTA", "LEXUS"], rows),
+        "經銷商代碼": rng.choice(list("ABCD"), rows),
+        "營業所代碼": rng.integers(1, 12, rows),
+        "車名": rng.choice(["RAV4", "ALTIS", "ES300h", "YARIS"], rows),
+        "實績種類": rng.choice(["3D", "27"], rows),
+        "台數": rng.integers(-1, 5, rows),
+    })
+
+
+@pytest.fixture
+def actuals():
+    return _actuals(0, pd.date_range("2025-01-01", "2025-06-30"))
+
+
+def _expected(df: pd.DataFrame, group_by, mask=None) -> pd.DataFrame:
+    df = df if mask is None else df[mask]
+    if "月份" in group_by:
+        df = df.assign(月份=df["日期"].dt.to_period("M").astype(str))
+    return df.groupby(group_by)["台數"].sum().reset_index()
+
+
+def _assert_same(result: pd.DataFrame, expected: pd.DataFrame, group_by) -> None:
+    result = result.drop(columns="排名").sort_values(group_by).reset_index(drop=True)
+    expected = expected.sort_values(group_by).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+# ==================================== 1. rollup 與 groupby 結果相同 ====================================
+@pytest.mark.parametrize("group_by", [
+    ["經銷商代碼"],
+    ["經銷商代碼", "營業所代碼"],
+    ["月份"],
+    ["月份", "實績種類"],
+    ["車名", "廠牌"],
+])
+def test_query_matches_groupby(actuals, group_by):
+    cube = SalesCube.from_frame(actuals)
+    _assert_same(cube.query(group_by), _expected(actuals, group_by), group_by)
+
+
+def test_query_with_filters_and_date_range(actuals):
+    cube = SalesCube.from_frame(actuals)
+    result = cube.query(["經銷商代碼"], filters={"實績種類": ["販賣"], "營業所代碼": ["01", "3"]},
+                        date_from="2025-02-10", date_to="2025-04-30")
+    mask = (
+        (actuals["實績種類"] == "3D") & actuals["營業所代碼"].isin([1, 3])
+        & (actuals["日期"] >= "2025-02-10") & (actuals["日期"] <= "2025-04-30")
+    )
+    _assert_same(result, _expected(actuals, ["經銷商代碼"], mask), ["經銷商代碼"])
+
+
+def test_total_and_top_n(actuals):
+    cube = SalesCube.from_frame(actuals)
+    assert cube.query()["台數"].iloc[0] == actuals["台數"].sum()
+    top = cube.query(["車名"], top_n=2)
+    expected = actuals.groupby("車名")["台數"].sum().sort_values(ascending=False)
+    assert top["車名"].tolist() == expected.index[:2].tolist()
+    assert top["排名"].tolist() == [1, 2]
+
+
+def test_rollups_use_smaller_cuboids(actuals):
+    sizes = SalesCube.from_frame(actuals).describe()
+    assert sizes["大盤"] <= sizes["經銷商"] <= sizes["據點"] <= sizes["base"]
+
+
+# ==================================== 2. 增量加入 ====================================
+def test_append_matches_rebuild(actuals):
+    # 新增資料含既有範圍之後與之前的日期、新的車名
+    delta = pd.concat([
+        _actuals(1, pd.date_range("2025-07-01", "2025-07-10"), rows=200),
+        _actuals(2, pd.date_range("2024-12-01", "2024-12-31"), rows=200).assign(車名="bZ4X"),
+    ], ignore_index=True)
+    cube = SalesCube.from_frame(actuals)
+    cube.append(delta)
+    combined = pd.concat([actuals, delta], ignore_index=True)
+    for group_by in (["月份", "經銷商代碼"], ["車名"], ["經銷商代碼", "營業所代碼"]):
+        _assert_same(cube.query(group_by), _expected(combined, group_by), group_by)
+    result = cube.query(["車名"], date_from="2024-12-01", date_to="2024-12-31")
+    assert result.set_index("車名")["台數"].to_dict() == {"bZ4X": int(delta["台數"].iloc[200:].sum())}
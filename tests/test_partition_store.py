@@ -0,0 +1,107 @@
+import pandas as pd
+import pytest
+from partition_store import PartitionStore, SchemaMismatchError
+
+
+def _actuals(dates, counts=None, **extra):
+    counts = counts if counts is not None else [1] * len(dates)
+    return pd.DataFrame({"日期": pd.to_datetime(dates), "經銷商代碼": ["A"] * len(dates), "台數": counts, **extra})
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PartitionStore("actuals", root=str(tmp_path), period_column="日期")
+    store.append(_actuals(["2025-01-01", "2025-01-15"]), source="seed")
+    return store
+
+
+# ==================================== 1. 欄位與型態檢查（_conform） ====================================
+def test_missing_period_column(store):
+    with pytest.raises(SchemaMismatchError, match="缺少分區欄位"):
+        store.append(_actuals(["2025-02-01"]).drop(columns="日期"))
+
+
+@pytest.mark.parametrize("change, message", [
+    (lambda df: df.drop(columns="經銷商代碼"), "缺少 \\['經銷商代碼'\\]"),
+    (lambda df: df.assign(車名="RAV4"), "多出 \\['車名'\\]"),
+])
+def test_column_mismatch(store, change, message):
+    with pytest.raises(SchemaMismatchError, match=message):
+        store.append(change(_actuals(["2025-02-01"])))
+
+
+def test_unconvertible_values(store):
+    with pytest.raises(SchemaMismatchError, match="台數 有 1 筆無法轉換為 integer"):
+        store.append(_actuals(["2025-02-01", "2025-02-02"], counts=["3", "abc"]))
+
+
+def test_null_in_integer_column(store):
+    with pytest.raises(SchemaMismatchError, match="台數 有空值"):
+        store.append(_actuals(["2025-02-01"], counts=[None]))
+
+
+def test_values_are_converted_to_existing_types(store):
+    store.append(_actuals(["2025-02-01"], counts=["5"]))
+    df = store.read(202502, 202502)
+    assert df["台數"].dtype == "int64"
+    assert df["台數"].tolist() == [5]
+
+
+def test_failed_append_leaves_store_unchanged(store):
+    version = store.version
+    with pytest.raises(SchemaMismatchError):
+        store.append(_actuals(["2025-02-01"], counts=["abc"]))
+    assert store.version == version
+    assert store.partitions() == [202501]
+
+
+# ==================================== 2. 重複匯入檢查 ====================================
+def test_overlapping_dates_are_rejected(store):
+    with pytest.raises(SchemaMismatchError, match="重疊"):
+        store.append(_actuals(["2025-01-10"]))
+
+
+def test_overlap_allowed_when_requested(store):
+    result = store.append(_actuals(["2025-01-10"]), allow_overlap=True)
+    assert result["appended_rows"] == 1
+    assert len(store.read(202501, 202501)) == 3
+
+
+def test_same_source_is_skipped(store):
+    result = store.append(_actuals(["2025-03-01"]), source="seed")
+    assert result["skipped"]
+    assert store.partitions() == [202501]
+
+
+# ==================================== 3. 依月份分區 ====================================
+def test_later_days_and_earlier_years_are_not_overlap(store):
+    store.append(_actuals(["2025-01-20"]))
+    store.append(_actuals(["2024-01-10"]))
+    assert store.partitions() == [202401, 202501]
+
+
+def test_overlap_is_checked_per_month(store):
+    store.append(_actuals(["2025-02-05"]))
+    # 1 月已匯入的資料只到 15 日：即使已有 2 月資料，1 月 25 日仍可匯入
+    store.append(_actuals(["2025-01-25"]))
+    with pytest.raises(SchemaMismatchError, match="重疊"):
+        store.append(_actuals(["2025-02-05", "2025-03-01"]))
+    assert store.partitions() == [202501, 202502]
+
+
+def test_replace_rewrites_only_covered_months(store):
+    store.append(_actuals(["2025-02-01"], counts=[4]))
+    store.append(_actuals(["2025-01-03"], counts=[9]), replace=True)
+    assert store.read(202501, 202501)["台數"].tolist() == [9]
+    assert store.read(202502, 202502)["台數"].tolist() == [4]
+
+
+def test_read_loads_only_requested_partitions(tmp_path):
+    store = PartitionStore("actuals", root=str(tmp_path), period_column="日期")
+    store.append(_actuals(["2024-12-31", "2025-01-01", "2025-02-01", "2025-03-01"]))
+    reopened = PartitionStore("actuals", root=str(tmp_path), period_column="日期")
+    assert reopened.read(202501, 202502)["日期"].dt.month.tolist() == [1, 2]
+    assert sorted(reopened._parts) == [202501, 202502]
+    # 區間內沒有分區時回傳欄位相同的空表
+    empty = reopened.read(202506, 202512)
+    assert empty.empty and list(empty.columns) == list(reopened.read().columns)
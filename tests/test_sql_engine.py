@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+
+from sql_engine import _check_query, _connect  # noqa: E402
+
+TABLES = ["actuals", "targets"]
+
+
+@pytest.fixture
+def connection():
+    connection = duckdb.connect()
+    actuals = pd.DataFrame({"經銷商代碼": ["A", "B"], "台數": [1, 2]})
+    targets = pd.DataFrame({"經銷商代碼": ["A", "B"], "目標": [3, 4]})
+    connection.register("actuals", actuals)
+    connection.register("targets", targets)
+    yield connection
+    connection.close()
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM actuals",
+    "SELECT 經銷商代碼, SUM(台數) AS 台數 FROM actuals GROUP BY 1 ORDER BY 2 DESC",
+    "SELECT a.經銷商代碼, a.台數, t.目標 FROM actuals a JOIN targets t USING (經銷商代碼)",
+    "WITH totals AS (SELECT 經銷商代碼, SUM(台數) AS n FROM actuals GROUP BY 1) SELECT * FROM totals",
+    "SELECT * FROM actuals WHERE 經銷商代碼 IN (SELECT 經銷商代碼 FROM targets)",
+])
+def test_allowed_queries(connection, query):
+    _check_query(connection, query, TABLES)
+
+
+@pytest.mark.parametrize("query", [
+    # 以字串或引號識別字指定檔案路徑
+    "SELECT * FROM '/etc/passwd'",
+    "SELECT * FROM \"/tmp/x.csv\"",
+    "SELECT * FROM actuals WHERE 台數 > (SELECT COUNT(*) FROM '/tmp/x.csv')",
+    # 表函數
+    "SELECT * FROM read_csv('/etc/passwd')",
+    "SELECT * FROM read_parquet('secret.parquet')",
+    "SELECT * FROM glob('*')",
+    "WITH x AS (SELECT * FROM read_text('/etc/hosts')) SELECT * FROM x",
+    # 未登記的資料表與指定 schema / catalog
+    "SELECT * FROM duckdb_settings",
+    "SELECT * FROM main.actuals",
+    "SELECT * FROM memory.main.actuals",
+])
+def test_rejected_sources(connection, query):
+    with pytest.raises(ValueError, match="只能查詢已登記的資料表"):
+        _check_query(connection, query, TABLES)
+
+
+@pytest.mark.parametrize("query", [
+    "DROP TABLE actuals",
+    "COPY actuals TO '/tmp/out.csv'",
+    "INSTALL httpfs",
+    "SELECT 1; SELECT * FROM '/etc/passwd'",
+])
+def test_rejected_statements(connection, query):
+    with pytest.raises(ValueError, match="只允許單一 SELECT 查詢"):
+        _check_query(connection, query, TABLES)
+
+
+def test_database_blocks_file_access_outside_cache():
+    connection = _connect()
+    try:
+        with pytest.raises(duckdb.Error):
+            connection.execute("SELECT * FROM read_csv('/etc/passwd')").fetchall()
+    finally:
+        connection.close()
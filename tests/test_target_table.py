@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+from data_context import DataContext, use_data_context
+from target_table import TargetTable, get_target_table, infer_year, is_target_frame
+
+
+@pytest.fixture
+def wide():
+    """寬表格式：每個據點一列，1～3 月目標各一欄，目標種類 1＝受訂、2＝販賣"""
+    return pd.DataFrame({
+        "經銷商代碼": ["A", "A", "B"],
+        "據點代碼": [1, 1, 2],
+        "目標種類": [1, 2, 2],
+        "1月目標": [5, 10, 20],
+        "2月目標": [6, 11, 21],
+        "3月目標": [7, 12, 22],
+    })
+
+
+# ==================================== 1. 轉為長格式 ====================================
+def test_wide_melts_to_long(wide):
+    table = TargetTable.from_frame(wide, year=2025)
+    assert table.year_months == [202501, 202502, 202503]
+    assert len(table.frame) == 9
+    assert "營業所代碼" in table.frame.columns
+    assert table.frame["目標"].sum() == wide[["1月目標", "2月目標", "3月目標"]].to_numpy().sum()
+
+
+def test_year_column_wins_over_file_year(wide):
+    table = TargetTable.from_frame(wide.assign(年度=2024), year=2025)
+    assert table.year_months == [202401, 202402, 202403]
+
+
+def test_wide_without_year_is_rejected(wide):
+    with pytest.raises(ValueError, match="年度"):
+        TargetTable.from_frame(wide)
+
+
+def test_long_format_year_month_spellings():
+    long = pd.DataFrame({
+        "經銷商代碼": ["A", "A", "A"], "營業所代碼": [1, 1, 1],
+        "年月": ["2025-02", "2025/01", 202503], "目標台數": [2, 1, 3],
+    })
+    table = TargetTable.from_frame(long)
+    assert table.between()["目標"].tolist() == [1, 2, 3]
+
+
+def test_infer_year_and_detection(wide):
+    assert infer_year("uploads/經銷商目標_2025上半年.xlsx") == 2025
+    assert infer_year("目標.xlsx") is None
+    assert is_target_frame(wide)
+    assert not is_target_frame(wide.drop(columns="據點代碼"))
+
+
+# ==================================== 2. 區間切片 ====================================
+def test_month_and_year_to_date(wide):
+    table = TargetTable.from_frame(wide, year=2025)
+    assert table.month(202502)["目標"].sum() == 6 + 11 + 21
+    assert table.month(202502, kind=2)["目標"].sum() == 11 + 21
+    assert table.year_to_date(202502, kind=2)["目標"].sum() == 10 + 20 + 11 + 21
+    assert table.between(202502, 202503, kind=1)["目標"].tolist() == [6, 7]
+
+
+def test_select_months_and_year_months(wide):
+    table = TargetTable(pd.concat([
+        TargetTable.from_frame(wide, year=2024).frame, TargetTable.from_frame(wide, year=2025).frame,
+    ]).sort_index(kind="stable"))
+    # 月份（1–12）取每個年度的該月，年月（YYYYMM）只取該月，不存在的年月略過
+    assert sorted(table.select([3]).index.unique()) == [202403, 202503]
+    assert sorted(table.select([202501, 202612]).index.unique()) == [202501]
+    assert len(table.select()) == len(table.frame)
+
+
+def test_session_table_rebuilt_after_overwrite(tmp_path, write_workbook, wide):
+    path = write_workbook(tmp_path / "目標_2025.xlsx", {"工作表1": wide})
+    key = f"{path}::工作表1"
+    with use_data_context(DataContext()):
+        assert get_target_table(key).month(202501)["目標"].sum() == 35
+        write_workbook(path, {"工作表1": wide.assign(**{"1月目標": 1})})
+        assert get_target_table(key).month(202501)["目標"].sum() == 3
@@ -0,0 +1,30 @@
+from tracing import AGENT, AGENT_STEP, LLM, QUERY, TOOL, QueryTracer
+
+
+def _span(span_id, parent_id, kind, start, duration_ms, **fields):
+    return {"span_id": span_id, "parent_id": parent_id, "kind": kind, "name": span_id,
+            "start": start, "duration_ms": duration_ms, **fields}
+
+
+def test_summary_does_not_double_count_nested_model_calls():
+    """analyze_dataframe 內的 Pandas Agent 呼叫模型：時間計入工具，不再計入模型"""
+    root = _span("query", None, QUERY, 0.0, 1000.0, memory_peak_delta_mb=0.0)
+    tracer = QueryTracer("問題", write=False)
+    tracer.spans = [
+        root,
+        _span("step-1", "query", AGENT_STEP, 0.0, 300.0),
+        _span("plan", "step-1", LLM, 0.0, 200.0, prompt_tokens=100, completion_tokens=10),
+        _span("analyze_dataframe", "step-1", TOOL, 0.2, 500.0),
+        _span("pandas_agent", "analyze_dataframe", AGENT, 0.2, 450.0),
+        _span("pandas_llm", "pandas_agent", LLM, 0.2, 300.0, prompt_tokens=50, completion_tokens=5),
+        _span("answer", "query", LLM, 0.7, 250.0, prompt_tokens=120, completion_tokens=30),
+    ]
+    tracer._finish(root)
+    summary = tracer.summary
+
+    assert (summary["llm_ms"], summary["llm_calls"]) == (450.0, 2)
+    assert (summary["tool_ms"], summary["tool_calls"]) == (500.0, 1)
+    assert (summary["nested_llm_ms"], summary["nested_llm_calls"]) == (300.0, 1)
+    assert summary["llm_ms"] + summary["tool_ms"] + summary["other_ms"] == summary["duration_ms"]
+    # tokens 與花費仍包含所有模型呼叫
+    assert summary["total_tokens"] == 315
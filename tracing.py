@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import uuid
+import threading
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import ChatGeneration, LLMResult
+from data_cache import CACHE_DIR
+
+# ==================================== 1. 設定 ====================================
+# 每次查詢的 span（查詢、Agent 步驟、模型呼叫、工具）寫入 JSON lines；TRACING=off 停用
+TRACING = os.environ.get("TRACING", "on").lower() != "off"
+TRACE_DIR = os.environ.get("TRACE_DIR", os.path.join(CACHE_DIR, "traces"))
+TRACE_FILE = os.path.join(TRACE_DIR, "spans.jsonl")
+# 每個問題一筆的成本記錄（時間、token、花費、各工具耗時）
+LEDGER_FILE = os.path.join(TRACE_DIR, "ledger.jsonl")
+# 檔案超過此大小（MB）時改名為 .1 後重新開始
+TRACE_MAX_MB = float(os.environ.get("TRACE_MAX_MB", "50"))
+# span 執行期間取樣程序 RSS 的間隔（秒），用來計算峰值記憶體增量
+TRACE_MEMORY_INTERVAL = 0.01
+# 工具輸入與輸出只記錄前幾個字元
+TRACE_TEXT_CHARS = 200
+
+QUERY, AGENT, AGENT_STEP, LLM, TOOL = "query", "agent", "agent_step", "llm", "tool"
+AGENT_EXECUTOR_NAME = "AgentExecutor"
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        # 非 Linux 平台不記錄記憶體
+        return None
+
+
+def _truncate(value: Any) -> str:
+    text = value if isinstance(value, str) else str(value)
+    return text if len(text) <= TRACE_TEXT_CHARS else text[:TRACE_TEXT_CHARS] + "…"
+
+
+def _run_name(serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any]) -> str:
+    # 部分 Runnable 的 serialized 為 None，名稱改由 kwargs["name"] 取得
+    if kwargs.get("name"):
+        return kwargs["name"]
+    serialized = serialized or {}
+    return serialized.get("name") or (serialized.get("id") or ["unknown"])[-1]
+
+
+# ==================================== 2. 峰值記憶體取樣 ====================================
+class MemorySampler:
+    """
+    有 span 執行中時，背景執行緒定期讀取程序 RSS，記錄每個 span 期間的最高值。
+    RSS 為整個程序的用量：同時執行的查詢會互相計入，數值用來找出明顯的記憶體尖峰。
+    """
+
+    def __init__(self, interval: float = TRACE_MEMORY_INTERVAL):
+        self.interval = interval
+        self._open: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait()
+            rss = _rss_bytes()
+            with self._lock:
+                for span in self._open.values():
+                    span[1] = max(span[1], rss)
+                if not self._open:
+                    self._wake.clear()
+            time.sleep(self.interval)
+
+    def start(self, span_id: str) -> None:
+        rss = _rss_bytes()
+        if rss is None:
+            return
+        with self._lock:
+            self._open[span_id] = [rss, rss]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="trace-memory", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self, span_id: str) -> Optional[float]:
+        """結束取樣，回傳 span 期間 RSS 峰值相對開始時的增量（MB）"""
+        with self._lock:
+            span = self._open.pop(span_id, None)
+        if span is None:
+            return None
+        peak = max(span[1], _rss_bytes() or 0)
+        return (peak - span[0]) / 1024 ** 2
+
+
+memory_sampler = MemorySampler()
+
+
+# ==================================== 3. JSON lines 輸出 ====================================
+_write_lock = threading.Lock()
+
+
+def _append_jsonl(path: str, records: List[Dict[str, Any]]) -> None:
+    """附加寫入；檔案超過 TRACE_MAX_MB 時先改名為 .1（只保留一份舊檔）"""
+    with _write_lock:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) > TRACE_MAX_MB * 1024 ** 2:
+                os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError:
+            # 追蹤記錄寫入失敗不影響查詢
+            pass
+
+
+# ==================================== 4. Callback handler ====================================
+def _token_usage(response: LLMResult) -> Dict[str, Any]:
+    """取出 token 用量與模型名稱：優先使用訊息的 usage_metadata，其次為 llm_output 的 token_usage"""
+    usage, model_name = {}, ""
+    generation = response.generations[0][0] if response.generations and response.generations[0] else None
+    if isinstance(generation, ChatGeneration):
+        message = generation.message
+        metadata = getattr(message, "usage_metadata", None)
+        if metadata:
+            usage = {"prompt_tokens": metadata["input_tokens"], "completion_tokens": metadata["output_tokens"]}
+        model_name = (getattr(message, "response_metadata", None) or {}).get("model_name", "")
+    if not usage and response.llm_output:
+        token_usage = response.llm_output.get("token_usage") or {}
+        usage = {key: token_usage.get(key, 0) for key in ("prompt_tokens", "completion_tokens")}
+    model_name = model_name or (response.llm_output or {}).get("model_name", "")
+    return {**usage, "model": model_name}
+
+
+def _cost(model_name: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """依 OpenAI 價目表估算花費（同 get_openai_callback）；不在價目表的模型為 0"""
+    from langchain_community.callbacks.openai_info import (
+        MODEL_COST_PER_1K_TOKENS,
+        get_openai_token_cost_for_model,
+        standardize_model_name,
+    )
+
+    model_name = standardize_model_name(model_name) if model_name else ""
+    if model_name not in MODEL_COST_PER_1K_TOKENS:
+        return 0.0
+    return (
+        get_openai_token_cost_for_model(model_name, prompt_tokens)
+        + get_openai_token_cost_for_model(model_name, completion_tokens, is_completion=True)
+    )
+
+
+class QueryTracer(BaseCallbackHandler):
+    """
+    一次查詢的追蹤：記錄查詢、Agent（含工具內的 Pandas Agent）、Agent 每一步、模型呼叫與工具的 span，
+    每個 span 有開始／結束時間、耗時、峰值記憶體增量；模型呼叫另有 token 用量與花費。
+    prompt 組裝、輸出解析等其他 Runnable 不產生 span，其時間包含在所屬的 Agent 步驟中。
+    查詢結束時 span 寫入 TRACE_FILE、成本摘要寫入 LEDGER_FILE。
+    """
+
+    # 在執行 Agent 的執行緒中直接呼叫，時間戳記不會因排入其他執行緒而延遲
+    run_inline = True
+
+    def __init__(self, question: str, write: bool = TRACING):
+        self.question = question
+        self.write = write
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.spans: List[Dict[str, Any]] = []
+        self._open: Dict[str, Dict[str, Any]] = {}
+        # 不產生 span 的 run 對應到最近一個有 span 的上層 run
+        self._owner: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self.summary: Optional[Dict[str, Any]] = None
+
+    # ---- span 管理 ----
+    def _owner_of(self, parent_run_id: Optional[UUID]) -> Optional[str]:
+        return self._owner.get(str(parent_run_id)) if parent_run_id else None
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], kind: str, name: str, **fields: Any) -> None:
+        span_id = str(run_id)
+        with self._lock:
+            self._owner[span_id] = span_id
+            self._open[span_id] = {
+                "trace_id": self.trace_id,
+                "span_id": span_id,
+                "parent_id": self._owner_of(parent_run_id),
+                "kind": kind,
+                "name": name,
+                "start": time.time(),
+                **fields,
+            }
+        memory_sampler.start(span_id)
+
+    def _skip(self, run_id: UUID, parent_run_id: Optional[UUID]) -> None:
+        with self._lock:
+            self._owner[str(run_id)] = self._owner_of(parent_run_id)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, **fields: Any) -> Optional[Dict[str, Any]]:
+        span_id = str(run_id)
+        memory = memory_sampler.stop(span_id)
+        with self._lock:
+            span = self._open.pop(span_id, None)
+            if span is None:
+                return None
+            span["end"] = time.time()
+            span["duration_ms"] = (span["end"] - span["start"]) * 1000
+            span["memory_peak_delta_mb"] = memory
+            if error is not None:
+                span["error"] = f"{type(error).__name__}: {error}"
+            span.update(fields)
+            self.spans.append(span)
+        if span["kind"] == QUERY:
+            self._finish(span)
+        return span
+
+    # ---- chain：查詢、Agent 與 Agent 步驟 ----
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs: Any) -> None:
+        name = _run_name(serialized, kwargs)
+        parent = self._owner_of(parent_run_id)
+        parent_kind = self._open.get(parent, {}).get("kind") if parent else None
+        if parent_run_id is None:
+            self._start(run_id, None, QUERY, name, question=self.question)
+        elif name == AGENT_EXECUTOR_NAME:
+            self._start(run_id, parent_run_id, AGENT, name)
+        elif parent_kind in (QUERY, AGENT) and str(parent_run_id) == parent:
+            # AgentExecutor 的直接子 chain：一次規劃（prompt 組裝、模型呼叫、輸出解析）
+            self._start(run_id, parent_run_id, AGENT_STEP, name)
+        else:
+            self._skip(run_id, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    # ---- 模型呼叫 ----
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, LLM, _run_name(serialized, kwargs))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, LLM, _run_name(serialized, kwargs))
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs: Any) -> None:
+        usage = _token_usage(response)
+        prompt_tokens = int(usage.get("prompt_tokens", 0))
+        completion_tokens = int(usage.get("completion_tokens", 0))
+        self._end(
+            run_id,
+            model=usage["model"],
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost_usd=_cost(usage["model"], prompt_tokens, completion_tokens),
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    # ---- 工具 ----
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, TOOL, _run_name(serialized, kwargs), input=_truncate(input_str))
+
+    def on_tool_end(self, output, *, run_id, **kwargs: Any) -> None:
+        text = output if isinstance(output, str) else str(output)
+        self._end(run_id, output=_truncate(text), output_chars=len(text))
+
+    def on_tool_error(self, error, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    # ---- 查詢摘要 ----
+    def _finish(self, root: Dict[str, Any]) -> None:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        llm_spans = [span for span in spans if span["kind"] == LLM]
+        tools: Dict[str, float] = {}
+        for span in spans:
+            if span["kind"] == TOOL:
+                tools[span["name"]] = tools.get(span["name"], 0.0) + span["duration_ms"]
+        # 最上層的模型呼叫與工具（工具內的 Pandas Agent 的呼叫已包含在外層工具的時間中），模型、工具與其他時間合計為總時間
+        top_llm = [span for span in llm_spans if not self._nested_in_tool(span, spans)]
+        nested_llm = [span for span in llm_spans if self._nested_in_tool(span, spans)]
+        top_tools = [span for span in spans if span["kind"] == TOOL and not self._nested_in_tool(span, spans)]
+        top_ms = sum(span["duration_ms"] for span in top_llm + top_tools)
+        self.summary = {
+            "trace_id": self.trace_id,
+            "question": self.question,
+            "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(root["start"])),
+            "duration_ms": root["duration_ms"],
+            "llm_ms": sum(span["duration_ms"] for span in top_llm),
+            "tool_ms": sum(span["duration_ms"] for span in top_tools),
+            # 模型與工具以外的時間：prompt 組裝、輸出解析、序列化與 callback
+            "other_ms": max(0.0, root["duration_ms"] - top_ms),
+            "llm_calls": len(top_llm),
+            "tool_calls": len(top_tools),
+            # 工具內（如 analyze_dataframe 的 Pandas Agent）的模型呼叫，時間已計入 tool_ms
+            "nested_llm_ms": sum(span["duration_ms"] for span in nested_llm),
+            "nested_llm_calls": len(nested_llm),
+            "prompt_tokens": sum(span.get("prompt_tokens", 0) for span in llm_spans),
+            "completion_tokens": sum(span.get("completion_tokens", 0) for span in llm_spans),
+            "cost_usd": sum(span.get("cost_usd", 0.0) for span in llm_spans),
+            "memory_peak_delta_mb": root["memory_peak_delta_mb"],
+            "tools": tools,
+            "error": root.get("error"),
+        }
+        self.summary["total_tokens"] = self.summary["prompt_tokens"] + self.summary["completion_tokens"]
+        if self.write:
+            _append_jsonl(TRACE_FILE, spans)
+            _append_jsonl(LEDGER_FILE, [self.summary])
+
+    @staticmethod
+    def _nested_in_tool(span: Dict[str, Any], spans: List[Dict[str, Any]]) -> bool:
+        by_id = {item["span_id"]: item for item in spans}
+        parent = by_id.get(span["parent_id"])
+        while parent is not None:
+            if parent["kind"] == TOOL:
+                return True
+            parent = by_id.get(parent["parent_id"])
+        return False
+
+    def result(self) -> Dict[str, Any]:
+        """附加到查詢回應的追蹤結果：{trace_id, summary, spans}（spans 依開始時間排序）"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        return {"trace_id": self.trace_id, "summary": self.summary, "spans": spans}